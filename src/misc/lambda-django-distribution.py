@@ -1,13 +1,109 @@
 #!/usr/bin/env python3
 
-from troposphere import Ref, Sub, GetAtt
+import collections
+
+from awacs import kinesis, s3, sts
+from awacs.aws import Allow, Condition, PolicyDocument, Principal, Statement, StringEquals
+from troposphere import Ref, Sub, GetAtt, Equals, If, Join, Not, NoValue, Select, Split
 from troposphere import Template, Parameter, Output
-from troposphere import cloudfront, route53
+from troposphere import cloudfront, cloudwatch, iam, kinesis as streams, route53, s3 as buckets, sns
 
 # Magic AWS number For CloudFront
 CLOUDFRONT_HOSTED_ZONE_ID = 'Z2FDTNDATAQYW2'
+ONE_DAY = 24 * 60 * 60  # seconds
+ONE_YEAR = 365 * ONE_DAY
+# Headers S3 needs to answer CORS requests, as in the managed CORS-S3Origin policy
+CORS_HEADERS = ['Origin', 'Access-Control-Request-Headers', 'Access-Control-Request-Method']
+# Sent to the application without splitting its cache, Origin and Referer for CSRF checks. Host
+# is left out, API Gateway and function URLs only answer to their own.
+APP_ORIGIN_HEADERS = ['Origin', 'Referer', 'CloudFront-Forwarded-Proto', 'CloudFront-Viewer-Address']
+# Alarms on the additional metrics, in the AWS/CloudFront namespace of us-east-1
+DISTRIBUTION_ALARMS = collections.OrderedDict([
+    ('CacheHitRate', ('LessThanThreshold', 80, 'percent')),
+    ('OriginLatency', ('GreaterThanThreshold', 1000, 'milliseconds')),
+    ('5xxErrorRate', ('GreaterThanThreshold', 1, 'percent')),
+])
+# Real-time log fields telling how requests were served and how long the origin took
+REALTIME_LOG_FIELDS = [
+    'timestamp', 'c-ip', 'cs-method', 'cs-uri-stem', 'sc-status', 'time-taken', 'time-to-first-byte',
+    'x-edge-location', 'x-edge-result-type', 'x-edge-response-result-type', 'origin-fbl', 'origin-lbl',
+]
+# Regions with an Origin Shield, pick the one closest to the bucket
+ORIGIN_SHIELD_REGIONS = [
+    'us-east-1', 'us-east-2', 'us-west-2', 'ap-south-1', 'ap-northeast-1', 'ap-northeast-2',
+    'ap-southeast-1', 'ap-southeast-2', 'eu-central-1', 'eu-west-1', 'eu-west-2', 'sa-east-1',
+]
+
+
+def assets_cache_policy_config(name, min_ttl, default_ttl, max_ttl):
+    """Cache key of content that is the same for every viewer, compressed with Gzip or Brotli."""
+    return cloudfront.CachePolicyConfig(
+        Name=name,
+        MinTTL=min_ttl,
+        DefaultTTL=default_ttl,
+        MaxTTL=max_ttl,
+        ParametersInCacheKeyAndForwardedToOrigin=cloudfront.ParametersInCacheKeyAndForwardedToOrigin(
+            CookiesConfig=cloudfront.CacheCookiesConfig(CookieBehavior='none'),
+            EnableAcceptEncodingBrotli=True,
+            EnableAcceptEncodingGzip=True,
+            HeadersConfig=cloudfront.CacheHeadersConfig(HeaderBehavior='none'),
+            QueryStringsConfig=cloudfront.CacheQueryStringsConfig(QueryStringBehavior='none'),
+        )
+    )
+
 
-template = Template("""
+def assets_origin(template, origin_id, domain, path, shield_region, access_control=None):
+    """
+    Return the origin of a bucket, through Origin Shield in shield_region
+    unless it is blank. With access_control, CloudFront signs its requests to
+    the bucket with that Origin Access Control, otherwise it fetches over HTTPS
+    like from any web server.
+    """
+    shield = template.add_condition(
+        '{}Enabled'.format(shield_region.title), Not(Equals(Ref(shield_region), '')))
+    origin = dict(
+        Id=origin_id,
+        DomainName=Ref(domain),
+        OriginPath=Ref(path),
+        OriginShield=If(shield, cloudfront.OriginShield(Enabled=True, OriginShieldRegion=Ref(shield_region)), NoValue),
+    )
+    if access_control is None:
+        origin['CustomOriginConfig'] = cloudfront.CustomOriginConfig(OriginProtocolPolicy='https-only')
+    else:
+        origin['OriginAccessControlId'] = GetAtt(access_control, 'Id')
+        origin['S3OriginConfig'] = cloudfront.S3OriginConfig(OriginAccessIdentity='')
+    return cloudfront.Origin(**origin)
+
+
+def build(config=None):
+    config = config or {}
+
+    # region Configurable
+    # Fetch from the buckets as S3 origins signed with Origin Access Control,
+    # so they need not be public. Adds a bucket policy to each, replacing any
+    # policy they already have; StaticDomain and MediaDomain must then be REST
+    # endpoints such as <bucket>.s3.<region>.amazonaws.com, not website ones.
+    s3_origins = config.get('s3_origins', False)
+    # Serve the application through the distribution from an API Gateway stage
+    # or a Lambda function URL as the default behavior. Only pages the application
+    # marks cacheable, e.g. Cache-Control: public, s-maxage=10 on anonymous pages,
+    # are cached: AppTTL defaults to 0 because the session cookie is part of the
+    # cache key, a page without Cache-Control would otherwise be cached for each
+    # signed in user. Static assets are then only served under StaticPattern.
+    app_origin = config.get('app_origin', False)
+    # Standard access logs delivered to a bucket created for them.
+    access_logs = config.get('access_logs', False)
+    # Real-time logs of the fields picked sent to a Kinesis stream, for a sample of requests.
+    realtime_logs = config.get('realtime_logs', False)
+    realtime_log_fields = config.get('realtime_log_fields', REALTIME_LOG_FIELDS)
+    # Additional CloudFront metrics, such as CacheHitRate and OriginLatency, which
+    # the alarms need. Alarms are emailed to Email and, like the metrics, only
+    # exist in us-east-1, a template rule rejects stacks in other regions.
+    additional_metrics = config.get('additional_metrics', False)
+    alarms = config.get('alarms', False)
+    # endregion
+
+    template = Template("""
 Creates the resources needed for distribution of a lambda powered django application.  
 
 It assumes there's separate bucket for static and media assets. Always forward http to https.
@@ -18,212 +114,689 @@ Template: lambda-django-distribution.
 Author: Carlos Avila <cavila@mandelbrew.com>.
 """)
 
-# region Parameters
-email = template.add_parameter(Parameter(
-    'Email',
-    Default='administrator@example.com',
-    Description='Email address used for notifications',
-    Type='String'
-))
-
-hosted_zone_id = template.add_parameter(Parameter(
-    'HostedZoneId',
-    Description='Hosted zone used for the CDN domain name.',
-    Type='AWS::Route53::HostedZone::Id'
-))
-
-domain = template.add_parameter(Parameter(
-    'Domain',
-    Default='cdn.example.com',
-    Description='CNAME for the distribution.',
-    Type='String',
-))
-
-certificate = template.add_parameter(Parameter(
-    'Certificate',
-    Description='ARN of the ACM certificate used for Cloudfront\'s SSL',
-    Type='String'
-))
-
-static_domain = template.add_parameter(Parameter(
-    'StaticDomain',
-    Default='myapp-static-assets.s3.amazonaws.com',
-    Description='S3 bucket storing static assets',
-    Type='String'
-))
-
-static_path = template.add_parameter(Parameter(
-    'StaticPath',
-    Default='',
-    Description='If you want CloudFront to request your content from a directory, enter the directory name here, '
-                'beginning with a /. Do not include a / at the end of the directory name.',
-    Type='String'
-))
-
-media_domain = template.add_parameter(Parameter(
-    'MediaDomain',
-    Default='myapp-media-assets.s3.amazonaws.com',
-    Description='S3 bucket storing media assets',
-    Type='String'
-))
-
-media_path = template.add_parameter(Parameter(
-    'MediaPath',
-    Default='',
-    Description='If you want CloudFront to request your content from a directory, enter the directory name here, '
-                'beginning with a /. Do not include a / at the end of the directory name.',
-    Type='String'
-))
-
-media_pattern = template.add_parameter(Parameter(
-    'MediaPattern',
-    Default='/media/*',
-    Description='Specify which requests you want to route to the origin.',
-    Type='String'
-))
-# endregion
-
-# region Resources
-distribution = template.add_resource(cloudfront.Distribution(
-    'Distribution',
-    DistributionConfig=cloudfront.DistributionConfig(
-        Aliases=[Ref(domain)],
-        CacheBehaviors=[
-            cloudfront.CacheBehavior(
-                Compress=True,
-                ForwardedValues=cloudfront.ForwardedValues(
-                    Cookies=cloudfront.Cookies(Forward='none'),
-                    QueryString=False,
+    # region Parameters
+    email = template.add_parameter(Parameter(
+        'Email',
+        Default='administrator@example.com',
+        Description='Email address used for notifications',
+        Type='String'
+    ))
+
+    hosted_zone_id = template.add_parameter(Parameter(
+        'HostedZoneId',
+        Description='Hosted zone used for the CDN domain name.',
+        Type='AWS::Route53::HostedZone::Id'
+    ))
+
+    domain = template.add_parameter(Parameter(
+        'Domain',
+        Default='cdn.example.com',
+        Description='CNAME for the distribution.',
+        Type='String',
+    ))
+
+    certificate = template.add_parameter(Parameter(
+        'Certificate',
+        Description='ARN of the ACM certificate used for Cloudfront\'s SSL',
+        Type='String'
+    ))
+
+    price_class = template.add_parameter(Parameter(
+        'PriceClass',
+        Default='PriceClass_100',
+        AllowedValues=['PriceClass_100', 'PriceClass_200', 'PriceClass_All'],
+        Description='Edge locations serving the distribution, PriceClass_100 is North America and Europe only, '
+                    'PriceClass_200 adds most of Asia, Africa and the Middle East, PriceClass_All every location.',
+        Type='String'
+    ))
+
+    http_version = template.add_parameter(Parameter(
+        'HttpVersion',
+        Default='http2and3',
+        AllowedValues=['http1.1', 'http2', 'http3', 'http2and3'],
+        Description='HTTP versions viewers may use besides HTTP/1.1, http2and3 for both HTTP/2 and HTTP/3.',
+        Type='String'
+    ))
+
+    ipv6 = template.add_parameter(Parameter(
+        'IPv6',
+        Default='true',
+        AllowedValues=['true', 'false'],
+        Description='Serve IPv6 viewers too, with an AAAA alias record next to the A one.',
+        Type='String'
+    ))
+
+    static_domain = template.add_parameter(Parameter(
+        'StaticDomain',
+        Default='myapp-static-assets.s3.amazonaws.com',
+        Description='S3 bucket storing static assets',
+        Type='String'
+    ))
+
+    static_path = template.add_parameter(Parameter(
+        'StaticPath',
+        Default='',
+        Description='If you want CloudFront to request your content from a directory, enter the directory name here, '
+                    'beginning with a /. Do not include a / at the end of the directory name.',
+        Type='String'
+    ))
+
+    media_domain = template.add_parameter(Parameter(
+        'MediaDomain',
+        Default='myapp-media-assets.s3.amazonaws.com',
+        Description='S3 bucket storing media assets',
+        Type='String'
+    ))
+
+    media_path = template.add_parameter(Parameter(
+        'MediaPath',
+        Default='',
+        Description='If you want CloudFront to request your content from a directory, enter the directory name here, '
+                    'beginning with a /. Do not include a / at the end of the directory name.',
+        Type='String'
+    ))
+
+    media_origin_shield = template.add_parameter(Parameter(
+        'MediaOriginShield',
+        Default='',
+        AllowedValues=[''] + ORIGIN_SHIELD_REGIONS,
+        Description='Origin Shield region caching media for every edge location, blank to disable.',
+        Type='String'
+    ))
+
+    media_pattern = template.add_parameter(Parameter(
+        'MediaPattern',
+        Default='/media/*',
+        Description='Specify which requests you want to route to the origin.',
+        Type='String'
+    ))
+
+    static_origin_shield = template.add_parameter(Parameter(
+        'StaticOriginShield',
+        Default='',
+        AllowedValues=[''] + ORIGIN_SHIELD_REGIONS,
+        Description='Origin Shield region caching static assets for every edge location, blank to disable.',
+        Type='String'
+    ))
+
+    static_pattern = template.add_parameter(Parameter(
+        'StaticPattern',
+        Default='/static/*',
+        Description='Requests for fingerprinted static assets, e.g. from ManifestStaticFilesStorage, cached for '
+                    'StaticTTL.',
+        Type='String'
+    ))
+
+    static_ttl = template.add_parameter(Parameter(
+        'StaticTTL',
+        Default=ONE_YEAR,
+        Description='Seconds fingerprinted static assets stay cached, whatever their Cache-Control.',
+        MinValue=0,
+        Type='Number'
+    ))
+
+    min_ttl = template.add_parameter(Parameter(
+        'MinTTL',
+        Default=0,
+        Description='Minimum seconds objects stay cached, overrides shorter Cache-Control max-age.',
+        MinValue=0,
+        Type='Number'
+    ))
+
+    default_ttl = template.add_parameter(Parameter(
+        'DefaultTTL',
+        Default=ONE_DAY,
+        Description='Seconds objects without Cache-Control or Expires stay cached.',
+        MinValue=0,
+        Type='Number'
+    ))
+
+    max_ttl = template.add_parameter(Parameter(
+        'MaxTTL',
+        Default=ONE_YEAR,
+        Description='Maximum seconds objects stay cached, overrides longer Cache-Control max-age.',
+        MinValue=0,
+        Type='Number'
+    ))
+    # endregion
+
+    # region Parameters - Application
+    app_labels = {}
+    if app_origin:
+        app_domain = template.add_parameter(Parameter(
+            'AppDomain',
+            Default='abcdef1234.execute-api.us-east-1.amazonaws.com',
+            Description='API Gateway or Lambda function URL domain serving the django application',
+            Type='String'
+        ))
+
+        app_path = template.add_parameter(Parameter(
+            'AppPath',
+            Default='',
+            Description='API Gateway stage, beginning with a /, e.g. /prod. Blank for function URLs.',
+            Type='String'
+        ))
+
+        app_headers = template.add_parameter(Parameter(
+            'AppHeaders',
+            Default='Accept-Language',
+            Description='Comma separated headers the pages vary on, forwarded and part of the cache key. '
+                        'Blank for none.',
+            Type='CommaDelimitedList'
+        ))
+
+        app_cookies = template.add_parameter(Parameter(
+            'AppCookies',
+            Default='csrftoken,sessionid',
+            Description='Comma separated cookies forwarded and part of the cache key, so signed in users never '
+                        'share cached pages. Blank for none.',
+            Type='CommaDelimitedList'
+        ))
+
+        app_query_strings = template.add_parameter(Parameter(
+            'AppQueryStrings',
+            Default='next,page,q',
+            Description='Comma separated query string parameters forwarded and part of the cache key. '
+                        'Blank for none.',
+            Type='CommaDelimitedList'
+        ))
+
+        app_ttl = template.add_parameter(Parameter(
+            'AppTTL',
+            Default=0,
+            Description='Seconds pages without Cache-Control stay cached, 0 to only cache pages sent with '
+                        'Cache-Control public, s-maxage. Pages sent with Cache-Control private or no-store are '
+                        'never cached.',
+            MinValue=0,
+            Type='Number'
+        ))
+
+        app_labels = {
+            app_domain.title: {'default': 'Application Domain Name'},
+            app_path.title: {'default': 'Application Path'},
+            app_headers.title: {'default': 'Headers'},
+            app_cookies.title: {'default': 'Cookies'},
+            app_query_strings.title: {'default': 'Query Strings'},
+            app_ttl.title: {'default': 'Page TTL'},
+        }
+    # endregion
+
+    # region Parameters - Logging and Monitoring
+    observability_labels = {}
+    if access_logs:
+        access_log_prefix = template.add_parameter(Parameter(
+            'AccessLogPrefix',
+            Default='cloudfront/',
+            Description='Prefix of the access log files in the log bucket.',
+            Type='String'
+        ))
+
+        access_log_retention = template.add_parameter(Parameter(
+            'AccessLogRetention',
+            Default=90,
+            Description='Days access log files are kept.',
+            MinValue=1,
+            Type='Number'
+        ))
+
+        observability_labels.update({
+            access_log_prefix.title: {'default': 'Access Log Prefix'},
+            access_log_retention.title: {'default': 'Access Log Retention'},
+        })
+
+    if realtime_logs:
+        realtime_log_sampling_rate = template.add_parameter(Parameter(
+            'RealtimeLogSamplingRate',
+            Default=100,
+            Description='Percentage of requests sent to the real-time log stream.',
+            MinValue=1,
+            MaxValue=100,
+            Type='Number'
+        ))
+
+        observability_labels[realtime_log_sampling_rate.title] = {'default': 'Real-time Log Sampling Rate'}
+
+    alarm_thresholds = {}
+    if alarms:
+        for metric, (_, threshold, unit) in DISTRIBUTION_ALARMS.items():
+            alarm_thresholds[metric] = template.add_parameter(Parameter(
+                'Distribution{}Threshold'.format(metric),
+                Type='Number',
+                Description='{} alarm threshold in {}'.format(metric, unit),
+                Default=threshold
+            ))
+            observability_labels[alarm_thresholds[metric].title] = {'default': '{} Threshold'.format(metric)}
+    # endregion
+
+    # region Resources
+    static_origin_id = Sub('${domain}${path}', **{
+        'domain': Ref(static_domain),
+        'path': Ref(static_path)
+    })
+    media_origin_id = Sub('${domain}${path}', **{
+        'domain': Ref(media_domain),
+        'path': Ref(media_path)
+    })
+
+    # Cookies, headers and query strings do not change assets, so none of them splits the cache
+    assets_cache_policy = template.add_resource(cloudfront.CachePolicy(
+        'AssetsCachePolicy',
+        CachePolicyConfig=assets_cache_policy_config(
+            Sub('${AWS::StackName}-assets'), Ref(min_ttl), Ref(default_ttl), Ref(max_ttl))
+    ))
+
+    static_cache_policy = template.add_resource(cloudfront.CachePolicy(
+        'StaticCachePolicy',
+        CachePolicyConfig=assets_cache_policy_config(
+            Sub('${AWS::StackName}-static'), Ref(static_ttl), Ref(static_ttl), Ref(static_ttl))
+    ))
+
+    assets_origin_request_policy = template.add_resource(cloudfront.OriginRequestPolicy(
+        'AssetsOriginRequestPolicy',
+        OriginRequestPolicyConfig=cloudfront.OriginRequestPolicyConfig(
+            Name=Sub('${AWS::StackName}-assets'),
+            CookiesConfig=cloudfront.OriginRequestCookiesConfig(CookieBehavior='none'),
+            HeadersConfig=cloudfront.OriginRequestHeadersConfig(
+                HeaderBehavior='whitelist',
+                Headers=CORS_HEADERS,
+            ),
+            QueryStringsConfig=cloudfront.OriginRequestQueryStringsConfig(QueryStringBehavior='none'),
+        )
+    ))
+
+    access_control = None
+    if s3_origins:
+        access_control = template.add_resource(cloudfront.OriginAccessControl(
+            'AssetsOriginAccessControl',
+            OriginAccessControlConfig=cloudfront.OriginAccessControlConfig(
+                Name=Sub('${AWS::StackName}-assets'),
+                OriginAccessControlOriginType='s3',
+                SigningBehavior='always',
+                SigningProtocol='sigv4',
+            )
+        ))
+
+    behavior_logging = {}
+    if realtime_logs:
+        realtime_log_stream = template.add_resource(streams.Stream(
+            'RealtimeLogStream',
+            StreamModeDetails=streams.StreamModeDetails(StreamMode='ON_DEMAND'),
+        ))
+
+        realtime_log_role = template.add_resource(iam.Role(
+            'RealtimeLogRole',
+            AssumeRolePolicyDocument=PolicyDocument(Version='2012-10-17', Statement=[Statement(
+                Effect=Allow,
+                Principal=Principal('Service', 'cloudfront.amazonaws.com'),
+                Action=[sts.AssumeRole],
+            )]),
+            Policies=[iam.Policy(
+                PolicyName='RealtimeLogStream',
+                PolicyDocument=PolicyDocument(Version='2012-10-17', Statement=[Statement(
+                    Effect=Allow,
+                    Action=[kinesis.DescribeStreamSummary, kinesis.DescribeStream, kinesis.PutRecord,
+                            kinesis.PutRecords],
+                    Resource=[GetAtt(realtime_log_stream, 'Arn')],
+                )]),
+            )],
+        ))
+
+        realtime_log_config = template.add_resource(cloudfront.RealtimeLogConfig(
+            'RealtimeLogConfig',
+            EndPoints=[cloudfront.EndPoint(
+                KinesisStreamConfig=cloudfront.KinesisStreamConfig(
+                    RoleArn=GetAtt(realtime_log_role, 'Arn'),
+                    StreamArn=GetAtt(realtime_log_stream, 'Arn'),
+                ),
+                StreamType='Kinesis',
+            )],
+            Fields=realtime_log_fields,
+            Name=Sub('${AWS::StackName}'),
+            SamplingRate=Ref(realtime_log_sampling_rate),
+        ))
+        behavior_logging['RealtimeLogConfigArn'] = Ref(realtime_log_config)
+
+    distribution_logging = {}
+    if access_logs:
+        # Log delivery writes through ACLs, so the bucket keeps them enabled
+        access_log_bucket = template.add_resource(buckets.Bucket(
+            'AccessLogBucket',
+            DeletionPolicy='Retain',
+            LifecycleConfiguration=buckets.LifecycleConfiguration(Rules=[buckets.LifecycleRule(
+                ExpirationInDays=Ref(access_log_retention),
+                Status='Enabled',
+            )]),
+            OwnershipControls=buckets.OwnershipControls(Rules=[buckets.OwnershipControlsRule(
+                ObjectOwnership='BucketOwnerPreferred',
+            )]),
+            PublicAccessBlockConfiguration=buckets.PublicAccessBlockConfiguration(
+                BlockPublicAcls=True,
+                BlockPublicPolicy=True,
+                IgnorePublicAcls=True,
+                RestrictPublicBuckets=True,
+            ),
+        ))
+        distribution_logging['Logging'] = cloudfront.Logging(
+            Bucket=GetAtt(access_log_bucket, 'DomainName'),
+            IncludeCookies=False,
+            Prefix=Ref(access_log_prefix),
+        )
+
+    default_cache_behavior = cloudfront.DefaultCacheBehavior(
+        **behavior_logging,
+        CachePolicyId=Ref(assets_cache_policy),
+        Compress=True,
+        OriginRequestPolicyId=Ref(assets_origin_request_policy),
+        TargetOriginId=static_origin_id,
+        ViewerProtocolPolicy='redirect-to-https',
+    )
+    app_origins = []
+    if app_origin:
+        app_origin_id = Sub('${domain}${path}', **{
+            'domain': Ref(app_domain),
+            'path': Ref(app_path)
+        })
+        for parameter in (app_headers, app_cookies, app_query_strings):
+            template.add_condition('{}Whitelisted'.format(parameter.title), Not(Equals(Join('', Ref(parameter)), '')))
+
+        # Micro-cache, anonymous pages sent with s-maxage are answered at the edge for a few seconds
+        app_cache_policy = template.add_resource(cloudfront.CachePolicy(
+            'AppCachePolicy',
+            CachePolicyConfig=cloudfront.CachePolicyConfig(
+                Name=Sub('${AWS::StackName}-app'),
+                MinTTL=0,
+                DefaultTTL=Ref(app_ttl),
+                MaxTTL=Ref(max_ttl),
+                ParametersInCacheKeyAndForwardedToOrigin=cloudfront.ParametersInCacheKeyAndForwardedToOrigin(
+                    CookiesConfig=cloudfront.CacheCookiesConfig(
+                        CookieBehavior=If('AppCookiesWhitelisted', 'whitelist', 'none'),
+                        Cookies=If('AppCookiesWhitelisted', Ref(app_cookies), NoValue),
+                    ),
+                    EnableAcceptEncodingBrotli=True,
+                    EnableAcceptEncodingGzip=True,
+                    HeadersConfig=cloudfront.CacheHeadersConfig(
+                        HeaderBehavior=If('AppHeadersWhitelisted', 'whitelist', 'none'),
+                        Headers=If('AppHeadersWhitelisted', Ref(app_headers), NoValue),
+                    ),
+                    QueryStringsConfig=cloudfront.CacheQueryStringsConfig(
+                        QueryStringBehavior=If('AppQueryStringsWhitelisted', 'whitelist', 'none'),
+                        QueryStrings=If('AppQueryStringsWhitelisted', Ref(app_query_strings), NoValue),
+                    ),
+                )
+            )
+        ))
+
+        app_origin_request_policy = template.add_resource(cloudfront.OriginRequestPolicy(
+            'AppOriginRequestPolicy',
+            OriginRequestPolicyConfig=cloudfront.OriginRequestPolicyConfig(
+                Name=Sub('${AWS::StackName}-app'),
+                CookiesConfig=cloudfront.OriginRequestCookiesConfig(CookieBehavior='none'),
+                HeadersConfig=cloudfront.OriginRequestHeadersConfig(
+                    HeaderBehavior='whitelist',
+                    Headers=APP_ORIGIN_HEADERS,
                 ),
-                PathPattern=Ref(media_pattern),
-                TargetOriginId=Sub('${domain}${path}', **{
-                    'domain': Ref(media_domain),
-                    'path': Ref(media_path)
-                }),
-                ViewerProtocolPolicy='redirect-to-https',
+                QueryStringsConfig=cloudfront.OriginRequestQueryStringsConfig(QueryStringBehavior='none'),
             )
-        ],
-        Comment=Sub('${AWS::StackName}'),
-        DefaultCacheBehavior=cloudfront.DefaultCacheBehavior(
+        ))
+
+        default_cache_behavior = cloudfront.DefaultCacheBehavior(
+            **behavior_logging,
+            AllowedMethods=['GET', 'HEAD', 'OPTIONS', 'PUT', 'PATCH', 'POST', 'DELETE'],
+            CachedMethods=['GET', 'HEAD'],
+            CachePolicyId=Ref(app_cache_policy),
             Compress=True,
-            ForwardedValues=cloudfront.ForwardedValues(
-                Cookies=cloudfront.Cookies(Forward='none'),
-                QueryString=False,
-            ),
-            TargetOriginId=Sub('${domain}${path}', **{
-                'domain': Ref(static_domain),
-                'path': Ref(static_path)
-            }),
+            OriginRequestPolicyId=Ref(app_origin_request_policy),
+            TargetOriginId=app_origin_id,
             ViewerProtocolPolicy='redirect-to-https',
-        ),
-        Enabled=True,
-        Origins=[
-            cloudfront.Origin(
-                Id=Sub('${domain}${path}', **{
-                    'domain': Ref(static_domain),
-                    'path': Ref(static_path)
-                }),
-                DomainName=Ref(static_domain),
-                OriginPath=Ref(static_path),
-                CustomOriginConfig=cloudfront.CustomOrigin(
-                    OriginProtocolPolicy='https-only'
+        )
+        app_origins.append(cloudfront.Origin(
+            Id=app_origin_id,
+            DomainName=Ref(app_domain),
+            OriginPath=Ref(app_path),
+            CustomOriginConfig=cloudfront.CustomOriginConfig(
+                OriginProtocolPolicy='https-only',
+                OriginSSLProtocols=['TLSv1.2'],
+            ),
+        ))
+
+    ipv6_enabled = template.add_condition('IPv6Enabled', Equals(Ref(ipv6), 'true'))
+
+    distribution = template.add_resource(cloudfront.Distribution(
+        'Distribution',
+        DistributionConfig=cloudfront.DistributionConfig(
+            Aliases=[Ref(domain)],
+            CacheBehaviors=[
+                cloudfront.CacheBehavior(
+                    **behavior_logging,
+                    CachePolicyId=Ref(static_cache_policy),
+                    Compress=True,
+                    OriginRequestPolicyId=Ref(assets_origin_request_policy),
+                    PathPattern=Ref(static_pattern),
+                    TargetOriginId=static_origin_id,
+                    ViewerProtocolPolicy='redirect-to-https',
+                ),
+                cloudfront.CacheBehavior(
+                    **behavior_logging,
+                    CachePolicyId=Ref(assets_cache_policy),
+                    Compress=True,
+                    OriginRequestPolicyId=Ref(assets_origin_request_policy),
+                    PathPattern=Ref(media_pattern),
+                    TargetOriginId=media_origin_id,
+                    ViewerProtocolPolicy='redirect-to-https',
+                ),
+            ],
+            Comment=Sub('${AWS::StackName}'),
+            DefaultCacheBehavior=default_cache_behavior,
+            Enabled=True,
+            **distribution_logging,
+            Origins=[
+                assets_origin(template, static_origin_id, static_domain, static_path, static_origin_shield,
+                              access_control),
+                assets_origin(template, media_origin_id, media_domain, media_path, media_origin_shield,
+                              access_control),
+            ] + app_origins,
+            HttpVersion=Ref(http_version),
+            IPV6Enabled=If(ipv6_enabled, True, False),
+            PriceClass=Ref(price_class),
+            ViewerCertificate=cloudfront.ViewerCertificate(
+                AcmCertificateArn=Ref(certificate),
+                SslSupportMethod='sni-only',
+            )
+        )
+    ))
+
+    if s3_origins:
+        # Only this distribution may read the buckets
+        for title, domain_parameter in (('StaticBucketPolicy', static_domain), ('MediaBucketPolicy', media_domain)):
+            bucket = Select(0, Split('.s3.', Ref(domain_parameter)))
+            template.add_resource(buckets.BucketPolicy(
+                title,
+                Bucket=bucket,
+                PolicyDocument=PolicyDocument(Version='2012-10-17', Statement=[Statement(
+                    Effect=Allow,
+                    Principal=Principal('Service', 'cloudfront.amazonaws.com'),
+                    Action=[s3.GetObject],
+                    Resource=[Sub('arn:${AWS::Partition}:s3:::${bucket}/*', bucket=bucket)],
+                    Condition=Condition(StringEquals('AWS:SourceArn', Sub(
+                        'arn:${AWS::Partition}:cloudfront::${AWS::AccountId}:distribution/${distribution}',
+                        distribution=Ref(distribution)))),
+                )]),
+            ))
+
+    if additional_metrics or alarms:
+        template.add_rule('DistributionMonitoringRegion', {
+            'Assertions': [{
+                'Assert': Equals(Ref('AWS::Region'), 'us-east-1'),
+                'AssertDescription': 'CloudFront publishes its metrics to us-east-1, deploy the stack there',
+            }],
+        })
+        template.add_resource(cloudfront.MonitoringSubscription(
+            'MonitoringSubscription',
+            DistributionId=Ref(distribution),
+            MonitoringSubscription=cloudfront.MonitoringSubscriptionProperty(
+                RealtimeMetricsSubscriptionConfig=cloudfront.RealtimeMetricsSubscriptionConfig(
+                    RealtimeMetricsSubscriptionStatus='Enabled',
                 ),
             ),
-            cloudfront.Origin(
-                Id=Sub('${domain}${path}', **{
-                    'domain': Ref(media_domain),
-                    'path': Ref(media_path)
-                }),
-                DomainName=Ref(media_domain),
-                OriginPath=Ref(media_path),
-                CustomOriginConfig=cloudfront.CustomOrigin(
-                    OriginProtocolPolicy='https-only'
+        ))
+
+    if alarms:
+        notifications = template.add_resource(sns.Topic(
+            'DistributionNotifications',
+            Subscription=[
+                sns.Subscription(
+                    Endpoint=Ref(email),
+                    Protocol='email'
                 ),
+            ]
+        ))
+
+        for metric, (comparison, _, _) in DISTRIBUTION_ALARMS.items():
+            template.add_resource(cloudwatch.Alarm(
+                'Distribution{}Alarm'.format(metric),
+                AlarmActions=[Ref(notifications)],
+                AlarmDescription=Sub('{} of ${{{}}}'.format(metric, distribution.title)),
+                ComparisonOperator=comparison,
+                Dimensions=[
+                    cloudwatch.MetricDimension(Name='DistributionId', Value=Ref(distribution)),
+                    cloudwatch.MetricDimension(Name='Region', Value='Global'),
+                ],
+                EvaluationPeriods=5,
+                MetricName=metric,
+                Namespace='AWS/CloudFront',
+                OKActions=[Ref(notifications)],
+                Period=60,  # seconds
+                Statistic='Average',
+                Threshold=Ref(alarm_thresholds[metric]),
+                TreatMissingData='notBreaching',  # no requests, nothing to alarm on
+            ))
+
+    record_set_group = template.add_resource(route53.RecordSetGroup(
+        'RecordSetGroup',
+        HostedZoneId=Ref(hosted_zone_id),
+        RecordSets=[
+            route53.RecordSet(
+                Name=Ref(domain),
+                Type='A',
+                AliasTarget=route53.AliasTarget(
+                    HostedZoneId=CLOUDFRONT_HOSTED_ZONE_ID,
+                    DNSName=GetAtt(distribution, 'DomainName'),
+                )
             ),
-        ],
-        PriceClass='PriceClass_100',
-        ViewerCertificate=cloudfront.ViewerCertificate(
-            AcmCertificateArn=Ref(certificate),
-            SslSupportMethod='sni-only',
-        )
-    )
-))
-
-record_set_group = template.add_resource(route53.RecordSetGroup(
-    'RecordSetGroup',
-    HostedZoneId=Ref(hosted_zone_id),
-    RecordSets=[
-        route53.RecordSet(
-            Name=Ref(domain),
-            Type='A',
-            AliasTarget=route53.AliasTarget(
-                HostedZoneId=CLOUDFRONT_HOSTED_ZONE_ID,
-                DNSName=GetAtt(distribution, 'DomainName'),
-            )
-        ),
-    ]
-))
-# endregion
-
-# region Outputs
-template.add_output(Output(
-    'Distribution',
-    Value=Ref(distribution)
-))
-# endregion
-
-# region Metadata
-template.add_metadata({
-    'AWS::CloudFormation::Interface': {
-        'ParameterLabels': {
-            # Project
-            email.title: {'default': 'Notifications'},
-            # Django CDN
-            hosted_zone_id.title: {'default': 'Hosted Zone ID'},
-            domain.title: {'default': 'Domain'},
-            certificate.title: {'default': 'ACM certificate'},
-            # Static assets CDN
-            static_domain.title: {'default': 'Static Domain Name'},
-            static_path.title: {'default': 'Static Path'},
-            # Media assets CDN
-            media_domain.title: {'default': 'Media Domain Name'},
-            media_path.title: {'default': 'Media Path'},
-            media_pattern.title: {'default': 'Media Pattern'},
-        },
-        'ParameterGroups': [
-            {
-                'Label': {'default': 'Project'},
-                'Parameters': [
-                    email.title,
-                ]
-            },
-            {
-                'Label': {'default': 'Django CDN'},
-                'Parameters': [
-                    hosted_zone_id.title,
-                    domain.title,
-                    certificate.title,
-                ]
-            },
-            {
-                'Label': {'default': 'Static Assets CDN'},
-                'Parameters': [
-                    static_domain.title,
-                    static_path.title,
-                ]
-            },
-            {
-                'Label': {'default': 'Media Assets CDN'},
-                'Parameters': [
-                    media_domain.title,
-                    media_path.title,
-                    media_pattern.title,
-                ]
-            },
+            If(ipv6_enabled, route53.RecordSet(
+                Name=Ref(domain),
+                Type='AAAA',
+                AliasTarget=route53.AliasTarget(
+                    HostedZoneId=CLOUDFRONT_HOSTED_ZONE_ID,
+                    DNSName=GetAtt(distribution, 'DomainName'),
+                )
+            ), NoValue),
         ]
-    }
-})
-# endregion
+    ))
+    # endregion
+
+    # region Outputs
+    template.add_output(Output(
+        'Distribution',
+        Value=Ref(distribution)
+    ))
+    # endregion
+
+    # region Metadata
+    template.set_metadata({
+        'AWS::CloudFormation::Interface': {
+            'ParameterLabels': {
+                # Project
+                email.title: {'default': 'Notifications'},
+                # Django CDN
+                hosted_zone_id.title: {'default': 'Hosted Zone ID'},
+                domain.title: {'default': 'Domain'},
+                certificate.title: {'default': 'ACM certificate'},
+                price_class.title: {'default': 'Price Class'},
+                http_version.title: {'default': 'HTTP Version'},
+                ipv6.title: {'default': 'IPv6'},
+                # Static assets CDN
+                static_domain.title: {'default': 'Static Domain Name'},
+                static_path.title: {'default': 'Static Path'},
+                static_origin_shield.title: {'default': 'Static Origin Shield'},
+                static_pattern.title: {'default': 'Static Pattern'},
+                static_ttl.title: {'default': 'Static TTL'},
+                # Media assets CDN
+                media_domain.title: {'default': 'Media Domain Name'},
+                media_path.title: {'default': 'Media Path'},
+                media_origin_shield.title: {'default': 'Media Origin Shield'},
+                media_pattern.title: {'default': 'Media Pattern'},
+                # Caching
+                min_ttl.title: {'default': 'Minimum TTL'},
+                default_ttl.title: {'default': 'Default TTL'},
+                max_ttl.title: {'default': 'Maximum TTL'},
+                # Application
+                **app_labels,
+                # Logging and Monitoring
+                **observability_labels,
+            },
+            'ParameterGroups': [
+                {
+                    'Label': {'default': 'Project'},
+                    'Parameters': [
+                        email.title,
+                    ]
+                },
+                {
+                    'Label': {'default': 'Django CDN'},
+                    'Parameters': [
+                        hosted_zone_id.title,
+                        domain.title,
+                        certificate.title,
+                        price_class.title,
+                        http_version.title,
+                        ipv6.title,
+                    ]
+                },
+                {
+                    'Label': {'default': 'Static Assets CDN'},
+                    'Parameters': [
+                        static_domain.title,
+                        static_path.title,
+                        static_origin_shield.title,
+                        static_pattern.title,
+                        static_ttl.title,
+                    ]
+                },
+                {
+                    'Label': {'default': 'Media Assets CDN'},
+                    'Parameters': [
+                        media_domain.title,
+                        media_path.title,
+                        media_origin_shield.title,
+                        media_pattern.title,
+                    ]
+                },
+                {
+                    'Label': {'default': 'Caching'},
+                    'Parameters': [
+                        min_ttl.title,
+                        default_ttl.title,
+                        max_ttl.title,
+                    ]
+                },
+            ] + ([
+                {
+                    'Label': {'default': 'Application'},
+                    'Parameters': list(app_labels)
+                },
+            ] if app_origin else []) + ([
+                {
+                    'Label': {'default': 'Logging and Monitoring'},
+                    'Parameters': list(observability_labels)
+                },
+            ] if observability_labels else [])
+        }
+    })
+    # endregion
+
+    return template
+
 
 if __name__ == '__main__':
-    print(template.to_json())
+    print(build().to_json())
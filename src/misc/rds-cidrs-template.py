@@ -1,172 +1,198 @@
 #!/usr/bin/env python3
 
-from troposphere import Ref, Sub, Template, Parameter, rds, ec2
-
-# region Configurable
-# get_region_cidr_blocks in the tools folder can help configure this script.
-region_cidrs = []
-
-# endregion
-
-template = Template("""
-Template: rds-template
+from troposphere import GetAtt, Ref, Sub, Template, Parameter, ec2
+
+import rds_common
+
+
+def build(config=None):
+    config = config or {}
+
+    # region Configurable
+    # get_region_cidr_blocks in the tools folder can help configure this script,
+    # use --aggregate to get the fewest rules and --ipv6 for IPv6 blocks.
+    region_cidrs = config.get('region_cidrs', [])
+    # Or read them at build time from a get_region_cidr_blocks --batch file,
+    # render_matrix sets region to build one variant per region.
+    region_cidrs_file = config.get('region_cidrs_file')
+    region_services = config.get('region_services', ['EC2'])
+    region_cidr_families = config.get('region_cidr_families', ['ipv4'])
+    if region_cidrs_file and not region_cidrs:
+        if not config.get('region'):
+            raise ValueError('region_cidrs_file needs a region to read')
+        region_cidrs = rds_common.load_region_cidrs(
+            region_cidrs_file, config['region'], region_services, region_cidr_families)
+    # 'groups' packs the region rules into as many security groups as needed,
+    # 'prefix-list' puts them in one managed prefix list per address family,
+    # 'rules' makes every rule a resource with an ID derived from its CIDR, so
+    # ip-ranges updates only add and delete the rules that changed. It takes two
+    # resources per block, aggregate them to stay under the resource limit.
+    region_rule_mode = config.get('region_rule_mode', 'groups')
+    # 'rules' mode only, pin the number of groups so blocks never move between
+    # them; by default the fewest that fit are used.
+    region_group_count = config.get('region_group_count')
+    # Account quotas, only needed when they were raised from the defaults.
+    rules_per_group = config.get('rules_per_group', rds_common.RULES_PER_GROUP)
+    groups_per_interface = config.get('groups_per_interface', rds_common.GROUPS_PER_INTERFACE)
+    # proxy, read_replicas, performance_insights, enhanced_monitoring, alarms,
+    # tuning, aurora and reader_autoscaling, see rds_common.database_options.
+    options = rds_common.database_options(config)
+
+    # endregion
+
+    template = Template("""
+Template: rds-cidrs-template
 Author: Carlos Avila <cavila@mandelbrew.com>
 """)
 
-vpc = template.add_parameter(Parameter(
-    'Vpc',
-    Type='AWS::EC2::VPC::Id',
-    Description='VPC for the security group',
-))
-
-allow_cidr = template.add_parameter(Parameter(
-    'AllowCidr',
-    Type='String',
-    Description='Allows connections to and from the provided CIDR block',
-    Default='173.244.44.0/24'
-))
-
-# region Parameters - Database
-database_master_username = template.add_parameter(Parameter(
-    'DatabaseMasterUsername',
-    Type='String',
-))
-
-database_master_password = template.add_parameter(Parameter(
-    'DatabaseMasterPassword',
-    Type='String',
-    NoEcho=True
-))
-
-database_instance_class = template.add_parameter(Parameter(
-    'DatabaseInstanceType',
-    Type='String',
-    Default='db.t2.micro',
-    AllowedValues=[
-        'db.t1.micro',
-        'db.t2.micro', 'db.t2.small', 'db.t2.medium', 'db.t2.large',
-        'db.m1.small', 'db.m1.medium', 'db.m1.large', 'db.m1.xlarge',
-        'db.m2.xlarge', 'db.m2.2xlarge', 'db.m2.4xlarge',
-        'db.m3.medium', 'db.m3.large', 'db.m3.xlarge', 'db.m3.2xlarge',
-        'db.m4.large', 'db.m4.xlarge', 'db.m4.2xlarge', 'db.m4.4xlarge', 'db.m4.10xlarge',
-        'db.r3.large', 'db.r3.xlarge', 'db.r3.2xlarge', 'db.r3.4xlarge', 'db.r3.8xlarge',
-    ]
-))
-
-database_engine = template.add_parameter(Parameter(
-    'DatabaseEngine',
-    Type='String',
-    Description='The name of the database engine to be used',
-    Default='postgres',
-    AllowedValues=['aurora',
-                   'mariadb',
-                   'mysql',
-                   'oracle-ee',
-                   'oracle-se2',
-                   'oracle-se1',
-                   'oracle-se',
-                   'postgres',
-                   'sqlserver-ee',
-                   'sqlserver-se',
-                   'sqlserver-ex',
-                   'sqlserver-web', ]
-))
-# endregion
-
-# region RDS
-
-region_rules = []
-
-for cidr in region_cidrs:
-    region_rules.append(
-        ec2.SecurityGroupRule(
-            CidrIp=cidr,
-            FromPort=ec2.network_port(5432),
-            IpProtocol='tcp',
-            ToPort=ec2.network_port(5432),
-        )
+    vpc = template.add_parameter(Parameter(
+        'Vpc',
+        Type='AWS::EC2::VPC::Id',
+        Description='VPC for the security group',
+    ))
+
+    allow_cidr = template.add_parameter(Parameter(
+        'AllowCidr',
+        Type='String',
+        Description='Allows connections to and from the provided CIDR block',
+        Default='173.244.44.0/24'
+    ))
+
+    # region Parameters - Database
+    service = rds_common.add_database_service_parameters(template, options)
+    # endregion
+
+    # region RDS
+    region_sec_groups = []
+
+    if region_rule_mode == 'prefix-list':
+        region_ingress, region_egress = [], []
+        for family, cidrs in (('IPv4', [c for c in region_cidrs if not rds_common.is_ipv6(c)]),
+                              ('IPv6', [c for c in region_cidrs if rds_common.is_ipv6(c)])):
+            if not cidrs:
+                continue
+            # References count as MaxEntries rules against the group's quota
+            if len(cidrs) > min(rules_per_group, rds_common.PREFIX_LIST_MAX_ENTRIES):
+                raise ValueError('{} {} region CIDRs do not fit in a prefix list referenced by a group of {} '
+                                 'rules, raise rules_per_group or aggregate them'.format(
+                                     len(cidrs), family, rules_per_group))
+            prefix_list = template.add_resource(ec2.PrefixList(
+                'Region{}PrefixList'.format(family),
+                AddressFamily=family,
+                Entries=[ec2.Entry(Cidr=cidr) for cidr in cidrs],
+                MaxEntries=len(cidrs),
+                PrefixListName=Sub('${AWS::StackName}-region-' + family.lower()),
+            ))
+            ingress, egress = rds_common.database_prefix_list_rules(prefix_list)
+            region_ingress.append(ingress)
+            region_egress.append(egress)
+
+        region_sec_groups.append(template.add_resource(ec2.SecurityGroup(
+            'RegionSecurityGroup',
+            GroupDescription=Sub('Region rules'),
+            SecurityGroupIngress=region_ingress,
+            SecurityGroupEgress=region_egress,
+            VpcId=Ref(vpc)
+        )))
+    elif region_rule_mode == 'groups':
+        for index, cidrs in enumerate(rds_common.shard_cidrs(region_cidrs, rules_per_group), 1):
+            region_rules = rds_common.region_rules(cidrs)
+            suffix = '' if index == 1 else str(index)
+            region_sec_groups.append(template.add_resource(ec2.SecurityGroup(
+                'RegionSecurityGroup' + suffix,
+                GroupDescription=Sub(('Region rules ' + suffix).strip()),
+                SecurityGroupIngress=region_rules,
+                SecurityGroupEgress=region_rules,
+                VpcId=Ref(vpc)
+            )))
+    elif region_rule_mode == 'rules':
+        buckets = rds_common.bucket_cidrs(region_cidrs, rules_per_group, region_group_count)
+        for index, cidrs in enumerate(buckets, 1):
+            suffix = '' if index == 1 else str(index)
+            region_sec_group = template.add_resource(ec2.SecurityGroup(
+                'RegionSecurityGroup' + suffix,
+                GroupDescription=Sub(('Region rules ' + suffix).strip()),
+                SecurityGroupEgress=[rds_common.loopback_egress_rule()],
+                VpcId=Ref(vpc)
+            ))
+            region_sec_groups.append(region_sec_group)
+            for cidr in cidrs:
+                rule = rds_common.database_rule(cidr).to_dict()
+                digest = rds_common.rule_digest(cidr)
+                template.add_resource(ec2.SecurityGroupIngress(
+                    'RegionIngress' + digest, GroupId=GetAtt(region_sec_group, 'GroupId'), **rule))
+                template.add_resource(ec2.SecurityGroupEgress(
+                    'RegionEgress' + digest, GroupId=GetAtt(region_sec_group, 'GroupId'), **rule))
+    else:
+        raise ValueError('unknown region_rule_mode {!r}, expected groups, prefix-list or rules'.format(
+            region_rule_mode))
+
+    # DefaultSecurityGroup takes one of the groups allowed per network interface
+    if len(region_sec_groups) + 1 > groups_per_interface:
+        raise ValueError('{} region CIDRs need {} security groups, only {} fit on a network interface next to '
+                         'DefaultSecurityGroup; aggregate them, use the prefix-list mode or raise '
+                         'groups_per_interface'.format(len(region_cidrs), len(region_sec_groups),
+                                                       groups_per_interface - 1))
+
+    default_sec_group = template.add_resource(ec2.SecurityGroup(
+        'DefaultSecurityGroup',
+        GroupDescription=Sub('Default rules'),
+        SecurityGroupIngress=[rds_common.database_rule(Ref(allow_cidr))],
+        SecurityGroupEgress=[rds_common.database_rule(Ref(allow_cidr))],
+        VpcId=Ref(vpc)
+    ))
+
+    cluster = rds_common.add_database_cluster(
+        template, service.database, service.aurora,
+        VpcSecurityGroupIds=[Ref(default_sec_group)] + [Ref(group) for group in region_sec_groups]
     )
 
-region_sec_group = template.add_resource(ec2.SecurityGroup(
-    'RegionSecurityGroup',
-    GroupDescription=Sub('Region rules'),
-    SecurityGroupIngress=region_rules,
-    SecurityGroupEgress=region_rules,
-    VpcId=Ref(vpc)
-))
-
-default_sec_group = template.add_resource(ec2.SecurityGroup(
-    'DefaultSecurityGroup',
-    GroupDescription=Sub('Default rules'),
-    SecurityGroupIngress=[
-        ec2.SecurityGroupRule(
-            CidrIp=Ref(allow_cidr),
-            FromPort=ec2.network_port(5432),
-            IpProtocol='tcp',
-            ToPort=ec2.network_port(5432),
-        )
-    ],
-    SecurityGroupEgress=[
-        ec2.SecurityGroupRule(
-            CidrIp=Ref(allow_cidr),
-            FromPort=ec2.network_port(5432),
-            IpProtocol='tcp',
-            ToPort=ec2.network_port(5432),
-        )
-    ],
-    VpcId=Ref(vpc)
-))
-
-database = template.add_resource(rds.DBInstance(
-    'Database',
-    AllocatedStorage=5,
-    BackupRetentionPeriod=7,
-    DBInstanceClass=Ref(database_instance_class),
-    DeletionPolicy='Snapshot',
-    Engine=Ref(database_engine),
-    MasterUsername=Ref(database_master_username),
-    MasterUserPassword=Ref(database_master_password),
-    MultiAZ=False,
-    PubliclyAccessible=True,
-    VPCSecurityGroups=[Ref(default_sec_group), Ref(region_sec_group)]
-))
-# endregion
-
-# region Metadata
-template.add_metadata({
-    'AWS::CloudFormation::Interface': {
-        'ParameterLabels': {
-            # Network
-            vpc.title: {'default': 'VPC'},
-            allow_cidr.title: {'default': 'Allow'},
-            # Database Service
-            database_engine.title: {'default': 'Engine'},
-            database_instance_class.title: {'default': 'Instance Class'},
-            database_master_username.title: {'default': 'Master Username'},
-            database_master_password.title: {'default': 'Master Password'},
-
-        },
-        'ParameterGroups': [
-            {
-                'Label': {'default': 'Network'},
-                'Parameters': [
-                    vpc.title,
-                    allow_cidr.title,
-                ]
-            },
-            {
-                'Label': {'default': 'Database Service'},
-                'Parameters': [
-                    database_master_username.title,
-                    database_master_password.title,
-                    database_instance_class.title,
-                    database_engine.title,
-                ]
+    database = template.add_resource(rds_common.database_instance(
+        service.database,
+        cluster=cluster,
+        **rds_common.database_monitoring(template, service.monitoring),
+        **rds_common.database_tuning(template, service.database, service.tuning),
+        VPCSecurityGroups=[Ref(default_sec_group)] + [Ref(group) for group in region_sec_groups]
+    ))
+
+    rds_common.add_database_alarms(template, service.monitoring, database)
+
+    replicas = rds_common.add_read_replicas(
+        template, service.database, database, service.replicas, tuning=service.tuning, cluster=cluster,
+        VPCSecurityGroups=[Ref(default_sec_group)] + [Ref(group) for group in region_sec_groups]
+    )
+    rds_common.add_reader_autoscaling(template, service.aurora, cluster, replicas)
+
+    if options.proxy:
+        rds_common.add_database_proxy(template, service.database, service.proxy, cluster or database,
+                                      Ref(default_sec_group))
+    # endregion
+
+    # region Metadata
+    template.set_metadata({
+        'AWS::CloudFormation::Interface': {
+            'ParameterLabels': {
+                # Network
+                vpc.title: {'default': 'VPC'},
+                allow_cidr.title: {'default': 'Allow'},
+                # Database Service
+                **rds_common.database_service_parameter_labels(service),
             },
-        ]
-    }
-})
-# endregion
+            'ParameterGroups': [
+                {
+                    'Label': {'default': 'Network'},
+                    'Parameters': [
+                        vpc.title,
+                        allow_cidr.title,
+                    ]
+                },
+            ] + rds_common.database_service_parameter_groups(service)
+        }
+    })
+    # endregion
+
+    return template
+
 
 if __name__ == '__main__':
-    print(template.to_json())
+    print(build().to_json())
@@ -1,231 +1,360 @@
 #!/usr/bin/env python3
 
-from troposphere import Ref, Sub, GetAtt, Tags
-from troposphere import Template, Parameter, ec2, rds
+from troposphere import Ref, Sub, GetAtt, GetAZs, Select, Cidr, Tags, Condition, Equals, If, Not, Or, Output
+from troposphere import Template, Parameter, ec2, elasticache, rds
+from troposphere.validators import network_port
 
-template = Template("""
+import rds_common
+
+CACHE_ENGINE_VERSION = '7.1'
+CACHE_NODE_TYPES = [
+    'cache.t3.micro', 'cache.t3.small', 'cache.t3.medium',
+    'cache.t4g.micro', 'cache.t4g.small', 'cache.t4g.medium',
+    'cache.m6g.large', 'cache.m6g.xlarge', 'cache.m6g.2xlarge', 'cache.m6g.4xlarge',
+    'cache.m7g.large', 'cache.m7g.xlarge', 'cache.m7g.2xlarge', 'cache.m7g.4xlarge',
+    'cache.r6g.large', 'cache.r6g.xlarge', 'cache.r6g.2xlarge', 'cache.r6g.4xlarge',
+    'cache.r7g.large', 'cache.r7g.xlarge', 'cache.r7g.2xlarge', 'cache.r7g.4xlarge',
+]
+# Services reached through gateway endpoints in the route tables, the others get interface endpoints
+GATEWAY_ENDPOINT_SERVICES = ('s3', 'dynamodb')
+
+
+def build(config=None):
+    config = config or {}
+
+    # region Configurable
+    # Availability zones to spread the subnets over, at least the 2 a DB subnet group needs.
+    availability_zones = config.get('availability_zones', 2)
+    # A private subnet per zone, without a route to the internet, for the database and cache.
+    private_subnets = config.get('private_subnets', False)
+    # VPC endpoints keeping AWS API traffic off the internet gateway, by service name,
+    # e.g. ['s3', 'secretsmanager', 'logs', 'monitoring'] for S3, Secrets Manager and CloudWatch.
+    vpc_endpoints = config.get('vpc_endpoints', [])
+    # proxy, read_replicas, performance_insights, enhanced_monitoring, alarms,
+    # tuning, aurora and reader_autoscaling, see rds_common.database_options.
+    options = rds_common.database_options(config)
+    # Redis replication group in the database subnets, e.g. for querysets and sessions.
+    cache = config.get('cache', False)
+    if availability_zones < 2:
+        raise ValueError('availability_zones must be at least 2, a DB subnet group spans 2 zones')
+    # endregion
+
+    template = Template("""
 Create a RDS instance in a VPC.
 
 Template: rds-vpc-template
 Author: Carlos Avila <cavila@mandelbrew.com>
 """)
 
-# region Parameters - Network
-allow_acess_cidr = template.add_parameter(Parameter(
-    'AllowAccessCidr',
-    Type='String',
-    Description='Allows all connections to and from the provided CIDR block',
-    Default='173.244.44.0/24'
-))
-
-vpc_cidr_block = template.add_parameter(Parameter(
-    'VpcCidrBlock',
-    Type='String',
-    Description='Specifies the CIDR Block of VPC',
-    Default='10.0.0.0/16'
-))
-
-subnet1_cidr_block = template.add_parameter(Parameter(
-    'Subnet1CidrBlock',
-    Type='String',
-    Description='Specifies the CIDR Block of Subnet 1',
-    Default='10.0.0.0/24'
-))
-
-subnet2_cidr_block = template.add_parameter(Parameter(
-    'Subnet2CidrBlock',
-    Type='String',
-    Description='Specifies the CIDR Block of Subnet 2',
-    Default='10.0.1.0/24'
-))
-# endregion
-
-# region Parameters - Database
-database_master_username = template.add_parameter(Parameter(
-    'DatabaseMasterUsername',
-    Type='String',
-))
-
-database_master_password = template.add_parameter(Parameter(
-    'DatabaseMasterPassword',
-    Type='String',
-    NoEcho=True
-))
-
-database_instance_class = template.add_parameter(Parameter(
-    'DatabaseInstanceType',
-    Type='String',
-    Default='db.t2.micro',
-    AllowedValues=[
-        'db.t1.micro',
-        'db.t2.micro', 'db.t2.small', 'db.t2.medium', 'db.t2.large',
-        'db.m1.small', 'db.m1.medium', 'db.m1.large', 'db.m1.xlarge',
-        'db.m2.xlarge', 'db.m2.2xlarge', 'db.m2.4xlarge',
-        'db.m3.medium', 'db.m3.large', 'db.m3.xlarge', 'db.m3.2xlarge',
-        'db.m4.large', 'db.m4.xlarge', 'db.m4.2xlarge', 'db.m4.4xlarge', 'db.m4.10xlarge',
-        'db.r3.large', 'db.r3.xlarge', 'db.r3.2xlarge', 'db.r3.4xlarge', 'db.r3.8xlarge',
-    ]
-))
-
-database_engine = template.add_parameter(Parameter(
-    'DatabaseEngine',
-    Type='String',
-    Description='The name of the database engine to be used',
-    Default='postgres',
-    AllowedValues=['aurora',
-                   'mariadb',
-                   'mysql',
-                   'oracle-ee',
-                   'oracle-se2',
-                   'oracle-se1',
-                   'oracle-se',
-                   'postgres',
-                   'sqlserver-ee',
-                   'sqlserver-se',
-                   'sqlserver-ex',
-                   'sqlserver-web', ]
-))
-# endregion
-
-# region Network
-vpc = template.add_resource(ec2.VPC(
-    'Vpc',
-    CidrBlock=Ref(vpc_cidr_block),
-    EnableDnsSupport=True,
-    EnableDnsHostnames=True,
-    Tags=Tags(StackName=Sub('${AWS::StackName}'))
-))
-subnet1 = template.add_resource(ec2.Subnet(
-    'Subnet1',
-    VpcId=Ref(vpc),
-    AvailabilityZone=Sub('${AWS::Region}a'),
-    CidrBlock=Ref(subnet1_cidr_block),
-    MapPublicIpOnLaunch=True,
-    Tags=Tags(StackName=Sub('${AWS::StackName}'))
-))
-subnet2 = template.add_resource(ec2.Subnet(
-    'Subnet2',
-    VpcId=Ref(vpc),
-    AvailabilityZone=Sub('${AWS::Region}b'),
-    CidrBlock=Ref(subnet2_cidr_block),
-    MapPublicIpOnLaunch=True,
-    Tags=Tags(StackName=Sub('${AWS::StackName}'))
-))
-# Gateway used by the VPC to connect to the internet
-internet_gateway = template.add_resource(ec2.InternetGateway(
-    'InternetGateway',
-    Tags=Tags(StackName=Sub('${AWS::StackName}'))
-))
-# Map our VPC to our gateway
-gateway_attachment = template.add_resource(ec2.VPCGatewayAttachment(
-    'GatewayAttachment',
-    VpcId=Ref(vpc),
-    InternetGatewayId=Ref(internet_gateway),
-))
-# Routing table used by our VPC
-route_table = template.add_resource(ec2.RouteTable(
-    'RouteTable',
-    VpcId=Ref(vpc),
-    Tags=Tags(StackName=Sub('${AWS::StackName}'))
-))
-# Routing rule that gets added to our routing table for our internet gateway
-route = template.add_resource(ec2.Route(
-    'Route',
-    DependsOn=[gateway_attachment.title],
-    RouteTableId=Ref(route_table),
-    DestinationCidrBlock='0.0.0.0/0',
-    GatewayId=Ref(internet_gateway)
-))
-# Associate all subnets with our routing table too
-subnet1_route_table_association = template.add_resource(ec2.SubnetRouteTableAssociation(
-    'Subnet1RouteTableAssociation',
-    SubnetId=Ref(subnet1),
-    RouteTableId=Ref(route_table)
-))
-subnet2_route_table_association = template.add_resource(ec2.SubnetRouteTableAssociation(
-    'Subnet2RouteTableAssociation',
-    SubnetId=Ref(subnet2),
-    RouteTableId=Ref(route_table)
-))
-
-backdoor_sgi = template.add_resource(ec2.SecurityGroupIngress(
-    'BackdoorSecurityGroupIngress',
-    CidrIp=Ref(allow_acess_cidr),
-    FromPort=ec2.network_port(-1),
-    GroupId=GetAtt(vpc, 'DefaultSecurityGroup'),
-    IpProtocol='-1',
-    ToPort=ec2.network_port(-1),
-))
-# endregion
-
-# region RDS
-database_sg = template.add_resource(rds.DBSubnetGroup(
-    'DatabaseSubnetGroup',
-    DBSubnetGroupDescription=Sub('Subnets available for ${AWS::StackName}'),
-    SubnetIds=[
-        Ref(subnet1),
-        Ref(subnet2)
-    ]
-))
-
-database = template.add_resource(rds.DBInstance(
-    'Database',
-    DependsOn=[gateway_attachment.title],  # PubliclyAccessible requires gateway attachment
-    AllocatedStorage=5,
-    BackupRetentionPeriod=7,
-    DBInstanceClass=Ref(database_instance_class),
-    DeletionPolicy='Snapshot',
-    Engine=Ref(database_engine),
-    MasterUsername=Ref(database_master_username),
-    MasterUserPassword=Ref(database_master_password),
-    MultiAZ=False,
-    PubliclyAccessible=True,
-    DBSubnetGroupName=Ref(database_sg),
-    VPCSecurityGroups=[
-        GetAtt(vpc, 'DefaultSecurityGroup')
-    ]
-))
-# endregion
-
-# region Metadata
-template.add_metadata({
-    'AWS::CloudFormation::Interface': {
-        'ParameterLabels': {
-            # Network
-            allow_acess_cidr.title: {'default': 'Allow'},
-            vpc_cidr_block.title: {'default': 'VPC'},
-            subnet1_cidr_block.title: {'default': 'Subnet 1'},
-            subnet2_cidr_block.title: {'default': 'Subnet 2'},
-            # Database Service
-            database_engine.title: {'default': 'Engine'},
-            database_instance_class.title: {'default': 'Instance Class'},
-            database_master_username.title: {'default': 'Master Username'},
-            database_master_password.title: {'default': 'Master Password'},
-
-        },
-        'ParameterGroups': [
-            {
-                'Label': {'default': 'Network'},
-                'Parameters': [
-                    allow_acess_cidr.title,
-                    vpc_cidr_block.title,
-                    subnet1_cidr_block.title,
-                    subnet2_cidr_block.title,
-                ]
-            },
-            {
-                'Label': {'default': 'Database Service'},
-                'Parameters': [
-                    database_master_username.title,
-                    database_master_password.title,
-                    database_instance_class.title,
-                    database_engine.title,
-                ]
-            },
+    # region Parameters - Network
+    allow_acess_cidr = template.add_parameter(Parameter(
+        'AllowAccessCidr',
+        Type='String',
+        Description='Allows all connections to and from the provided CIDR block',
+        Default='173.244.44.0/24'
+    ))
+
+    vpc_cidr_block = template.add_parameter(Parameter(
+        'VpcCidrBlock',
+        Type='String',
+        Description='Specifies the CIDR Block of VPC',
+        Default='10.0.0.0/16'
+    ))
+
+    subnet_cidr_bits = template.add_parameter(Parameter(
+        'SubnetCidrBits',
+        Type='Number',
+        Description='Host bits of each subnet carved out of the VPC CIDR Block, 8 for a /24',
+        Default=8,
+        MinValue=4,
+        MaxValue=16
+    ))
+    # endregion
+
+    # region Parameters - Cache
+    cache_labels = {}
+    if cache:
+        cache_node_type = template.add_parameter(Parameter(
+            'CacheNodeType',
+            Type='String',
+            Description='Node type of the Redis cache',
+            Default='cache.t4g.micro',
+            AllowedValues=CACHE_NODE_TYPES
+        ))
+
+        cache_shards = template.add_parameter(Parameter(
+            'CacheShards',
+            Type='Number',
+            Description='Node groups the keys are partitioned over, more than 1 enables cluster mode',
+            Default=1,
+            MinValue=1,
+            MaxValue=90
+        ))
+
+        cache_replicas = template.add_parameter(Parameter(
+            'CacheReplicasPerShard',
+            Type='Number',
+            Description='Read replicas of each shard, at least 1 for automatic failover',
+            Default=1,
+            MinValue=0,
+            MaxValue=5
+        ))
+
+        cache_labels = {
+            cache_node_type.title: {'default': 'Node Type'},
+            cache_shards.title: {'default': 'Shards'},
+            cache_replicas.title: {'default': 'Replicas per Shard'},
+        }
+    # endregion
+
+    # region Parameters - Database
+    service = rds_common.add_database_service_parameters(template, options, proxy_subnets=False)
+    # endregion
+
+    # region Network
+    vpc = template.add_resource(ec2.VPC(
+        'Vpc',
+        CidrBlock=Ref(vpc_cidr_block),
+        EnableDnsSupport=True,
+        EnableDnsHostnames=True,
+        Tags=Tags(StackName=Sub('${AWS::StackName}'))
+    ))
+    # Public subnets take the first blocks of the VPC, private subnets the ones after them
+    subnet_cidrs = Cidr(Ref(vpc_cidr_block), availability_zones * (2 if private_subnets else 1), Ref(subnet_cidr_bits))
+    subnets = [template.add_resource(ec2.Subnet(
+        'Subnet{}'.format(index + 1),
+        VpcId=Ref(vpc),
+        AvailabilityZone=Select(index, GetAZs('')),
+        CidrBlock=Select(index, subnet_cidrs),
+        MapPublicIpOnLaunch=True,
+        Tags=Tags(StackName=Sub('${AWS::StackName}'))
+    )) for index in range(availability_zones)]
+    private = [template.add_resource(ec2.Subnet(
+        'PrivateSubnet{}'.format(index + 1),
+        VpcId=Ref(vpc),
+        AvailabilityZone=Select(index, GetAZs('')),
+        CidrBlock=Select(availability_zones + index, subnet_cidrs),
+        MapPublicIpOnLaunch=False,
+        Tags=Tags(StackName=Sub('${AWS::StackName}'))
+    )) for index in range(availability_zones if private_subnets else 0)]
+    # Database, cache and proxy go in the private subnets when there are some
+    database_subnets = private or subnets
+    # Gateway used by the VPC to connect to the internet
+    internet_gateway = template.add_resource(ec2.InternetGateway(
+        'InternetGateway',
+        Tags=Tags(StackName=Sub('${AWS::StackName}'))
+    ))
+    # Map our VPC to our gateway
+    gateway_attachment = template.add_resource(ec2.VPCGatewayAttachment(
+        'GatewayAttachment',
+        VpcId=Ref(vpc),
+        InternetGatewayId=Ref(internet_gateway),
+    ))
+    # Routing table used by our VPC
+    route_table = template.add_resource(ec2.RouteTable(
+        'RouteTable',
+        VpcId=Ref(vpc),
+        Tags=Tags(StackName=Sub('${AWS::StackName}'))
+    ))
+    # Routing rule that gets added to our routing table for our internet gateway
+    route = template.add_resource(ec2.Route(
+        'Route',
+        DependsOn=[gateway_attachment.title],
+        RouteTableId=Ref(route_table),
+        DestinationCidrBlock='0.0.0.0/0',
+        GatewayId=Ref(internet_gateway)
+    ))
+    # Associate all subnets with our routing table too
+    for subnet in subnets:
+        template.add_resource(ec2.SubnetRouteTableAssociation(
+            '{}RouteTableAssociation'.format(subnet.title),
+            SubnetId=Ref(subnet),
+            RouteTableId=Ref(route_table)
+        ))
+    route_tables = [route_table]
+    if private:
+        # Private subnets only reach the VPC and its endpoints
+        private_route_table = template.add_resource(ec2.RouteTable(
+            'PrivateRouteTable',
+            VpcId=Ref(vpc),
+            Tags=Tags(StackName=Sub('${AWS::StackName}'))
+        ))
+        route_tables.append(private_route_table)
+        for subnet in private:
+            template.add_resource(ec2.SubnetRouteTableAssociation(
+                '{}RouteTableAssociation'.format(subnet.title),
+                SubnetId=Ref(subnet),
+                RouteTableId=Ref(private_route_table)
+            ))
+
+    for endpoint_service in vpc_endpoints:
+        title = ''.join(part.title() for part in endpoint_service.replace('-', '.').split('.')) + 'Endpoint'
+        if endpoint_service in GATEWAY_ENDPOINT_SERVICES:
+            template.add_resource(ec2.VPCEndpoint(
+                title,
+                RouteTableIds=[Ref(table) for table in route_tables],
+                ServiceName=Sub('com.amazonaws.${AWS::Region}.' + endpoint_service),
+                VpcEndpointType='Gateway',
+                VpcId=Ref(vpc)
+            ))
+        else:
+            # One network interface per zone, resolved by the service's usual DNS name
+            template.add_resource(ec2.VPCEndpoint(
+                title,
+                PrivateDnsEnabled=True,
+                SecurityGroupIds=[GetAtt(vpc, 'DefaultSecurityGroup')],
+                ServiceName=Sub('com.amazonaws.${AWS::Region}.' + endpoint_service),
+                SubnetIds=[Ref(subnet) for subnet in database_subnets],
+                VpcEndpointType='Interface',
+                VpcId=Ref(vpc)
+            ))
+
+    backdoor_sgi = template.add_resource(ec2.SecurityGroupIngress(
+        'BackdoorSecurityGroupIngress',
+        CidrIp=Ref(allow_acess_cidr),
+        FromPort=network_port(-1),
+        GroupId=GetAtt(vpc, 'DefaultSecurityGroup'),
+        IpProtocol='-1',
+        ToPort=network_port(-1),
+    ))
+    # endregion
+
+    # region RDS
+    database_sg = template.add_resource(rds.DBSubnetGroup(
+        'DatabaseSubnetGroup',
+        DBSubnetGroupDescription=Sub('Subnets available for ${AWS::StackName}'),
+        SubnetIds=[Ref(subnet) for subnet in database_subnets]
+    ))
+
+    cluster = rds_common.add_database_cluster(
+        template, service.database, service.aurora,
+        DependsOn=[gateway_attachment.title],  # PubliclyAccessible requires gateway attachment
+        DBSubnetGroupName=Ref(database_sg),
+        VpcSecurityGroupIds=[GetAtt(vpc, 'DefaultSecurityGroup')]
+    )
+
+    database = template.add_resource(rds_common.database_instance(
+        service.database,
+        cluster=cluster,
+        **rds_common.database_monitoring(template, service.monitoring),
+        **rds_common.database_tuning(template, service.database, service.tuning),
+        DependsOn=[gateway_attachment.title],  # PubliclyAccessible requires gateway attachment
+        DBSubnetGroupName=Ref(database_sg),
+        PubliclyAccessible=not private,
+        VPCSecurityGroups=[
+            GetAtt(vpc, 'DefaultSecurityGroup')
         ]
-    }
-})
-# endregion
+    ))
+
+    rds_common.add_database_alarms(template, service.monitoring, database)
+
+    # Replicas stay in the database subnet group, so only its zones can be used
+    replicas = rds_common.add_read_replicas(
+        template, service.database, database, service.replicas,
+        zones=[GetAtt(subnet, 'AvailabilityZone') for subnet in database_subnets],
+        tuning=service.tuning,
+        cluster=cluster,
+        PubliclyAccessible=not private,
+        VPCSecurityGroups=[GetAtt(vpc, 'DefaultSecurityGroup')]
+    )
+    rds_common.add_reader_autoscaling(template, service.aurora, cluster, replicas)
+
+    if options.proxy:
+        # The VPC default group already lets its members reach each other
+        rds_common.add_database_proxy(template, service.database, service.proxy, cluster or database,
+                                      GetAtt(vpc, 'DefaultSecurityGroup'),
+                                      subnets=[Ref(subnet) for subnet in database_subnets],
+                                      self_rules=False)
+    # endregion
+
+    # region Cache
+    if cache:
+        cluster_mode = template.add_condition('CacheClusterMode', Not(Equals(Ref(cache_shards), '1')))
+        has_replicas = template.add_condition('CacheHasReplicas', Not(Equals(Ref(cache_replicas), '0')))
+        single_shard = template.add_condition('CacheSingleShard', Equals(Ref(cache_shards), '1'))
+        # Cluster mode requires automatic failover
+        failover = template.add_condition('CacheFailover', Or(Condition(cluster_mode), Condition(has_replicas)))
+
+        cache_subnet_group = template.add_resource(elasticache.SubnetGroup(
+            'CacheSubnetGroup',
+            Description=Sub('Subnets available for ${AWS::StackName} cache'),
+            SubnetIds=[Ref(subnet) for subnet in database_subnets]
+        ))
+
+        # Same group as Database, so the same clients reach it
+        cache_group = template.add_resource(elasticache.ReplicationGroup(
+            'Cache',
+            AtRestEncryptionEnabled=True,
+            AutomaticFailoverEnabled=If(failover, True, False),
+            CacheNodeType=Ref(cache_node_type),
+            CacheParameterGroupName=If(
+                cluster_mode,
+                'default.redis{}.cluster.on'.format(CACHE_ENGINE_VERSION.split('.')[0]),
+                'default.redis{}'.format(CACHE_ENGINE_VERSION.split('.')[0])
+            ),
+            CacheSubnetGroupName=Ref(cache_subnet_group),
+            Engine='redis',
+            EngineVersion=CACHE_ENGINE_VERSION,
+            MultiAZEnabled=If(has_replicas, True, False),
+            NumNodeGroups=Ref(cache_shards),
+            ReplicasPerNodeGroup=Ref(cache_replicas),
+            ReplicationGroupDescription=Sub('${AWS::StackName} cache'),
+            SecurityGroupIds=[
+                GetAtt(vpc, 'DefaultSecurityGroup')
+            ]
+        ))
+
+        template.add_output(Output(
+            'CachePrimaryEndpoint',
+            Condition=single_shard,
+            Value=GetAtt(cache_group, 'PrimaryEndPoint.Address')
+        ))
+        template.add_output(Output(
+            'CacheReaderEndpoint',
+            Condition=single_shard,
+            Value=GetAtt(cache_group, 'ReaderEndPoint.Address')
+        ))
+        template.add_output(Output(
+            'CacheConfigurationEndpoint',
+            Condition=cluster_mode,
+            Value=GetAtt(cache_group, 'ConfigurationEndPoint.Address')
+        ))
+    # endregion
+
+    # region Metadata
+    template.set_metadata({
+        'AWS::CloudFormation::Interface': {
+            'ParameterLabels': {
+                # Network
+                allow_acess_cidr.title: {'default': 'Allow'},
+                vpc_cidr_block.title: {'default': 'VPC'},
+                subnet_cidr_bits.title: {'default': 'Subnet Size'},
+                # Database Service
+                **rds_common.database_service_parameter_labels(service),
+                # Cache
+                **cache_labels,
+            },
+            'ParameterGroups': [
+                {
+                    'Label': {'default': 'Network'},
+                    'Parameters': [
+                        allow_acess_cidr.title,
+                        vpc_cidr_block.title,
+                        subnet_cidr_bits.title,
+                    ]
+                },
+            ] + rds_common.database_service_parameter_groups(service) + ([
+                {
+                    'Label': {'default': 'Cache'},
+                    'Parameters': list(cache_labels)
+                },
+            ] if cache else [])
+        }
+    })
+    # endregion
+
+    return template
+
 
 if __name__ == '__main__':
-    print(template.to_json())
+    print(build().to_json())
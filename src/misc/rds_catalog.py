@@ -0,0 +1,166 @@
+"""
+RDS instance classes and the engine settings tuned for each of them.
+
+INSTANCE_CATALOG maps every instance class to its vCPUs, memory and network
+performance. Tuning presets turn an instance class into DB parameter group
+values, so memory is put to use on the larger classes instead of running
+engine defaults sized for the smallest one.
+"""
+
+import collections
+import re
+
+InstanceClass = collections.namedtuple('InstanceClass', 'vcpu memory_gib network')
+
+GIB = 1024 ** 3
+
+# Sizes of the current generations and their vCPUs
+SIZES = collections.OrderedDict([
+    ('large', 2), ('xlarge', 4), ('2xlarge', 8), ('4xlarge', 16), ('8xlarge', 32),
+    ('12xlarge', 48), ('16xlarge', 64), ('24xlarge', 96), ('32xlarge', 128),
+])
+
+
+def _generation(family, memory_per_vcpu, networks):
+    """Instance classes of a generation, networks maps each size to its network performance."""
+    return collections.OrderedDict(
+        ('db.{}.{}'.format(family, size), InstanceClass(SIZES[size], SIZES[size] * memory_per_vcpu, network))
+        for size, network in networks.items()
+    )
+
+
+def _burstable(family, network):
+    return collections.OrderedDict(
+        ('db.{}.{}'.format(family, size), InstanceClass(vcpu, memory, network))
+        for size, vcpu, memory in (('micro', 2, 1), ('small', 2, 2), ('medium', 2, 4), ('large', 2, 8),
+                                   ('xlarge', 4, 16), ('2xlarge', 8, 32))
+    )
+
+
+_M5_R5_NETWORKS = collections.OrderedDict([
+    ('large', 'Up to 10 Gbps'), ('xlarge', 'Up to 10 Gbps'), ('2xlarge', 'Up to 10 Gbps'),
+    ('4xlarge', 'Up to 10 Gbps'), ('8xlarge', '10 Gbps'), ('12xlarge', '10 Gbps'),
+    ('16xlarge', '20 Gbps'), ('24xlarge', '25 Gbps'),
+])
+
+_GRAVITON2_NETWORKS = collections.OrderedDict([
+    ('large', 'Up to 10 Gbps'), ('xlarge', 'Up to 10 Gbps'), ('2xlarge', 'Up to 10 Gbps'),
+    ('4xlarge', 'Up to 10 Gbps'), ('8xlarge', '12 Gbps'), ('12xlarge', '20 Gbps'), ('16xlarge', '25 Gbps'),
+])
+
+_GRAVITON3_NETWORKS = collections.OrderedDict([
+    ('large', 'Up to 12.5 Gbps'), ('xlarge', 'Up to 12.5 Gbps'), ('2xlarge', 'Up to 15 Gbps'),
+    ('4xlarge', 'Up to 15 Gbps'), ('8xlarge', '15 Gbps'), ('12xlarge', '22.5 Gbps'), ('16xlarge', '30 Gbps'),
+])
+
+_ICE_LAKE_NETWORKS = collections.OrderedDict([
+    ('large', 'Up to 12.5 Gbps'), ('xlarge', 'Up to 12.5 Gbps'), ('2xlarge', 'Up to 12.5 Gbps'),
+    ('4xlarge', 'Up to 12.5 Gbps'), ('8xlarge', '12.5 Gbps'), ('12xlarge', '18.75 Gbps'),
+    ('16xlarge', '25 Gbps'), ('24xlarge', '37.5 Gbps'), ('32xlarge', '50 Gbps'),
+])
+
+INSTANCE_CATALOG = collections.OrderedDict([
+    # Previous generations
+    ('db.t1.micro', InstanceClass(1, 0.613, 'Very Low')),
+    ('db.t2.micro', InstanceClass(1, 1, 'Low')),
+    ('db.t2.small', InstanceClass(1, 2, 'Low')),
+    ('db.t2.medium', InstanceClass(2, 4, 'Moderate')),
+    ('db.t2.large', InstanceClass(2, 8, 'Moderate')),
+    ('db.m1.small', InstanceClass(1, 1.7, 'Low')),
+    ('db.m1.medium', InstanceClass(1, 3.75, 'Moderate')),
+    ('db.m1.large', InstanceClass(2, 7.5, 'Moderate')),
+    ('db.m1.xlarge', InstanceClass(4, 15, 'High')),
+    ('db.m2.xlarge', InstanceClass(2, 17.1, 'Moderate')),
+    ('db.m2.2xlarge', InstanceClass(4, 34.2, 'Moderate')),
+    ('db.m2.4xlarge', InstanceClass(8, 68.4, 'High')),
+    ('db.m3.medium', InstanceClass(1, 3.75, 'Moderate')),
+    ('db.m3.large', InstanceClass(2, 7.5, 'Moderate')),
+    ('db.m3.xlarge', InstanceClass(4, 15, 'High')),
+    ('db.m3.2xlarge', InstanceClass(8, 30, 'High')),
+    ('db.m4.large', InstanceClass(2, 8, 'Moderate')),
+    ('db.m4.xlarge', InstanceClass(4, 16, 'High')),
+    ('db.m4.2xlarge', InstanceClass(8, 32, 'High')),
+    ('db.m4.4xlarge', InstanceClass(16, 64, 'High')),
+    ('db.m4.10xlarge', InstanceClass(40, 160, '10 Gbps')),
+    ('db.r3.large', InstanceClass(2, 15.25, 'Moderate')),
+    ('db.r3.xlarge', InstanceClass(4, 30.5, 'Moderate')),
+    ('db.r3.2xlarge', InstanceClass(8, 61, 'High')),
+    ('db.r3.4xlarge', InstanceClass(16, 122, 'High')),
+    ('db.r3.8xlarge', InstanceClass(32, 244, '10 Gbps')),
+])
+# Current generations
+INSTANCE_CATALOG.update(_burstable('t3', 'Up to 5 Gbps'))
+INSTANCE_CATALOG.update(_burstable('t4g', 'Up to 5 Gbps'))
+INSTANCE_CATALOG.update(_generation('m5', 4, _M5_R5_NETWORKS))
+INSTANCE_CATALOG.update(_generation('m6g', 4, _GRAVITON2_NETWORKS))
+INSTANCE_CATALOG.update(_generation('m6i', 4, _ICE_LAKE_NETWORKS))
+INSTANCE_CATALOG.update(_generation('m7g', 4, _GRAVITON3_NETWORKS))
+INSTANCE_CATALOG.update(_generation('r5', 8, _M5_R5_NETWORKS))
+INSTANCE_CATALOG.update(_generation('r6g', 8, _GRAVITON2_NETWORKS))
+INSTANCE_CATALOG.update(_generation('r6i', 8, _ICE_LAKE_NETWORKS))
+INSTANCE_CATALOG.update(_generation('r7g', 8, _GRAVITON3_NETWORKS))
+
+INSTANCE_CLASSES = list(INSTANCE_CATALOG)
+
+# Classes Aurora PostgreSQL and MySQL instances run on, db.serverless for Serverless v2
+AURORA_INSTANCE_CLASSES = ['db.serverless'] + [
+    name for name in INSTANCE_CLASSES
+    if name.split('.')[1] in ('r5', 'r6g', 'r6i', 'r7g') or
+    (name.split('.')[1] in ('t3', 't4g') and name.split('.')[2] in ('medium', 'large'))
+]
+
+
+# region Tuning presets
+def postgres_settings(instance):
+    """PostgreSQL settings for instance, memory sizes in the units the parameters take."""
+    memory = int(instance.memory_gib * GIB)
+    shared_buffers = memory // 4
+    # The RDS default, LEAST({DBInstanceClassMemory/9531392}, 5000)
+    max_connections = max(20, min(5000, memory // 9531392))
+    return collections.OrderedDict([
+        ('shared_buffers', shared_buffers // 8192),  # 8 kB pages
+        ('effective_cache_size', memory * 3 // 4 // 8192),  # 8 kB pages
+        ('work_mem', max(4096, (memory - shared_buffers) // (max_connections * 3) // 1024)),  # kB
+        ('maintenance_work_mem', min(2 * GIB, memory // 16) // 1024),  # kB
+        ('max_connections', max_connections),
+        ('random_page_cost', 1.1),  # SSD storage
+    ])
+
+
+def mysql_settings(instance):
+    """MySQL and MariaDB settings for instance."""
+    memory = int(instance.memory_gib * GIB)
+    buffer_pool = memory // 2 if instance.memory_gib < 2 else memory * 3 // 4
+    return collections.OrderedDict([
+        ('innodb_buffer_pool_size', buffer_pool),  # bytes
+        ('innodb_buffer_pool_instances', 1 if buffer_pool < GIB else min(64, instance.vcpu)),
+        # The RDS default, {DBInstanceClassMemory/12582880}, kept under the thread budget of one server
+        ('max_connections', max(20, min(16000, memory // 12582880))),
+    ])
+
+
+TUNING_PRESETS = {
+    'postgres': postgres_settings,
+    'mysql': mysql_settings,
+    'mariadb': mysql_settings,
+}
+
+FAMILY = re.compile(r'^([a-z-]+?)(\d[\d.]*)$')
+
+
+def parse_family(family):
+    """Split a parameter group family such as postgres16 into its engine and version."""
+    match = FAMILY.match(family)
+    if not match or match.group(1) not in TUNING_PRESETS:
+        raise ValueError('no tuning preset for parameter group family {!r}, expected one of {}'.format(
+            family, ', '.join('{}<version>'.format(engine) for engine in sorted(TUNING_PRESETS))))
+    return match.group(1), match.group(2)
+
+
+def tuning_table(engine, classes=None):
+    """Return {instance class: {parameter: value}} of engine's preset for classes, all of them by default."""
+    settings = TUNING_PRESETS[engine]
+    return collections.OrderedDict(
+        (name, settings(INSTANCE_CATALOG[name])) for name in (classes or INSTANCE_CLASSES)
+    )
+# endregion
@@ -0,0 +1,1150 @@
+"""
+Parameters and resources shared by the RDS templates.
+"""
+
+import collections
+import csv
+import functools
+import hashlib
+import json
+
+from awacs import secretsmanager, sts
+from awacs.aws import Allow, PolicyDocument, Principal, Statement
+from troposphere import Equals, FindInMap, GetAtt, GetAZs, If, Join, Not, NoValue, Or, Output, Ref, Select, Sub
+from troposphere import Parameter
+from troposphere import applicationautoscaling, cloudwatch, ec2, iam, rds, secretsmanager as secrets, sns
+from troposphere.validators import network_port
+
+import rds_catalog
+
+DATABASE_PORT = 5432
+
+# Default EC2 quotas. Rules are counted per direction and address family, a
+# prefix list reference counts as many rules as the list's MaxEntries.
+RULES_PER_GROUP = 60
+GROUPS_PER_INTERFACE = 5
+PREFIX_LIST_MAX_ENTRIES = 1000
+
+INSTANCE_CLASSES = rds_catalog.INSTANCE_CLASSES
+AURORA_INSTANCE_CLASSES = rds_catalog.AURORA_INSTANCE_CLASSES
+
+ENGINES = [
+    'mariadb',
+    'mysql',
+    'oracle-ee',
+    'oracle-se2',
+    'oracle-se1',
+    'oracle-se',
+    'postgres',
+    'sqlserver-ee',
+    'sqlserver-se',
+    'sqlserver-ex',
+    'sqlserver-web',
+]
+
+AURORA_ENGINES = [
+    'aurora-postgresql',
+    'aurora-mysql',
+]
+
+# RDS Proxy engine families, oracle engines cannot be proxied
+ENGINE_FAMILIES = {
+    'aurora-mysql': 'MYSQL',
+    'aurora-postgresql': 'POSTGRESQL',
+    'mariadb': 'MYSQL',
+    'mysql': 'MYSQL',
+    'postgres': 'POSTGRESQL',
+    'sqlserver-ee': 'SQLSERVER',
+    'sqlserver-se': 'SQLSERVER',
+    'sqlserver-ex': 'SQLSERVER',
+    'sqlserver-web': 'SQLSERVER',
+}
+
+# Default port of each RDS Proxy engine family
+FAMILY_PORTS = {
+    'MYSQL': 3306,
+    'POSTGRESQL': 5432,
+    'SQLSERVER': 1433,
+}
+
+STORAGE_TYPES = ['gp2', 'gp3', 'io1', 'io2']
+
+# Previous generation classes Performance Insights cannot be enabled on
+NO_PERFORMANCE_INSIGHTS_CLASSES = [
+    name for name in INSTANCE_CLASSES if name.split('.')[1] in ('t1', 't2', 'm1', 'm2', 'm3')
+]
+
+DatabaseParameters = collections.namedtuple(
+    'DatabaseParameters',
+    'master_username master_password instance_class engine '
+    'storage_type allocated_storage iops storage_throughput max_allocated_storage secret')
+
+# Alarm per metric: comparison, default threshold and unit of the threshold
+DATABASE_ALARMS = collections.OrderedDict([
+    ('CPUUtilization', ('GreaterThanThreshold', 80, 'percent')),
+    ('DatabaseConnections', ('GreaterThanThreshold', 100, 'connections')),
+    ('DiskQueueDepth', ('GreaterThanThreshold', 10, 'outstanding I/O requests')),
+    ('FreeableMemory', ('LessThanThreshold', 128 * 1024 * 1024, 'bytes')),
+    ('ReadLatency', ('GreaterThanThreshold', 0.02, 'seconds')),
+    ('WriteLatency', ('GreaterThanThreshold', 0.05, 'seconds')),
+])
+
+MonitoringParameters = collections.namedtuple(
+    'MonitoringParameters', 'performance_insights_retention monitoring_interval alarm_email alarm_thresholds')
+
+AuroraParameters = collections.namedtuple(
+    'AuroraParameters',
+    'min_capacity max_capacity reader_min_count reader_max_count reader_scaling_metric reader_scaling_target')
+
+# Properties Aurora sets on the cluster, not on its instances
+CLUSTER_PROPERTIES = (
+    'AllocatedStorage', 'BackupRetentionPeriod', 'Iops', 'MasterUsername', 'MasterUserPassword',
+    'MaxAllocatedStorage', 'MultiAZ', 'StorageThroughput', 'StorageType', 'VPCSecurityGroups',
+)
+
+TuningParameters = collections.namedtuple('TuningParameters', 'family engine engine_version')
+
+ProxyParameters = collections.namedtuple(
+    'ProxyParameters',
+    'max_connections_percent max_idle_connections_percent connection_borrow_timeout idle_client_timeout subnets')
+
+DatabaseOptions = collections.namedtuple(
+    'DatabaseOptions',
+    'proxy read_replicas performance_insights enhanced_monitoring alarms tuning aurora reader_autoscaling')
+
+DatabaseServiceParameters = collections.namedtuple(
+    'DatabaseServiceParameters', 'database aurora proxy replicas monitoring tuning')
+
+
+# region Parameters
+def database_options(config):
+    """Read the database options the RDS templates share from their config."""
+    return DatabaseOptions(
+        # Put an RDS Proxy in front of the database, for bursts of short-lived
+        # clients such as Lambda functions that would exhaust max_connections.
+        proxy=config.get('proxy', False),
+        # Read replicas of the database, each with its own instance class parameter.
+        read_replicas=config.get('read_replicas', 0),
+        # Performance Insights (not on the db.t1, t2, m1, m2 and m3 classes, so not
+        # on the default db.t2.micro), Enhanced Monitoring and CloudWatch alarms
+        # emailed through an SNS topic.
+        performance_insights=config.get('performance_insights', False),
+        enhanced_monitoring=config.get('enhanced_monitoring', False),
+        alarms=config.get('alarms', False),
+        # Parameter group family, e.g. postgres16 or mysql8.0, to attach parameter
+        # groups tuned for the instance classes picked, see rds_catalog.
+        tuning=config.get('tuning'),
+        # Aurora cluster with Database as its writer and the read replicas as its
+        # readers, Serverless v2 with the default db.serverless instance class.
+        aurora=config.get('aurora', False),
+        # Aurora only, let Application Auto Scaling add readers on top of them.
+        reader_autoscaling=config.get('reader_autoscaling', False),
+    )
+
+
+def add_database_service_parameters(template, options, proxy_subnets=True):
+    """
+    Add the parameters of the database and of the options enabled, see
+    database_options. proxy_subnets is passed on to add_proxy_parameters.
+    """
+    database = add_database_parameters(template, aurora=options.aurora, tuning=options.tuning, secret=options.proxy)
+    return DatabaseServiceParameters(
+        database=database,
+        aurora=add_aurora_parameters(template, options.aurora, options.reader_autoscaling),
+        proxy=add_proxy_parameters(template, subnets=proxy_subnets) if options.proxy else None,
+        replicas=add_replica_parameters(template, options.read_replicas, aurora=options.aurora),
+        monitoring=add_monitoring_parameters(
+            template, options.performance_insights, options.enhanced_monitoring, options.alarms,
+            instance_class=database.instance_class),
+        tuning=add_tuning_parameters(template, options.tuning),
+    )
+
+
+def database_service_parameter_labels(service):
+    return {
+        **database_parameter_labels(service.database),
+        **replica_parameter_labels(service.replicas),
+        **aurora_parameter_labels(service.aurora),
+        **tuning_parameter_labels(service.tuning),
+        **monitoring_parameter_labels(service.monitoring),
+        **proxy_parameter_labels(service.proxy),
+    }
+
+
+def database_service_parameter_groups(service):
+    return ([database_parameter_group(service.database)] +
+            aurora_parameter_groups(service.aurora) +
+            tuning_parameter_groups(service.tuning) +
+            replica_parameter_groups(service.replicas) +
+            monitoring_parameter_groups(service.monitoring) +
+            proxy_parameter_groups(service.proxy))
+
+
+def add_database_parameters(template, aurora=False, tuning=None, secret=False):
+    """
+    Add the database service parameters to template. Aurora clusters take
+    the Aurora engines and classes and manage their own storage. A tuning
+    parameter group family, e.g. postgres16, pins the engine to its own.
+
+    With secret, the master password is generated into a Secrets Manager
+    secret instead of being a parameter, see master_user_password.
+    """
+    if aurora and tuning:
+        raise ValueError('tuning presets are RDS instance parameter groups, they do not apply to Aurora '
+                         'serverless instances; drop tuning or aurora')
+
+    master_username = template.add_parameter(Parameter(
+        'DatabaseMasterUsername',
+        Type='String',
+    ))
+
+    master_password = None
+    database_secret = None
+    if secret:
+        database_secret = template.add_resource(secrets.Secret(
+            'DatabaseSecret',
+            Description=Sub('Master credentials of ${AWS::StackName} database'),
+            GenerateSecretString=secrets.GenerateSecretString(
+                ExcludeCharacters='"@/\\',
+                GenerateStringKey='password',
+                PasswordLength=32,
+                SecretStringTemplate=Sub(json.dumps({'username': '${%s}' % master_username.title})),
+            ),
+        ))
+    else:
+        master_password = template.add_parameter(Parameter(
+            'DatabaseMasterPassword',
+            Type='String',
+            NoEcho=True
+        ))
+
+    instance_class = template.add_parameter(Parameter(
+        'DatabaseInstanceType',
+        Type='String',
+        Default='db.serverless' if aurora else 'db.t2.micro',
+        AllowedValues=AURORA_INSTANCE_CLASSES if aurora else INSTANCE_CLASSES
+    ))
+
+    default, engines = ('aurora-postgresql', AURORA_ENGINES) if aurora else ('postgres', ENGINES)
+    if tuning:
+        default = rds_catalog.parse_family(tuning)[0]
+        engines = [default]
+    engine = template.add_parameter(Parameter(
+        'DatabaseEngine',
+        Type='String',
+        Description='The name of the database engine to be used',
+        Default=default,
+        AllowedValues=engines
+    ))
+
+    if aurora:
+        return DatabaseParameters(master_username, master_password, instance_class, engine, None, None, None, None,
+                                  None, database_secret)
+
+    storage_type = template.add_parameter(Parameter(
+        'DatabaseStorageType',
+        Type='String',
+        Description='gp3 for baseline 3000 IOPS and 125 MiB/s at any size, io1 or io2 for provisioned IOPS',
+        Default='gp3',
+        AllowedValues=STORAGE_TYPES
+    ))
+
+    allocated_storage = template.add_parameter(Parameter(
+        'DatabaseAllocatedStorage',
+        Type='Number',
+        Description='Storage size in GiB',
+        Default=20,
+        MinValue=20,
+        MaxValue=65536
+    ))
+
+    iops = template.add_parameter(Parameter(
+        'DatabaseIops',
+        Type='Number',
+        Description='Provisioned IOPS, required by io1 and io2, 0 for the gp3 baseline. gp3 only accepts it from '
+                    '400 GiB (200 GiB for Oracle, any size for SQL Server)',
+        Default=0,
+        MinValue=0,
+        MaxValue=256000
+    ))
+
+    storage_throughput = template.add_parameter(Parameter(
+        'DatabaseStorageThroughput',
+        Type='Number',
+        Description='gp3 throughput in MiB/s, 0 for the baseline, same size limits as IOPS',
+        Default=0,
+        MinValue=0,
+        MaxValue=4000
+    ))
+
+    max_allocated_storage = template.add_parameter(Parameter(
+        'DatabaseMaxAllocatedStorage',
+        Type='Number',
+        Description='Size in GiB storage autoscaling may grow to, above the allocated storage, 0 to disable it',
+        Default=0,
+        MinValue=0,
+        MaxValue=65536
+    ))
+
+    template.add_condition('DatabaseHasIops', Not(Equals(Ref(iops), '0')))
+    template.add_condition('DatabaseHasStorageThroughput', Not(Equals(Ref(storage_throughput), '0')))
+    template.add_condition('DatabaseHasStorageAutoscaling', Not(Equals(Ref(max_allocated_storage), '0')))
+
+    # Rules cannot compare numbers, size limits are left to RDS
+    template.add_rule('DatabaseProvisionedIops', {
+        'RuleCondition': Or(Equals(Ref(storage_type), 'io1'), Equals(Ref(storage_type), 'io2')),
+        'Assertions': [{
+            'Assert': Not(Equals(Ref(iops), '0')),
+            'AssertDescription': 'io1 and io2 storage need DatabaseIops',
+        }],
+    })
+    template.add_rule('DatabaseGp2Storage', {
+        'RuleCondition': Equals(Ref(storage_type), 'gp2'),
+        'Assertions': [{
+            'Assert': Equals(Ref(iops), '0'),
+            'AssertDescription': 'gp2 storage has no provisioned IOPS, use gp3, io1 or io2',
+        }],
+    })
+    template.add_rule('DatabaseStorageThroughput', {
+        'RuleCondition': Not(Equals(Ref(storage_type), 'gp3')),
+        'Assertions': [{
+            'Assert': Equals(Ref(storage_throughput), '0'),
+            'AssertDescription': 'only gp3 storage takes DatabaseStorageThroughput',
+        }],
+    })
+
+    return DatabaseParameters(master_username, master_password, instance_class, engine,
+                              storage_type, allocated_storage, iops, storage_throughput, max_allocated_storage,
+                              database_secret)
+
+
+def database_parameter_labels(database):
+    labels = {
+        database.engine.title: {'default': 'Engine'},
+        database.instance_class.title: {'default': 'Instance Class'},
+        database.master_username.title: {'default': 'Master Username'},
+    }
+    if database.master_password is not None:
+        labels[database.master_password.title] = {'default': 'Master Password'}
+    if database.storage_type is not None:
+        labels.update({
+            database.storage_type.title: {'default': 'Storage Type'},
+            database.allocated_storage.title: {'default': 'Storage (GiB)'},
+            database.iops.title: {'default': 'Provisioned IOPS'},
+            database.storage_throughput.title: {'default': 'Storage Throughput (MiB/s)'},
+            database.max_allocated_storage.title: {'default': 'Max Storage (GiB)'},
+        })
+    return labels
+
+
+def database_parameter_group(database):
+    return {
+        'Label': {'default': 'Database Service'},
+        'Parameters': [
+            parameter.title for parameter in database[:-1] if parameter is not None
+        ]
+    }
+
+
+def add_aurora_parameters(template, aurora=False, reader_autoscaling=False):
+    """
+    Add the Serverless v2 capacity range of an Aurora cluster and, with
+    reader_autoscaling, the reader count range and scaling target.
+    """
+    if not aurora:
+        return None
+
+    min_capacity = template.add_parameter(Parameter(
+        'DatabaseMinCapacity',
+        Type='Number',
+        Description='Minimum Aurora capacity units of db.serverless instances',
+        Default=0.5,
+        MinValue=0.5,
+        MaxValue=128
+    ))
+
+    max_capacity = template.add_parameter(Parameter(
+        'DatabaseMaxCapacity',
+        Type='Number',
+        Description='Maximum Aurora capacity units of db.serverless instances',
+        Default=16,
+        MinValue=1,
+        MaxValue=128
+    ))
+
+    reader_min_count = reader_max_count = reader_scaling_metric = reader_scaling_target = None
+    if reader_autoscaling:
+        reader_min_count = template.add_parameter(Parameter(
+            'DatabaseReaderMinCount',
+            Type='Number',
+            Description='Fewest readers Application Auto Scaling keeps',
+            Default=1,
+            MinValue=0,
+            MaxValue=15
+        ))
+
+        reader_max_count = template.add_parameter(Parameter(
+            'DatabaseReaderMaxCount',
+            Type='Number',
+            Description='Most readers Application Auto Scaling adds',
+            Default=4,
+            MinValue=1,
+            MaxValue=15
+        ))
+
+        reader_scaling_metric = template.add_parameter(Parameter(
+            'DatabaseReaderScalingMetric',
+            Type='String',
+            Description='Reader average the number of readers tracks',
+            Default='RDSReaderAverageCPUUtilization',
+            AllowedValues=['RDSReaderAverageCPUUtilization', 'RDSReaderAverageDatabaseConnections']
+        ))
+
+        reader_scaling_target = template.add_parameter(Parameter(
+            'DatabaseReaderScalingTarget',
+            Type='Number',
+            Description='Target of the scaling metric, CPU percent or connections per reader',
+            Default=60
+        ))
+
+    return AuroraParameters(min_capacity, max_capacity, reader_min_count, reader_max_count, reader_scaling_metric,
+                            reader_scaling_target)
+
+
+def aurora_parameter_labels(aurora):
+    if aurora is None:
+        return {}
+    labels = {
+        aurora.min_capacity.title: {'default': 'Min Capacity (ACU)'},
+        aurora.max_capacity.title: {'default': 'Max Capacity (ACU)'},
+    }
+    if aurora.reader_min_count is not None:
+        labels.update({
+            aurora.reader_min_count.title: {'default': 'Min Readers'},
+            aurora.reader_max_count.title: {'default': 'Max Readers'},
+            aurora.reader_scaling_metric.title: {'default': 'Reader Scaling Metric'},
+            aurora.reader_scaling_target.title: {'default': 'Reader Scaling Target'},
+        })
+    return labels
+
+
+def aurora_parameter_groups(aurora):
+    if aurora is None:
+        return []
+    return [{
+        'Label': {'default': 'Aurora Cluster'},
+        'Parameters': [parameter.title for parameter in aurora if parameter is not None]
+    }]
+
+
+def add_proxy_parameters(template, subnets=True):
+    """
+    Add the connection pool parameters of the database proxy to template,
+    and a subnets parameter unless the template creates its own subnets.
+    """
+    max_connections_percent = template.add_parameter(Parameter(
+        'DatabaseProxyMaxConnectionsPercent',
+        Type='Number',
+        Description='Share of the database max_connections the proxy may open',
+        Default=90,
+        MinValue=1,
+        MaxValue=100
+    ))
+
+    max_idle_connections_percent = template.add_parameter(Parameter(
+        'DatabaseProxyMaxIdleConnectionsPercent',
+        Type='Number',
+        Description='Share of the database max_connections the proxy keeps open while idle',
+        Default=50,
+        MinValue=0,
+        MaxValue=100
+    ))
+
+    connection_borrow_timeout = template.add_parameter(Parameter(
+        'DatabaseProxyConnectionBorrowTimeout',
+        Type='Number',
+        Description='Seconds a client waits for a pooled connection before failing',
+        Default=120,
+        MinValue=0,
+        MaxValue=3600
+    ))
+
+    idle_client_timeout = template.add_parameter(Parameter(
+        'DatabaseProxyIdleClientTimeout',
+        Type='Number',
+        Description='Seconds before the proxy closes an idle client connection',
+        Default=1800,
+        MinValue=1,
+        MaxValue=28800
+    ))
+
+    proxy_subnets = None
+    if subnets:
+        proxy_subnets = template.add_parameter(Parameter(
+            'DatabaseProxySubnets',
+            Type='List<AWS::EC2::Subnet::Id>',
+            Description='Subnets of the proxy, at least two in different availability zones of the VPC'
+        ))
+
+    return ProxyParameters(max_connections_percent, max_idle_connections_percent, connection_borrow_timeout,
+                           idle_client_timeout, proxy_subnets)
+
+
+def add_replica_parameters(template, count, aurora=False):
+    """Add an instance class parameter for each of count read replicas, or Aurora readers."""
+    return [template.add_parameter(Parameter(
+        'DatabaseReplica{}InstanceType'.format(index),
+        Type='String',
+        Description='Instance class of read replica {}'.format(index),
+        Default='db.serverless' if aurora else 'db.t2.micro',
+        AllowedValues=AURORA_INSTANCE_CLASSES if aurora else INSTANCE_CLASSES
+    )) for index in range(1, count + 1)]
+
+
+def replica_parameter_labels(replicas):
+    return {replica.title: {'default': 'Replica {} Instance Class'.format(index)}
+            for index, replica in enumerate(replicas, 1)}
+
+
+def replica_parameter_groups(replicas):
+    if not replicas:
+        return []
+    return [{
+        'Label': {'default': 'Read Replicas'},
+        'Parameters': [replica.title for replica in replicas]
+    }]
+
+
+def add_monitoring_parameters(template, performance_insights=False, enhanced_monitoring=False, alarms=False,
+                              instance_class=None):
+    """
+    Add the parameters of the monitoring features enabled, or return None
+    when none is. With Performance Insights, a rule rejects the instance_class
+    parameter values it is not available on.
+    """
+    if not (performance_insights or enhanced_monitoring or alarms):
+        return None
+
+    retention = None
+    if performance_insights:
+        retention = template.add_parameter(Parameter(
+            'DatabasePerformanceInsightsRetention',
+            Type='Number',
+            Description='Days of Performance Insights history, 7 are free',
+            Default=7,
+            AllowedValues=[7, 31, 62, 93, 186, 372, 731]
+        ))
+        classes = [name for name in NO_PERFORMANCE_INSIGHTS_CLASSES
+                   if instance_class is not None and name in instance_class.properties['AllowedValues']]
+        if classes:
+            template.add_rule('DatabasePerformanceInsightsInstanceType', {
+                'Assertions': [{
+                    'Assert': Not({'Fn::Contains': [classes, Ref(instance_class)]}),
+                    'AssertDescription': 'Performance Insights is not available on the db.t1, db.t2, db.m1, '
+                                         'db.m2 and db.m3 classes, pick another {}'.format(instance_class.title),
+                }],
+            })
+
+    interval = None
+    if enhanced_monitoring:
+        interval = template.add_parameter(Parameter(
+            'DatabaseMonitoringInterval',
+            Type='Number',
+            Description='Seconds between Enhanced Monitoring samples',
+            Default=60,
+            AllowedValues=[1, 5, 10, 15, 30, 60]
+        ))
+
+    email, thresholds = None, collections.OrderedDict()
+    if alarms:
+        email = template.add_parameter(Parameter(
+            'DatabaseAlarmEmail',
+            Type='String',
+            Description='Email address notified of database alarms',
+            Default='alert@example.com'
+        ))
+        for metric, (comparison, threshold, unit) in DATABASE_ALARMS.items():
+            thresholds[metric] = template.add_parameter(Parameter(
+                'Database{}Threshold'.format(metric),
+                Type='Number',
+                Description='{} alarm threshold in {}'.format(metric, unit),
+                Default=threshold
+            ))
+
+    return MonitoringParameters(retention, interval, email, thresholds)
+
+
+def monitoring_parameter_labels(monitoring):
+    if monitoring is None:
+        return {}
+    labels = {}
+    if monitoring.performance_insights_retention is not None:
+        labels[monitoring.performance_insights_retention.title] = {'default': 'Performance Insights Retention'}
+    if monitoring.monitoring_interval is not None:
+        labels[monitoring.monitoring_interval.title] = {'default': 'Enhanced Monitoring Interval'}
+    if monitoring.alarm_email is not None:
+        labels[monitoring.alarm_email.title] = {'default': 'Alarm Email'}
+    for metric, threshold in monitoring.alarm_thresholds.items():
+        labels[threshold.title] = {'default': '{} Threshold'.format(metric)}
+    return labels
+
+
+def monitoring_parameter_groups(monitoring):
+    if monitoring is None:
+        return []
+    parameters = [p for p in monitoring[:3] if p is not None] + list(monitoring.alarm_thresholds.values())
+    return [{
+        'Label': {'default': 'Database Monitoring'},
+        'Parameters': [p.title for p in parameters]
+    }]
+
+
+def add_tuning_parameters(template, family):
+    """
+    Add the engine version parameter of a tuned parameter group family, e.g.
+    postgres16, or return None without a family.
+    """
+    if not family:
+        return None
+    engine, version = rds_catalog.parse_family(family)
+    engine_version = template.add_parameter(Parameter(
+        'DatabaseEngineVersion',
+        Type='String',
+        Description='Engine version, its major version must match the {} parameter group'.format(family),
+        Default=version
+    ))
+    return TuningParameters(family, engine, engine_version)
+
+
+def tuning_parameter_labels(tuning):
+    if tuning is None:
+        return {}
+    return {tuning.engine_version.title: {'default': 'Engine Version'}}
+
+
+def tuning_parameter_groups(tuning):
+    if tuning is None:
+        return []
+    return [{
+        'Label': {'default': 'Database Tuning'},
+        'Parameters': [tuning.engine_version.title]
+    }]
+
+
+def proxy_parameter_labels(proxy):
+    if proxy is None:
+        return {}
+    labels = {
+        proxy.max_connections_percent.title: {'default': 'Max Connections (%)'},
+        proxy.max_idle_connections_percent.title: {'default': 'Max Idle Connections (%)'},
+        proxy.connection_borrow_timeout.title: {'default': 'Borrow Timeout'},
+        proxy.idle_client_timeout.title: {'default': 'Idle Client Timeout'},
+    }
+    if proxy.subnets is not None:
+        labels[proxy.subnets.title] = {'default': 'Subnets'}
+    return labels
+
+
+def proxy_parameter_groups(proxy):
+    if proxy is None:
+        return []
+    return [{
+        'Label': {'default': 'Database Proxy'},
+        'Parameters': [p.title for p in proxy if p is not None]
+    }]
+# endregion
+
+
+# region Resources
+def is_ipv6(cidr):
+    return isinstance(cidr, str) and ':' in cidr
+
+
+def database_rule(cidr):
+    """Allow database connections to or from cidr, an IPv4 or IPv6 block."""
+    if is_ipv6(cidr):
+        return ec2.SecurityGroupRule(
+            CidrIpv6=cidr,
+            FromPort=network_port(DATABASE_PORT),
+            IpProtocol='tcp',
+            ToPort=network_port(DATABASE_PORT),
+        )
+    return ec2.SecurityGroupRule(
+        CidrIp=cidr,
+        FromPort=network_port(DATABASE_PORT),
+        IpProtocol='tcp',
+        ToPort=network_port(DATABASE_PORT),
+    )
+
+
+@functools.lru_cache(maxsize=256)
+def _region_rules(cidrs):
+    return [database_rule(cidr) for cidr in cidrs]
+
+
+def region_rules(cidrs):
+    """
+    Return the database rules for a list of CIDR blocks.
+
+    Rule lists are memoized, so the ingress and egress of a group and every
+    variant built from the same CIDRs share them. Do not modify the result.
+    """
+    return _region_rules(tuple(cidrs))
+
+
+def shard_cidrs(cidrs, rules_per_group=RULES_PER_GROUP):
+    """
+    Split cidrs into the fewest lists that each fit in one security group.
+
+    IPv4 and IPv6 rules have separate quotas, so every list holds up to
+    rules_per_group blocks of each family.
+    """
+    ipv4 = [cidr for cidr in cidrs if not is_ipv6(cidr)]
+    ipv6 = [cidr for cidr in cidrs if is_ipv6(cidr)]
+    count = max(1, -(-len(ipv4) // rules_per_group), -(-len(ipv6) // rules_per_group))
+    return [
+        ipv4[i * rules_per_group:(i + 1) * rules_per_group] + ipv6[i * rules_per_group:(i + 1) * rules_per_group]
+        for i in range(count)
+    ]
+
+
+@functools.lru_cache(maxsize=None)
+def _read_cidr_sets(path):
+    if path.endswith('.csv'):
+        sets = {}
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                families = sets.setdefault(row['region'], {}).setdefault(row['service'], {'ipv4': [], 'ipv6': []})
+                families[row['family']].append(row['cidr'])
+        return sets
+    with open(path) as f:
+        return json.load(f)['regions']
+
+
+def load_region_cidrs(path, region, services=('EC2',), families=('ipv4',)):
+    """
+    Return the CIDR blocks of services in region from a get_region_cidr_blocks
+    --batch file, JSON or CSV. Files are read once per process, so every
+    region rendered by a matrix shares them.
+    """
+    sets = _read_cidr_sets(path)
+    if region not in sets:
+        raise ValueError('region {!r} is not in {}'.format(region, path))
+    cidrs = []
+    for service in services:
+        for family in families:
+            for cidr in sets[region].get(service, {}).get(family, []):
+                if cidr not in cidrs:
+                    cidrs.append(cidr)
+    return cidrs
+
+
+def rule_digest(cidr):
+    """Stable hex digest of cidr, used for logical IDs and group placement."""
+    return hashlib.sha256(cidr.encode()).hexdigest()[:12]
+
+
+def bucket_cidrs(cidrs, rules_per_group=RULES_PER_GROUP, count=None):
+    """
+    Place cidrs into count security groups by their digest, so a block stays
+    in its group whatever else is added or removed. Without count, the
+    fewest groups where no group exceeds its per-family quota are used.
+    """
+    def place(count):
+        buckets = [[] for _ in range(count)]
+        for cidr in cidrs:
+            buckets[int(rule_digest(cidr), 16) % count].append(cidr)
+        return buckets
+
+    def fits(buckets):
+        return all(sum(1 for c in bucket if is_ipv6(c) == ipv6) <= rules_per_group
+                   for bucket in buckets for ipv6 in (False, True))
+
+    if count is not None:
+        buckets = place(count)
+        if not fits(buckets):
+            raise ValueError('{} region CIDRs do not fit in {} security groups of {} rules'.format(
+                len(cidrs), count, rules_per_group))
+        return buckets
+    count = max(1, len(shard_cidrs(cidrs, rules_per_group)))
+    while not fits(place(count)):
+        count += 1
+    return place(count)
+
+
+def loopback_egress_rule():
+    """Egress rule that only allows loopback, replacing a group's default allow-all egress."""
+    return ec2.SecurityGroupRule(
+        CidrIp='127.0.0.1/32',
+        IpProtocol='-1',
+    )
+
+
+def database_prefix_list_rules(prefix_list):
+    """Return the (ingress, egress) database rules for a prefix list."""
+    ingress = ec2.SecurityGroupRule(
+        SourcePrefixListId=Ref(prefix_list),
+        FromPort=network_port(DATABASE_PORT),
+        IpProtocol='tcp',
+        ToPort=network_port(DATABASE_PORT),
+    )
+    egress = ec2.SecurityGroupRule(
+        DestinationPrefixListId=Ref(prefix_list),
+        FromPort=network_port(DATABASE_PORT),
+        IpProtocol='tcp',
+        ToPort=network_port(DATABASE_PORT),
+    )
+    return ingress, egress
+
+
+def master_user_password(database):
+    """
+    Return the master password of database, resolved from the password key
+    of its secret when it has one so the secret is its only copy.
+    """
+    if database.secret is None:
+        return Ref(database.master_password)
+    return Sub('{{resolve:secretsmanager:${%s}:SecretString:password}}' % database.secret.title)
+
+
+def database_instance(database, cluster=None, **properties):
+    """
+    Return the Database instance, properties override the shared defaults.
+    In a cluster, the properties the cluster owns are left to it.
+    """
+    defaults = dict(
+        BackupRetentionPeriod=7,
+        DBInstanceClass=Ref(database.instance_class),
+        DeletionPolicy='Snapshot',
+        Engine=Ref(database.engine),
+        MasterUsername=Ref(database.master_username),
+        MasterUserPassword=master_user_password(database),
+        MultiAZ=False,
+        PubliclyAccessible=True,
+    )
+    if database.storage_type is not None:
+        defaults.update(
+            AllocatedStorage=Ref(database.allocated_storage),
+            Iops=If('DatabaseHasIops', Ref(database.iops), NoValue),
+            MaxAllocatedStorage=If('DatabaseHasStorageAutoscaling', Ref(database.max_allocated_storage), NoValue),
+            StorageThroughput=If('DatabaseHasStorageThroughput', Ref(database.storage_throughput), NoValue),
+            StorageType=Ref(database.storage_type),
+        )
+    defaults.update(properties)
+    if cluster is not None:
+        for name in CLUSTER_PROPERTIES:
+            defaults.pop(name, None)
+        defaults.update(
+            DBClusterIdentifier=Ref(cluster),
+            DeletionPolicy='Delete',  # the cluster keeps the final snapshot
+        )
+    return rds.DBInstance('Database', **defaults)
+
+
+def add_database_cluster(template, database, aurora, **properties):
+    """
+    Add the Aurora cluster the Database instance joins, or return None
+    without aurora. Outputs its writer and reader endpoints.
+    """
+    if aurora is None:
+        return None
+
+    defaults = dict(
+        BackupRetentionPeriod=7,
+        DeletionPolicy='Snapshot',
+        Engine=Ref(database.engine),
+        MasterUsername=Ref(database.master_username),
+        MasterUserPassword=master_user_password(database),
+        ServerlessV2ScalingConfiguration=rds.ServerlessV2ScalingConfiguration(
+            MaxCapacity=Ref(aurora.max_capacity),
+            MinCapacity=Ref(aurora.min_capacity),
+        ),
+    )
+    defaults.update(properties)
+    cluster = template.add_resource(rds.DBCluster('DatabaseCluster', **defaults))
+
+    template.add_output(Output(
+        'DatabaseClusterEndpoint',
+        Description='Writer endpoint',
+        Value=GetAtt(cluster, 'Endpoint.Address'),
+    ))
+    template.add_output(Output(
+        'DatabaseReaderEndpoint',
+        Description='Endpoint balancing connections over the readers',
+        Value=GetAtt(cluster, 'ReadEndpoint.Address'),
+    ))
+    return cluster
+
+
+def _mapping_key(name):
+    return ''.join(word.title() for word in name.split('_'))
+
+
+def add_parameter_group(template, title, tuning, instance_class):
+    """Add a parameter group with tuning's preset for the class picked in the instance_class parameter."""
+    table = rds_catalog.tuning_table(tuning.engine)
+    if 'DatabaseTuning' not in template.mappings:
+        template.add_mapping('DatabaseTuning', {
+            name: {_mapping_key(k): str(v) for k, v in settings.items()} for name, settings in table.items()
+        })
+
+    parameters = table[INSTANCE_CLASSES[0]]
+    return template.add_resource(rds.DBParameterGroup(
+        title,
+        Description=Sub('${AWS::StackName} %s tuned for ${%s}' % (tuning.family, instance_class.title)),
+        Family=tuning.family,
+        Parameters={k: FindInMap('DatabaseTuning', Ref(instance_class), _mapping_key(k)) for k in parameters},
+    ))
+
+
+def database_tuning(template, database, tuning):
+    """Return the Database properties attaching a parameter group tuned for its instance class."""
+    if tuning is None:
+        return {}
+    group = add_parameter_group(template, 'DatabaseParameterGroup', tuning, database.instance_class)
+    return dict(
+        DBParameterGroupName=Ref(group),
+        EngineVersion=Ref(tuning.engine_version),
+    )
+
+
+def database_monitoring(template, monitoring):
+    """
+    Return the Database properties enabling Performance Insights and
+    Enhanced Monitoring, adding the role Enhanced Monitoring publishes with.
+    """
+    if monitoring is None:
+        return {}
+    properties = {}
+    if monitoring.performance_insights_retention is not None:
+        properties.update(
+            EnablePerformanceInsights=True,
+            PerformanceInsightsRetentionPeriod=Ref(monitoring.performance_insights_retention),
+        )
+    if monitoring.monitoring_interval is not None:
+        role = template.add_resource(iam.Role(
+            'DatabaseMonitoringRole',
+            AssumeRolePolicyDocument=PolicyDocument(Version='2012-10-17', Statement=[Statement(
+                Effect=Allow,
+                Principal=Principal('Service', 'monitoring.rds.amazonaws.com'),
+                Action=[sts.AssumeRole],
+            )]),
+            ManagedPolicyArns=[
+                Sub('arn:${AWS::Partition}:iam::aws:policy/service-role/AmazonRDSEnhancedMonitoringRole'),
+            ],
+        ))
+        properties.update(
+            MonitoringInterval=Ref(monitoring.monitoring_interval),
+            MonitoringRoleArn=GetAtt(role, 'Arn'),
+        )
+    return properties
+
+
+def add_database_alarms(template, monitoring, db_instance):
+    """Alarm on the DATABASE_ALARMS metrics of db_instance, notifying the alarm email."""
+    if monitoring is None or monitoring.alarm_email is None:
+        return []
+
+    notifications = template.add_resource(sns.Topic(
+        'DatabaseNotifications',
+        Subscription=[
+            sns.Subscription(
+                Endpoint=Ref(monitoring.alarm_email),
+                Protocol='email'
+            ),
+        ]
+    ))
+
+    alarms = []
+    for metric, (comparison, _, _) in DATABASE_ALARMS.items():
+        alarms.append(template.add_resource(cloudwatch.Alarm(
+            'Database{}Alarm'.format(metric),
+            AlarmActions=[Ref(notifications)],
+            AlarmDescription=Sub('{} of ${{{}}}'.format(metric, db_instance.title)),
+            ComparisonOperator=comparison,
+            Dimensions=[
+                cloudwatch.MetricDimension(Name='DBInstanceIdentifier', Value=Ref(db_instance))
+            ],
+            EvaluationPeriods=5,
+            MetricName=metric,
+            Namespace='AWS/RDS',
+            OKActions=[Ref(notifications)],
+            Period=60,  # seconds
+            Statistic='Average',
+            Threshold=Ref(monitoring.alarm_thresholds[metric]),
+        )))
+    return alarms
+
+
+def add_read_replicas(template, database, db_instance, replicas, zones=None, tuning=None, cluster=None,
+                      **properties):
+    """
+    Add a read replica of db_instance for each instance class parameter in
+    replicas, rotating over zones (the first two of the region by default).
+    With tuning, each replica gets a parameter group tuned for its class.
+    With cluster, they are Aurora readers of the cluster instead.
+    properties are passed to every replica, e.g. its security groups.
+    """
+    zones = zones or [Select(0, GetAZs('')), Select(1, GetAZs(''))]
+    instances = []
+    for index, instance_class in enumerate(replicas, 1):
+        replica = dict(
+            AvailabilityZone=zones[(index - 1) % len(zones)],
+            DBInstanceClass=Ref(instance_class),
+            DeletionPolicy='Delete',  # replicas cannot be snapshotted
+            Engine=Ref(database.engine),
+            PubliclyAccessible=True,
+            SourceDBInstanceIdentifier=Ref(db_instance),
+        )
+        if tuning is not None:
+            replica['DBParameterGroupName'] = Ref(add_parameter_group(
+                template, 'DatabaseReplica{}ParameterGroup'.format(index), tuning, instance_class))
+        replica.update(properties)
+        if cluster is not None:
+            for name in CLUSTER_PROPERTIES + ('SourceDBInstanceIdentifier',):
+                replica.pop(name, None)
+            replica['DBClusterIdentifier'] = Ref(cluster)
+            replica['DependsOn'] = [db_instance.title]  # the first instance of a cluster is its writer
+        instances.append(template.add_resource(rds.DBInstance('DatabaseReplica{}'.format(index), **replica)))
+        template.add_output(Output(
+            'DatabaseReplica{}Endpoint'.format(index),
+            Value=GetAtt(instances[-1], 'Endpoint.Address'),
+        ))
+
+    if instances:
+        template.add_output(Output(
+            'DatabaseReplicaEndpoints',
+            Description='Comma separated endpoints to route reads to',
+            Value=Join(',', [GetAtt(instance, 'Endpoint.Address') for instance in instances]),
+        ))
+    return instances
+
+
+def add_reader_autoscaling(template, aurora, cluster, readers):
+    """Let Application Auto Scaling add and remove readers of cluster on top of readers."""
+    if aurora is None or aurora.reader_min_count is None:
+        return None
+
+    target = template.add_resource(applicationautoscaling.ScalableTarget(
+        'DatabaseReaderScalableTarget',
+        DependsOn=[reader.title for reader in readers],
+        MaxCapacity=Ref(aurora.reader_max_count),
+        MinCapacity=Ref(aurora.reader_min_count),
+        ResourceId=Sub('cluster:${%s}' % cluster.title),
+        ScalableDimension='rds:cluster:ReadReplicaCount',
+        ServiceNamespace='rds',
+    ))
+
+    return template.add_resource(applicationautoscaling.ScalingPolicy(
+        'DatabaseReaderScalingPolicy',
+        PolicyName=Sub('${AWS::StackName}-readers'),
+        PolicyType='TargetTrackingScaling',
+        ScalingTargetId=Ref(target),
+        TargetTrackingScalingPolicyConfiguration=applicationautoscaling.TargetTrackingScalingPolicyConfiguration(
+            PredefinedMetricSpecification=applicationautoscaling.PredefinedMetricSpecification(
+                PredefinedMetricType=Ref(aurora.reader_scaling_metric),
+            ),
+            ScaleInCooldown=300,  # seconds
+            ScaleOutCooldown=60,
+            TargetValue=Ref(aurora.reader_scaling_target),
+        ),
+    ))
+
+
+def add_database_proxy(template, database, proxy, db_instance, security_group, subnets=None, self_rules=True):
+    """
+    Put an RDS Proxy in front of db_instance, or of an Aurora cluster,
+    pooling connections with the master credentials of the database secret,
+    see add_database_parameters.
+
+    The proxy joins security_group; self_rules lets members of the group
+    reach each other on the engine's port, for groups that do not already.
+    subnets defaults to the proxy's subnets parameter.
+    """
+    template.add_mapping('DatabaseEngineFamily', {
+        engine: {'Family': family, 'Port': str(FAMILY_PORTS[family])}
+        for engine, family in sorted(ENGINE_FAMILIES.items())
+    })
+    template.add_rule('DatabaseProxyEngine', {
+        'Assertions': [{
+            'Assert': {'Fn::Contains': [sorted(ENGINE_FAMILIES), Ref(database.engine)]},
+            'AssertDescription': 'RDS Proxy does not support oracle engines',
+        }],
+    })
+    port = FindInMap('DatabaseEngineFamily', Ref(database.engine), 'Port')
+
+    if database.secret is None:
+        raise ValueError('the proxy authenticates with the database secret, add the database parameters with secret')
+    secret = database.secret
+
+    role = template.add_resource(iam.Role(
+        'DatabaseProxyRole',
+        AssumeRolePolicyDocument=PolicyDocument(Version='2012-10-17', Statement=[Statement(
+            Effect=Allow,
+            Principal=Principal('Service', 'rds.amazonaws.com'),
+            Action=[sts.AssumeRole],
+        )]),
+        Policies=[iam.Policy(
+            PolicyName='DatabaseSecret',
+            PolicyDocument=PolicyDocument(Version='2012-10-17', Statement=[Statement(
+                Effect=Allow,
+                Action=[secretsmanager.GetSecretValue],
+                Resource=[Ref(secret)],
+            )]),
+        )],
+    ))
+
+    if self_rules:
+        template.add_resource(ec2.SecurityGroupIngress(
+            'DatabaseProxySecurityGroupIngress',
+            GroupId=security_group,
+            SourceSecurityGroupId=security_group,
+            FromPort=port,
+            IpProtocol='tcp',
+            ToPort=port,
+        ))
+        template.add_resource(ec2.SecurityGroupEgress(
+            'DatabaseProxySecurityGroupEgress',
+            GroupId=security_group,
+            DestinationSecurityGroupId=security_group,
+            FromPort=port,
+            IpProtocol='tcp',
+            ToPort=port,
+        ))
+
+    db_proxy = template.add_resource(rds.DBProxy(
+        'DatabaseProxy',
+        Auth=[rds.AuthFormat(AuthScheme='SECRETS', IAMAuth='DISABLED', SecretArn=Ref(secret))],
+        DBProxyName=Sub('${AWS::StackName}-proxy'),
+        EngineFamily=FindInMap('DatabaseEngineFamily', Ref(database.engine), 'Family'),
+        IdleClientTimeout=Ref(proxy.idle_client_timeout),
+        RequireTLS=True,
+        RoleArn=GetAtt(role, 'Arn'),
+        VpcSecurityGroupIds=[security_group],
+        VpcSubnetIds=subnets if subnets is not None else Ref(proxy.subnets),
+    ))
+
+    if isinstance(db_instance, rds.DBCluster):
+        targets = dict(DBClusterIdentifiers=[Ref(db_instance)])
+    else:
+        targets = dict(DBInstanceIdentifiers=[Ref(db_instance)])
+    template.add_resource(rds.DBProxyTargetGroup(
+        'DatabaseProxyTargetGroup',
+        ConnectionPoolConfigurationInfo=rds.ConnectionPoolConfigurationInfoFormat(
+            ConnectionBorrowTimeout=Ref(proxy.connection_borrow_timeout),
+            MaxConnectionsPercent=Ref(proxy.max_connections_percent),
+            MaxIdleConnectionsPercent=Ref(proxy.max_idle_connections_percent),
+        ),
+        DBProxyName=Ref(db_proxy),
+        TargetGroupName='default',
+        **targets
+    ))
+
+    template.add_output(Output(
+        'DatabaseProxyEndpoint',
+        Description='Connect through this endpoint instead of the database',
+        Value=GetAtt(db_proxy, 'Endpoint'),
+    ))
+
+    return db_proxy
+# endregion
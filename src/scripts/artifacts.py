@@ -0,0 +1,74 @@
+"""
+Content-addressed store of rendered templates.
+
+Every rendered template is serialized canonically and stored once under
+dist/objects/<sha256>.json. dist/manifest.json maps each template name to the
+hash of its current content, so comparing it with the manifest of the last
+deployment tells which stacks actually need a change set.
+"""
+
+import hashlib
+import json
+import os
+
+from template_output import canonical
+
+OBJECTS_DIR = 'objects'
+MANIFEST_FILE = 'manifest.json'
+DEPLOYED_MANIFEST_FILE = 'deployed-manifest.json'
+
+
+def object_path(dist, sha):
+    return os.path.join(dist, OBJECTS_DIR, sha + '.json')
+
+
+def store(dist, data):
+    """Store the canonical form of a template dictionary and return its hash."""
+    body = canonical(data).encode()
+    sha = hashlib.sha256(body).hexdigest()
+    path = object_path(dist, sha)
+    if not os.path.isfile(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, concurrent builders may store the same object
+        partial = '{}.{}.tmp'.format(path, os.getpid())
+        with open(partial, 'wb') as f:
+            f.write(body)
+        os.replace(partial, path)
+    return sha
+
+
+def load_manifest(path):
+    """Return the {name: sha256} manifest at path, empty if there is none."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(path, manifest):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def changed(manifest, deployed):
+    """Return the sorted names whose content differs from the deployed manifest."""
+    return sorted(name for name, sha in manifest.items() if deployed.get(name) != sha)
+
+
+def removed(manifest, deployed):
+    """Return the sorted names deployed but no longer rendered."""
+    return sorted(set(deployed) - set(manifest))
+
+
+def mark_deployed(manifest, deployed, names=None):
+    """Return deployed updated with the current hash of names, all templates by default."""
+    names = manifest if names is None else names
+    missing = [name for name in names if name not in manifest]
+    if missing:
+        raise KeyError('not in the manifest: {}'.format(', '.join(missing)))
+    updated = dict(deployed)
+    updated.update((name, manifest[name]) for name in names)
+    return updated
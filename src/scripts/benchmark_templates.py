@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Benchmark template generation and gate regressions against a stored baseline.
+
+Every case is measured in a fresh interpreter so the import cost is real:
+
+    import     cold import of the template module, troposphere included
+    build      call of the template's build() factory after a warm-up one
+    serialize  Template.to_json()
+    peak       peak memory allocated while building and serializing (bytes)
+    output     size of the rendered JSON (bytes)
+
+Timings are the best of --repeat runs. Besides the templates under src, the
+synthetic cases build rds-cidrs-template with thousands of region CIDRs.
+What the templates memoize is cleared before every measured build, so rule
+construction is timed every time instead of a cache hit.
+
+peak and output do not depend on the machine, they are gated against the
+committed benchmarks/baseline.json. Timings are only comparable on the
+machine that recorded them, so they are compared with benchmarks/timings.json,
+which --save records locally and git ignores. Timing regressions are warnings
+unless --gate-timings is given, for quiet machines such as a dedicated runner.
+
+Usage:
+    python src/scripts/benchmark_templates.py             # compare with the baseline
+    python src/scripts/benchmark_templates.py --save      # record a new baseline and local timings
+"""
+
+import argparse
+import ipaddress
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import registry
+
+BASELINE = os.path.join('benchmarks', 'baseline.json')
+TIMINGS = os.path.join('benchmarks', 'timings.json')
+METRICS = ('import', 'build', 'serialize', 'peak', 'output')
+# Same on every machine with the same dependencies
+DETERMINISTIC_METRICS = ('peak', 'output')
+TIMING_METRICS = ('import', 'build', 'serialize')
+
+# Differences below these are noise, whatever the relative change. A cold
+# import is timed once per interpreter, it varies with the disk cache and
+# other processes as much as interpreter startup itself.
+NOISE_FLOOR = {
+    'import': 0.05,
+    'build': 0.002,
+    'serialize': 0.002,
+    'peak': 64 * 1024,
+    'output': 0,
+}
+
+SYNTHETIC_TEMPLATE = 'rds-cidrs-template'
+SYNTHETIC_PREFIX = 'synthetic:rds-cidrs-template:'
+
+
+# region Cases
+def synthetic_cidrs(count):
+    """Return count distinct /24 blocks, standing in for a region's EC2 prefixes."""
+    network = ipaddress.ip_network('10.0.0.0/8')
+    return [str(subnet) for _, subnet in zip(range(count), network.subnets(new_prefix=24))]
+
+
+def cases(src, cidr_counts):
+    """Return (name, path, region CIDR count) for every case, the count is None for plain templates."""
+    entries = registry.discover(src)
+    found = [(entry.name, entry.path, None) for entry in entries.values()]
+    for count in cidr_counts:
+        found.append((SYNTHETIC_PREFIX + str(count), entries[SYNTHETIC_TEMPLATE].path, count))
+    return found
+# endregion
+
+
+# region Measurement
+def clear_memos(path):
+    """Clear the functools caches of the modules loaded from the template's directory."""
+    directory = os.path.dirname(os.path.abspath(path))
+    for module in list(sys.modules.values()):
+        filename = getattr(module, '__file__', None)
+        if not filename or os.path.dirname(os.path.abspath(filename)) != directory:
+            continue
+        for value in list(vars(module).values()):
+            if callable(getattr(value, 'cache_clear', None)):
+                value.cache_clear()
+
+
+def measure(path, region_cidrs, repeat):
+    """Measure one case. Must run in a fresh interpreter, see run_case."""
+    config = None
+    if region_cidrs is not None:
+        # As many security groups as the CIDRs need, whatever the ENI quota
+        config = {'region_cidrs': synthetic_cidrs(region_cidrs), 'groups_per_interface': region_cidrs}
+
+    start = time.perf_counter()
+    module = registry.load_module(path)
+    import_time = time.perf_counter() - start
+
+    # Warm-up, first calls also import what the templates load lazily
+    registry.build_template(module, config)
+
+    build_times = []
+    for _ in range(repeat):
+        clear_memos(path)
+        start = time.perf_counter()
+        template = registry.build_template(module, config)
+        build_times.append(time.perf_counter() - start)
+
+    serialize_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = template.to_json()
+        serialize_times.append(time.perf_counter() - start)
+
+    clear_memos(path)
+    tracemalloc.start()
+    registry.build_template(module, config).to_json()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'import': import_time,
+        'build': min(build_times),
+        'serialize': min(serialize_times),
+        'peak': peak,
+        'output': len(body.encode()),
+    }
+
+
+def run_case(path, region_cidrs, repeat):
+    command = [sys.executable, os.path.abspath(__file__), '--measure', path, '--repeat', str(repeat)]
+    if region_cidrs is not None:
+        command += ['--region-cidrs', str(region_cidrs)]
+    result = subprocess.run(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    if result.returncode:
+        raise RuntimeError('{} failed:\n{}'.format(path, result.stderr))
+    return json.loads(result.stdout)
+# endregion
+
+
+# region Baseline
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, results, metrics=METRICS):
+    """Save the given metrics of results."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({case: {metric: values[metric] for metric in metrics} for case, values in results.items()},
+                  f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def regressions(baseline, results, threshold, metrics=METRICS):
+    """Yield (case, metric, before, after) for every one of metrics worse than threshold."""
+    for case, values in sorted(results.items()):
+        before = baseline.get(case)
+        if before is None:
+            continue
+        for metric in metrics:
+            if metric not in before:
+                continue
+            delta = values[metric] - before[metric]
+            if delta > NOISE_FLOOR[metric] and delta > before[metric] * threshold:
+                yield case, metric, before[metric], values[metric]
+# endregion
+
+
+def report(results, out=sys.stdout):
+    width = max(len(case) for case in results)
+    out.write('{:<{w}}  {:>9}  {:>9}  {:>9}  {:>10}  {:>10}\n'.format(
+        'case', 'import s', 'build s', 'ser. s', 'peak B', 'output B', w=width))
+    for case, m in sorted(results.items()):
+        out.write('{:<{w}}  {:>9.4f}  {:>9.4f}  {:>9.4f}  {:>10}  {:>10}\n'.format(
+            case, m['import'], m['build'], m['serialize'], m['peak'], m['output'], w=width))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark CloudFormation template generation.')
+    parser.add_argument('--src', default='src', help='directory searched for templates')
+    parser.add_argument('--cidrs', type=int, nargs='*', default=[1000, 5000],
+                        help='CIDR counts of the synthetic rds-cidrs-template cases')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per timing, the best one is kept')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline file of the peak and output metrics')
+    parser.add_argument('--timings', default=TIMINGS, help='baseline file of the timings, local to this machine')
+    parser.add_argument('--save', action='store_true', help='record the results as the new baselines')
+    parser.add_argument('--gate-timings', action='store_true', help='fail on timing regressions too')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed relative regression per metric, 0.25 means 25%%')
+    parser.add_argument('--measure', help=argparse.SUPPRESS)
+    parser.add_argument('--region-cidrs', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.measure:
+        json.dump(measure(args.measure, args.region_cidrs, args.repeat), sys.stdout)
+        return 0
+
+    results = {}
+    for name, path, region_cidrs in cases(args.src, args.cidrs):
+        results[name] = run_case(path, region_cidrs, args.repeat)
+    report(results)
+
+    if args.save:
+        save_baseline(args.baseline, results, DETERMINISTIC_METRICS)
+        save_baseline(args.timings, results, TIMING_METRICS)
+        print('* baseline saved to {}, timings to {}'.format(args.baseline, args.timings))
+        return 0
+
+    if not os.path.isfile(args.baseline):
+        # Nothing to gate against is a failure, not a pass
+        print('! no baseline at {}, run with --save (make bench-baseline) to create one'.format(args.baseline))
+        return 1
+
+    failed = list(regressions(load_baseline(args.baseline), results, args.threshold, DETERMINISTIC_METRICS))
+    for case, metric, before, after in failed:
+        print('! {} {} regressed: {:g} -> {:g}'.format(case, metric, before, after))
+
+    if not os.path.isfile(args.timings):
+        print('* no timings at {}, run with --save (make bench-baseline) to record this machine\'s'.format(
+            args.timings))
+        return 1 if failed else 0
+    slower = list(regressions(load_baseline(args.timings), results, args.threshold, TIMING_METRICS))
+    for case, metric, before, after in slower:
+        print('{} {} {} slower: {:g} -> {:g}'.format('!' if args.gate_timings else '?', case, metric, before, after))
+    return 1 if failed or (slower and args.gate_timings) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Build every registered CloudFormation template under src into dist.
+
+Troposphere is imported once and shared by a pool of worker processes, each
+template is rendered in-process instead of through a fresh interpreter, and
+templates whose source and local imports did not change since the last build
+are skipped. The build cache lives in dist/.build-cache.json.
+
+Every rendered template is also kept in the content-addressed store of
+artifacts.py, dist/manifest.json records the hash of each template.
+
+Templates are checked against a CloudFormation size limit and, with --split,
+partitioned into nested stacks when they do not fit.
+
+Usage:
+    python src/scripts/build_templates.py [--jobs N] [--force]
+        [--format json|minified|yaml] [--limit inline|s3|none] [--split] [TEMPLATE ...]
+"""
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import artifacts
+import registry
+import template_output
+
+CACHE_FILE = '.build-cache.json'
+
+
+# region Dependencies
+def target_for(path, src, dist, fmt='json'):
+    """Map src/<dir>/<name>.py to dist/<dir>/<name>.json, as the Makefile does."""
+    relative = os.path.relpath(path, src)
+    return os.path.join(dist, os.path.splitext(relative)[0] + template_output.EXTENSIONS[fmt])
+
+
+def local_imports(path, seen=None):
+    """
+    Return the local modules imported by path, recursively.
+
+    Only modules living next to the importing file are considered local,
+    everything else (troposphere, the standard library) is versioned through
+    the troposphere version in the cache key.
+    """
+    seen = set() if seen is None else seen
+    directory = os.path.dirname(path)
+    with open(path, 'rb') as f:
+        tree = ast.parse(f.read(), filename=path)
+
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module.split('.')[0])
+
+    for name in sorted(names):
+        candidate = os.path.join(directory, name + '.py')
+        if os.path.isfile(candidate) and candidate not in seen:
+            seen.add(candidate)
+            local_imports(candidate, seen)
+    return sorted(seen)
+# endregion
+
+
+# region Cache
+def digest(path, deps, options=None):
+    """
+    Hash a template together with its local imports, the troposphere version
+    and the output options.
+    """
+    import troposphere
+    sha = hashlib.sha256(troposphere.__version__.encode())
+    sha.update(json.dumps(options or {}, sort_keys=True).encode())
+    for name in [path] + list(deps):
+        sha.update(name.encode())
+        with open(name, 'rb') as f:
+            sha.update(f.read())
+    return sha.hexdigest()
+
+
+def load_cache(dist):
+    try:
+        with open(os.path.join(dist, CACHE_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(dist, cache):
+    os.makedirs(dist, exist_ok=True)
+    with open(os.path.join(dist, CACHE_FILE), 'w') as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+
+
+def is_fresh(path, target, entry, options=None):
+    """True if target exists and was rendered from the same inputs as path."""
+    if not entry or not os.path.isfile(target):
+        return False
+    if not all(os.path.isfile(dep) for dep in entry.get('deps', [])):
+        return False
+    return digest(path, entry['deps'], options) == entry.get('hash')
+# endregion
+
+
+# region Rendering
+class TemplateTooLarge(Exception):
+    pass
+
+
+def write(target, body):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'w') as f:
+        f.write(body + '\n')
+
+
+def render(path, target, dist, fmt='json', limit=None, split=False):
+    """
+    Render path into target and return the files written and the hash of the
+    template in the artifact store.
+
+    When the template is larger than limit bytes it is either split into
+    nested stacks, written next to target as <name>-N<extension>, or rejected
+    with a report of the bytes used by each section. Runs inside a worker
+    process.
+    """
+    data = registry.load_template(path).to_dict()
+    sha = artifacts.store(dist, data)
+    body = template_output.serialize(data, fmt)
+    too_many = len(data.get('Resources', {})) > template_output.MAX_RESOURCES
+    if not limit or (len(body.encode()) <= limit and not too_many):
+        write(target, body)
+        return [target], sha
+
+    if not split:
+        raise TemplateTooLarge('{} is over the {} bytes / {} resources limit\n{}'.format(
+            target, limit, template_output.MAX_RESOURCES,
+            template_output.format_report(template_output.size_report(data, fmt))))
+
+    stem, extension = os.path.splitext(target)
+    parent, children = template_output.split(data, limit, fmt, name=os.path.basename(stem))
+    written = [target]
+    write(target, template_output.serialize(parent, fmt))
+    for index, child in enumerate(children, 1):
+        written.append('{}-{}{}'.format(stem, index, extension))
+        write(written[-1], template_output.serialize(child, fmt))
+    return written, sha
+
+
+def select(entries, templates):
+    """
+    Return the entries named by templates, given as template names or source
+    files, all of them if templates is empty.
+    """
+    if not templates:
+        return list(entries.values())
+    paths = {os.path.abspath(entry.path): entry for entry in entries.values()}
+    selected = []
+    for template in templates:
+        entry = entries.get(template) or paths.get(os.path.abspath(template))
+        if entry is None:
+            raise registry.TemplateNotFound('no template named or defined in {}'.format(template))
+        selected.append(entry)
+    return selected
+
+
+def build(src='src', dist='dist', jobs=None, force=False, fmt='json', limit=None, split=False, log=print,
+          templates=None):
+    """
+    Render all stale templates under src into dist, or only the given
+    templates (see select).
+
+    Returns the number of templates that failed to render.
+    """
+    options = {'format': fmt, 'limit': limit, 'split': split}
+    cache = load_cache(dist)
+    manifest_path = os.path.join(dist, artifacts.MANIFEST_FILE)
+    previous = artifacts.load_manifest(manifest_path)
+    entries = registry.discover(src)
+    selected = select(entries, templates)
+    # Templates left out of this build or failing it keep their last good hash, they were not removed
+    manifest = {name: sha for name, sha in previous.items() if name in entries}
+    pending = {}
+    for entry in selected:
+        path = entry.path
+        target = target_for(path, src, dist, fmt)
+        sha = previous.get(entry.name)
+        if not force and sha and os.path.isfile(artifacts.object_path(dist, sha)) and \
+                is_fresh(path, target, cache.get(target), options):
+            continue
+        deps = local_imports(path)
+        pending[target] = (entry.name, path, deps, digest(path, deps, options))
+
+    failures = 0
+    if pending:
+        # Forked workers start with troposphere already imported, otherwise each
+        # worker imports it once, never once per template.
+        import troposphere  # noqa: F401
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {
+                target: pool.submit(render, path, target, dist, fmt, limit, split)
+                for target, (_, path, _, _) in sorted(pending.items())
+            }
+            for target, future in futures.items():
+                name, path, deps, key = pending[target]
+                try:
+                    written, manifest[name] = future.result()
+                except Exception as e:
+                    failures += 1
+                    cache.pop(target, None)
+                    log('! failed {}: {}: {}'.format(path, type(e).__name__, e))
+                    continue
+                cache[target] = {'source': path, 'deps': deps, 'hash': key}
+                log('* building {}...'.format(target))
+                for nested in written[1:]:
+                    log('  nested stack {}'.format(nested))
+
+    # Forget templates that no longer exist
+    for target in list(cache):
+        if not os.path.isfile(cache[target].get('source', '')):
+            del cache[target]
+    save_cache(dist, cache)
+    artifacts.save_manifest(manifest_path, manifest)
+    return failures
+# endregion
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build CloudFormation templates.')
+    parser.add_argument('--src', default='src', help='directory searched for templates')
+    parser.add_argument('--dist', default='dist', help='directory receiving rendered templates')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='worker processes, defaults to the CPU count')
+    parser.add_argument('-f', '--force', action='store_true', help='ignore the build cache')
+    parser.add_argument('--format', choices=template_output.FORMATS, default='json', help='output format')
+    parser.add_argument('--limit', choices=sorted(template_output.LIMITS) + ['none'], default='s3',
+                        help='CloudFormation body size limit templates must fit in')
+    parser.add_argument('--split', action='store_true', help='split templates over the limit into nested stacks')
+    parser.add_argument('templates', nargs='*', metavar='TEMPLATE',
+                        help='template names or source files to build, defaults to every template')
+    args = parser.parse_args(argv)
+
+    try:
+        failures = build(args.src, args.dist, jobs=args.jobs, force=args.force, fmt=args.format,
+                         limit=template_output.LIMITS.get(args.limit), split=args.split, templates=args.templates)
+    except registry.TemplateNotFound as e:
+        parser.error(str(e))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+cfn-templates: list, render and build the templates under src.
+
+Usage:
+    cfn_templates.py list
+    cfn_templates.py render NAME [--format json|minified|yaml]
+    cfn_templates.py build [build_templates.py options]
+    cfn_templates.py matrix MATRIX [render_matrix.py options]
+    cfn_templates.py changed [--deployed PATH]
+    cfn_templates.py deployed [NAME ...] [--deployed PATH]
+
+Listing reads template metadata without executing anything, rendering imports
+only the requested template and the troposphere modules it uses.
+
+changed lists the templates whose last build differs from the deployed
+manifest, deployed records the current build of some or all templates as
+deployed once their stacks are updated.
+"""
+
+import argparse
+import os
+import sys
+
+import registry
+
+
+def list_templates(args):
+    for entry in registry.discover(args.src).values():
+        print('{}\t{}'.format(entry.name, entry.path))
+    return 0
+
+
+def render_template(args):
+    import template_output
+
+    entry = registry.find(args.name, args.src)
+    data = registry.load_template(entry.path).to_dict()
+    print(template_output.serialize(data, args.format))
+    return 0
+
+
+def build_templates(args):
+    import build_templates
+
+    return build_templates.main(['--src', args.src] + args.options)
+
+
+def render_matrix(args):
+    import render_matrix
+
+    return render_matrix.main([args.matrix, '--src', args.src] + args.options)
+
+
+def manifests(args):
+    import artifacts
+
+    manifest = artifacts.load_manifest(os.path.join(args.dist, artifacts.MANIFEST_FILE))
+    deployed_path = args.deployed or os.path.join(args.dist, artifacts.DEPLOYED_MANIFEST_FILE)
+    return manifest, deployed_path, artifacts.load_manifest(deployed_path)
+
+
+def changed_templates(args):
+    import artifacts
+
+    manifest, _, deployed = manifests(args)
+    for name in artifacts.changed(manifest, deployed):
+        print(name)
+    if args.removed:
+        for name in artifacts.removed(manifest, deployed):
+            print(name)
+    return 0
+
+
+def deployed_templates(args):
+    import artifacts
+
+    manifest, deployed_path, deployed = manifests(args)
+    try:
+        deployed = artifacts.mark_deployed(manifest, deployed, args.names or None)
+    except KeyError as e:
+        raise registry.TemplateNotFound(e.args[0])
+    artifacts.save_manifest(deployed_path, deployed)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='cfn-templates', description='CloudFormation templates.')
+    parser.add_argument('--src', default='src', help='directory searched for templates')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    command = commands.add_parser('list', help='list the available templates')
+    command.set_defaults(func=list_templates)
+
+    command = commands.add_parser('render', help='print one template')
+    command.add_argument('name', help='template name, as shown by list')
+    command.add_argument('--format', choices=('json', 'minified', 'yaml'), default='json', help='output format')
+    command.set_defaults(func=render_template)
+
+    command = commands.add_parser('build', help='build every stale template into dist')
+    command.add_argument('options', nargs=argparse.REMAINDER, help='options passed on to build_templates.py')
+    command.set_defaults(func=build_templates)
+
+    command = commands.add_parser('matrix', help='render environment x region variants')
+    command.add_argument('matrix', help='matrix JSON file')
+    command.add_argument('options', nargs=argparse.REMAINDER, help='options passed on to render_matrix.py')
+    command.set_defaults(func=render_matrix)
+
+    for name, func, description in (
+            ('changed', changed_templates, 'list templates that differ from the deployed ones'),
+            ('deployed', deployed_templates, 'record the built templates as deployed')):
+        command = commands.add_parser(name, help=description)
+        command.add_argument('--dist', default='dist', help='directory holding the built templates')
+        command.add_argument('--deployed', help='deployed manifest, defaults to dist/deployed-manifest.json')
+        command.set_defaults(func=func)
+    commands.choices['changed'].add_argument(
+        '--removed', action='store_true', help='also list deployed templates that no longer exist')
+    commands.choices['deployed'].add_argument('names', nargs='*', help='templates to record, all by default')
+
+    args = parser.parse_args(argv)
+    try:
+        return args.func(args)
+    except registry.TemplateNotFound as e:
+        parser.exit(2, 'cfn-templates: {}\n'.format(e))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
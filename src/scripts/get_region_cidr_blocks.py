@@ -1,28 +1,98 @@
 #!/usr/bin/env python3
 
-import json
+import argparse
 import sys
 from pprint import pprint
-from urllib.request import urlopen
+
+import ip_ranges
 
 # region User Input
-with urlopen("https://ip-ranges.amazonaws.com/ip-ranges.json") as url:
-    data = json.loads(url.read().decode())
+parser = argparse.ArgumentParser(description='Print the CIDR blocks AWS uses in a region.')
+parser.add_argument('region', nargs='?', help='region, e.g. us-east-1')
+parser.add_argument('--batch', metavar='FILE',
+                    help='write the blocks of every region and service to FILE instead, see --batch-format')
+parser.add_argument('--batch-format', choices=('json', 'csv'), default='json', help='format of the batch file')
+parser.add_argument('--diff', nargs=2, metavar=('OLD', 'NEW'),
+                    help='print the blocks added and removed between two cached snapshots, by syncToken')
+parser.add_argument('--lookup', nargs='*', metavar='ADDRESS',
+                    help='print the prefix, region and service owning each address, read from stdin when none given')
+parser.add_argument('--lookup-file', metavar='FILE', help='look up the addresses in FILE, one per line')
+parser.add_argument('--regions', nargs='*', help='only write or diff these regions')
+parser.add_argument('--services', nargs='*', help='only write or diff these services')
+parser.add_argument('--service', default='EC2', help='service the blocks belong to (default: EC2)')
+parser.add_argument('--ipv6', action='store_true', help='print the IPv6 blocks instead of the IPv4 ones')
+parser.add_argument('--aggregate', action='store_true',
+                    help='merge adjacent and overlapping blocks into the fewest covering the same addresses')
+parser.add_argument('--supernet', type=int, metavar='N',
+                    help='also merge blocks sharing a supernet of /N or smaller, admitting extra addresses')
+parser.add_argument('--file', help='read this ip-ranges.json instead of the cached download')
+parser.add_argument('--offline', action='store_true', help='never download, use the cached dataset')
+parser.add_argument('--max-age', type=int, default=ip_ranges.DEFAULT_MAX_AGE,
+                    help='seconds before the cached dataset is revalidated (default: %(default)s)')
+parser.add_argument('--url', default=ip_ranges.URL, help='location of ip-ranges.json (default: %(default)s)')
+parser.add_argument('--cache-dir', help='cache directory (default: {})'.format(ip_ranges.default_cache_dir()))
+args = parser.parse_args()
+
+try:
+    if args.diff:
+        old, new = (ip_ranges.load_snapshot(args.cache_dir, token) for token in args.diff)
+        changes = ip_ranges.diff(old, new, args.regions, args.services)
+        for region, services in sorted(changes.items()):
+            for service, change in sorted(services.items()):
+                print('{} {}'.format(region, service))
+                for cidr in change['added']:
+                    print('  + {}'.format(cidr))
+                for cidr in change['removed']:
+                    print('  - {}'.format(cidr))
+        exit(0)
+    if args.file:
+        data = ip_ranges.IpRanges.from_file(args.file)
+    else:
+        data = ip_ranges.load(args.cache_dir, max_age=args.max_age, offline=args.offline, url=args.url)
+except ip_ranges.IpRangesUnavailable as e:
+    print('ERROR: {}'.format(e))
+    exit(1)
+
+all_regions = data.regions()
+
+if args.batch:
+    sets = data.cidr_sets(args.regions, args.services, aggregated=args.aggregate)
+    ip_ranges.write_cidr_sets(data, sets, args.batch, args.batch_format)
+    exit(0)
 
-all_regions = list(set([p['region'] for p in data['prefixes']]))
-all_regions.sort()
+if args.lookup is not None or args.lookup_file:
+    if args.lookup_file:
+        with open(args.lookup_file) as f:
+            addresses = f.read().splitlines()
+    else:
+        addresses = args.lookup or sys.stdin
+    owners = data.owners()
+    for line in addresses:
+        address = line.strip()
+        if not address:
+            continue
+        try:
+            found = owners.lookup(address)
+        except ValueError:
+            sys.stderr.write('warning: {!r} is not an IP address\n'.format(address))
+            continue
+        for owner in found or [ip_ranges.Owner('-', '-', '-', '-')]:
+            print('\t'.join([address, owner.prefix, owner.region, owner.service]))
+    exit(0)
 
-if len(sys.argv) < 2:
+if not args.region:
     print('ERROR: pass one of the following regions as an argument.\n{}'.format(all_regions))
     exit(1)
 
-region = sys.argv[1]
+region = args.region
+# endregion
 
-region_cidrs = set()
-for p in data['prefixes']:
-    if p['region'] == region and p['service'] == 'EC2':
-        region_cidrs.add(p['ip_prefix'])
-region_cidrs = list(region_cidrs)
-region_cidrs.sort()
+cidrs = data.prefixes(region, args.service, ipv6=args.ipv6)
+if args.supernet is not None:
+    count = len(cidrs)
+    cidrs, extra = ip_ranges.supernets(cidrs, args.supernet)
+    sys.stderr.write('{} blocks merged into {}, admitting {} extra addresses\n'.format(count, len(cidrs), extra))
+elif args.aggregate:
+    cidrs = ip_ranges.aggregate(cidrs)
 
-pprint(list(region_cidrs))
+pprint(cidrs)
@@ -0,0 +1,339 @@
+"""
+Local cache of the AWS IP address ranges published at ip-ranges.amazonaws.com.
+
+Every downloaded dataset is kept as a snapshot named after its syncToken and
+revalidated with ETag / If-Modified-Since once it is older than max_age, so a
+build job normally reads a local file and at most sends a conditional request.
+Loaded datasets are indexed by (region, service).
+
+aggregate() and supernets() shrink a list of prefixes into fewer CIDR blocks,
+exactly or admitting some extra address space. write_cidr_sets() saves the
+blocks of many regions and services for templates to read at build time, and
+diff() tells what changed between two snapshots. OwnerIndex goes the other
+way, from an address to the regions and services it belongs to.
+"""
+
+import bisect
+import collections
+import csv
+import ipaddress
+import json
+import os
+import sys
+import time
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+URL = 'https://ip-ranges.amazonaws.com/ip-ranges.json'
+DEFAULT_MAX_AGE = 24 * 60 * 60  # seconds
+META_FILE = 'meta.json'
+SNAPSHOTS_DIR = 'snapshots'
+
+
+class IpRangesUnavailable(Exception):
+    pass
+
+
+# region Dataset
+class IpRanges(object):
+    """An ip-ranges.json dataset indexed by (region, service) and address family."""
+
+    def __init__(self, data):
+        self.data = data
+        self.sync_token = data.get('syncToken')
+        self.create_date = data.get('createDate')
+        self._index = {}
+        self._owners = None
+        for family, key in ((4, 'ip_prefix'), (6, 'ipv6_prefix')):
+            index = collections.defaultdict(set)
+            for prefix in data.get('prefixes' if family == 4 else 'ipv6_prefixes', []):
+                index[(prefix['region'], prefix['service'])].add(prefix[key])
+            self._index[family] = {k: sorted(v, key=_network_key) for k, v in index.items()}
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def regions(self):
+        return sorted({region for index in self._index.values() for region, _ in index})
+
+    def services(self):
+        return sorted({service for index in self._index.values() for _, service in index})
+
+    def prefixes(self, region, service='EC2', ipv6=False):
+        """Return the CIDR blocks of service in region, in address order."""
+        return list(self._index[6 if ipv6 else 4].get((region, service), []))
+
+    def owners(self):
+        """Return the OwnerIndex of this dataset, built on first use."""
+        if self._owners is None:
+            self._owners = OwnerIndex(self.data)
+        return self._owners
+
+    def cidr_sets(self, regions=None, services=None, aggregated=False):
+        """
+        Return {region: {service: {'ipv4': [...], 'ipv6': [...]}}} for every
+        region and service, or only the ones asked for, straight from the index.
+        """
+        sets = {}
+        for family, index in sorted(self._index.items()):
+            for (region, service), cidrs in index.items():
+                if (regions and region not in regions) or (services and service not in services):
+                    continue
+                families = sets.setdefault(region, {}).setdefault(service, {'ipv4': [], 'ipv6': []})
+                families['ipv{}'.format(family)] = aggregate(cidrs) if aggregated else list(cidrs)
+        return sets
+
+
+Owner = collections.namedtuple('Owner', 'prefix region service network_border_group')
+
+
+class OwnerIndex(object):
+    """
+    Sorted interval index answering which prefixes contain an address.
+
+    Prefixes overlap (AMAZON contains most others), so the address space is
+    cut at every prefix boundary into segments, each holding the owners that
+    cover it. A lookup is one bisect over the segment starts.
+    """
+
+    def __init__(self, data):
+        self._starts, self._owners = {}, {}
+        for family, key in ((4, 'ip_prefix'), (6, 'ipv6_prefix')):
+            events = collections.defaultdict(list)
+            for prefix in data.get('prefixes' if family == 4 else 'ipv6_prefixes', []):
+                network = ipaddress.ip_network(prefix[key], strict=False)
+                owner = Owner(prefix[key], prefix['region'], prefix['service'], prefix.get('network_border_group'))
+                events[int(network.network_address)].append((owner, network.prefixlen, True))
+                events[int(network.broadcast_address) + 1].append((owner, network.prefixlen, False))
+
+            starts, owners, active = [], [], collections.Counter()
+            for boundary in sorted(events):
+                for owner, prefixlen, opens in events[boundary]:
+                    active[(prefixlen, owner)] += 1 if opens else -1
+                    if not active[(prefixlen, owner)]:
+                        del active[(prefixlen, owner)]
+                # Most specific prefix first
+                starts.append(boundary)
+                owners.append(tuple(owner for _, owner in sorted(active, key=lambda k: (-k[0], k[1]))))
+            self._starts[family], self._owners[family] = starts, owners
+
+    def lookup(self, address):
+        """Return the owners of address, most specific prefix first."""
+        address = ipaddress.ip_address(address)
+        starts = self._starts[address.version]
+        position = bisect.bisect_right(starts, int(address)) - 1
+        return list(self._owners[address.version][position]) if position >= 0 else []
+
+
+def diff(old, new, regions=None, services=None):
+    """
+    Return {region: {service: {'added': [...], 'removed': [...]}}} between two
+    datasets, IPv4 then IPv6 blocks in address order, only where they differ.
+    """
+    changes = {}
+    for family in (4, 6):
+        old_index, new_index = old._index.get(family, {}), new._index.get(family, {})
+        for region, service in sorted(set(old_index) | set(new_index)):
+            if (regions and region not in regions) or (services and service not in services):
+                continue
+            before, after = set(old_index.get((region, service), [])), set(new_index.get((region, service), []))
+            if before == after:
+                continue
+            entry = changes.setdefault(region, {}).setdefault(service, {'added': [], 'removed': []})
+            entry['added'].extend(sorted(after - before, key=_network_key))
+            entry['removed'].extend(sorted(before - after, key=_network_key))
+    return changes
+# endregion
+
+
+# region Batch files
+def write_cidr_sets(ranges, sets, path, fmt='json'):
+    """
+    Write cidr_sets() output as JSON, with the dataset's syncToken and
+    createDate, or as region,service,family,cidr CSV rows.
+    """
+    with open(path, 'w', newline='') as f:
+        if fmt == 'json':
+            json.dump({
+                'syncToken': ranges.sync_token,
+                'createDate': ranges.create_date,
+                'regions': sets,
+            }, f, indent=2, sort_keys=True)
+            f.write('\n')
+        elif fmt == 'csv':
+            writer = csv.writer(f)
+            writer.writerow(['region', 'service', 'family', 'cidr'])
+            for region, services in sorted(sets.items()):
+                for service, families in sorted(services.items()):
+                    for family, cidrs in sorted(families.items()):
+                        writer.writerows([region, service, family, cidr] for cidr in cidrs)
+        else:
+            raise ValueError('unknown format {!r}, expected json or csv'.format(fmt))
+# endregion
+
+
+# region Aggregation
+def _network_key(cidr):
+    network = ipaddress.ip_network(cidr, strict=False)
+    return network.version, network.network_address, network.prefixlen
+
+
+def _collapse(networks):
+    by_version = collections.defaultdict(list)
+    for network in networks:
+        by_version[network.version].append(network)
+    return [n for version in sorted(by_version) for n in ipaddress.collapse_addresses(by_version[version])]
+
+
+def aggregate(cidrs):
+    """Return the smallest list of CIDR blocks covering exactly the same addresses."""
+    return [str(network) for network in _collapse(ipaddress.ip_network(c, strict=False) for c in cidrs)]
+
+
+def supernets(cidrs, max_prefixlen):
+    """
+    Aggregate cidrs, also merging blocks that share a supernet of at most
+    /max_prefixlen into their smallest common supernet.
+
+    Blocks alone under their /max_prefixlen supernet are left untouched, so
+    extra address space is only admitted where it saves rules. Returns the
+    blocks and the number of addresses they cover beyond cidrs.
+    """
+    exact = _collapse(ipaddress.ip_network(c, strict=False) for c in cidrs)
+    groups = collections.OrderedDict()
+    for network in exact:
+        if network.prefixlen <= max_prefixlen:
+            groups[network] = [network]
+        else:
+            groups.setdefault(network.supernet(new_prefix=max_prefixlen), []).append(network)
+
+    merged = []
+    for members in groups.values():
+        if len(members) == 1:
+            merged.append(members[0])
+            continue
+        first, last = members[0], members[-1]
+        network = first
+        while not (network.network_address <= last.network_address and
+                   network.broadcast_address >= last.broadcast_address):
+            network = network.supernet()
+        merged.append(network)
+
+    merged = _collapse(merged)
+    extra = sum(n.num_addresses for n in merged) - sum(n.num_addresses for n in exact)
+    return [str(network) for network in merged], extra
+# endregion
+
+
+# region Cache
+def default_cache_dir():
+    root = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(root, 'cloudformation-templates', 'ip-ranges')
+
+
+def snapshot_path(cache_dir, sync_token):
+    return os.path.join(cache_dir, SNAPSHOTS_DIR, 'ip-ranges-{}.json'.format(sync_token))
+
+
+def snapshots(cache_dir):
+    """Return the sync tokens of the cached snapshots, oldest first."""
+    try:
+        names = os.listdir(os.path.join(cache_dir, SNAPSHOTS_DIR))
+    except FileNotFoundError:
+        return []
+    tokens = [name[len('ip-ranges-'):-len('.json')] for name in names
+              if name.startswith('ip-ranges-') and name.endswith('.json')]
+    return sorted(tokens, key=lambda token: int(token) if token.isdigit() else token)
+
+
+def load_snapshot(cache_dir, sync_token):
+    """Return the cached dataset with sync_token."""
+    cache_dir = cache_dir or default_cache_dir()
+    path = snapshot_path(cache_dir, sync_token)
+    if not os.path.isfile(path):
+        raise IpRangesUnavailable('no snapshot {} in {}, cached: {}'.format(
+            sync_token, cache_dir, ', '.join(snapshots(cache_dir)) or 'none'))
+    return IpRanges.from_file(path)
+
+
+def _load_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, META_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = '{}.{}.tmp'.format(path, os.getpid())
+    with open(partial, 'w') as f:
+        json.dump(data, f)
+    os.replace(partial, path)
+
+
+def _cached(cache_dir, meta):
+    path = snapshot_path(cache_dir, meta.get('syncToken'))
+    return IpRanges.from_file(path) if meta.get('syncToken') and os.path.isfile(path) else None
+
+
+def load(cache_dir=None, max_age=DEFAULT_MAX_AGE, offline=False, url=URL, timeout=30):
+    """
+    Return the current dataset, downloading it only when needed.
+
+    A cached dataset younger than max_age seconds is used as is. An older one
+    is revalidated with a conditional request and kept if unchanged. When
+    offline, or when the download fails, the cached dataset is used whatever
+    its age.
+    """
+    cache_dir = cache_dir or default_cache_dir()
+    meta = _load_meta(cache_dir)
+    cached = _cached(cache_dir, meta)
+
+    if offline:
+        if cached is None:
+            raise IpRangesUnavailable('no cached ip ranges in {}, run once online or pass a file'.format(cache_dir))
+        return cached
+    if cached is not None and time.time() - meta.get('checked', 0) < max_age:
+        return cached
+
+    request = Request(url)
+    if cached is not None:
+        if meta.get('etag'):
+            request.add_header('If-None-Match', meta['etag'])
+        if meta.get('last_modified'):
+            request.add_header('If-Modified-Since', meta['last_modified'])
+    try:
+        with urlopen(request, timeout=timeout) as response:
+            data = json.loads(response.read().decode())
+            headers = response.headers
+    except HTTPError as e:
+        if e.code == 304 and cached is not None:
+            meta['checked'] = time.time()
+            _save(os.path.join(cache_dir, META_FILE), meta)
+            return cached
+        return _fallback(cached, url, e)
+    except (URLError, OSError) as e:
+        return _fallback(cached, url, e)
+
+    ranges = IpRanges(data)
+    _save(snapshot_path(cache_dir, ranges.sync_token), data)
+    _save(os.path.join(cache_dir, META_FILE), {
+        'checked': time.time(),
+        'createDate': ranges.create_date,
+        'etag': headers.get('ETag'),
+        'last_modified': headers.get('Last-Modified'),
+        'syncToken': ranges.sync_token,
+    })
+    return ranges
+
+
+def _fallback(cached, url, error):
+    if cached is None:
+        raise IpRangesUnavailable('could not download {}: {}'.format(url, error))
+    sys.stderr.write('warning: could not revalidate ip ranges ({}), using syncToken {}\n'.format(
+        error, cached.sync_token))
+    return cached
+# endregion
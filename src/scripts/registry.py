@@ -0,0 +1,104 @@
+"""
+Registry of the templates under src.
+
+Templates are found through the "Template: <name>" line of the description
+passed to troposphere's Template(...). Sources are only parsed, never executed,
+so listing templates costs nothing and rendering one imports just that module.
+
+Template modules expose a build(config=None) factory returning a new Template.
+"""
+
+import ast
+import collections
+import hashlib
+import importlib.util
+import os
+import re
+import sys
+
+NAME_LINE = re.compile(r'^\s*Template:\s*(\S+?)\.?\s*$', re.MULTILINE)
+
+Entry = collections.namedtuple('Entry', 'name path description')
+
+
+class TemplateNotFound(Exception):
+    pass
+
+
+# region Discovery
+def description_of(path):
+    """Return the description given to Template(...) in path, None if there is none."""
+    with open(path, 'rb') as f:
+        source = f.read()
+    if b'Template(' not in source:
+        return None
+    for node in ast.walk(ast.parse(source, filename=path)):
+        if not isinstance(node, ast.Call) or not node.args:
+            continue
+        func = node.func
+        name = func.id if isinstance(func, ast.Name) else getattr(func, 'attr', None)
+        argument = node.args[0]
+        if name == 'Template' and isinstance(argument, ast.Constant) and isinstance(argument.value, str):
+            return argument.value
+    return None
+
+
+def discover(src='src'):
+    """Return the templates under src as an ordered {name: Entry} dictionary."""
+    entries = {}
+    for root, dirs, files in os.walk(src):
+        dirs[:] = sorted(d for d in dirs if not d.startswith(('.', '__')))
+        for filename in sorted(files):
+            if not filename.endswith('.py'):
+                continue
+            path = os.path.join(root, filename)
+            description = description_of(path)
+            match = NAME_LINE.search(description or '')
+            if not match:
+                continue
+            name = match.group(1)
+            if name in entries:
+                raise ValueError('template {} is declared by both {} and {}'.format(
+                    name, entries[name].path, path))
+            entries[name] = Entry(name, path, description.strip())
+    return collections.OrderedDict(sorted(entries.items()))
+
+
+def find(name, src='src'):
+    entries = discover(src)
+    if name not in entries:
+        raise TemplateNotFound('no template named {}, run list to see the available ones'.format(name))
+    return entries[name]
+# endregion
+
+
+# region Loading
+def load_module(path):
+    """
+    Import the template module at path.
+
+    The template's own directory is put on sys.path so sibling helper modules
+    resolve the same way they do when the file is run as a script.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    name = '_template_' + hashlib.sha1(path.encode()).hexdigest()[:12]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def build_template(module, config=None):
+    """Return the Template of an imported template module for config."""
+    if hasattr(module, 'build'):
+        return module.build(config)
+    # Template built as a side effect of the import, config does not apply
+    return module.template
+
+
+def load_template(path, config=None):
+    """Import the template module at path and return its Template for config."""
+    return build_template(load_module(path), config)
+# endregion
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Render every environment x region variant of a set of templates in one process.
+
+The matrix is a JSON file:
+
+    {
+        "templates": ["rds-template", "rds-cidrs-template"],
+        "regions": ["us-east-1", "eu-west-1"],
+        "environments": {
+            "staging": {},
+            "production": {"region_cidrs": ["10.0.0.0/24"]}
+        },
+        "config": {}
+    }
+
+Each variant is built with the shared "config", updated with the environment's
+own config and with "environment" and "region". Template modules are imported
+once and whatever they memoize is shared by all variants. Variants are written
+to dist/matrix/<environment>/<region>/<template><extension>, their canonical
+form goes to the artifact store and dist/matrix/manifest.json maps every
+<template>/<environment>/<region> to its hash.
+
+Usage:
+    python src/scripts/render_matrix.py MATRIX [--format json|minified|yaml]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import artifacts
+import registry
+import template_output
+
+MATRIX_DIR = 'matrix'
+
+
+def variants(matrix):
+    """Yield (template, environment, region, config) for every cell of the matrix."""
+    base = matrix.get('config', {})
+    environments = matrix.get('environments') or {'default': {}}
+    regions = matrix.get('regions') or [None]
+    for template in matrix['templates']:
+        for environment, environment_config in sorted(environments.items()):
+            for region in regions:
+                config = dict(base)
+                config.update(environment_config)
+                config.update(environment=environment, region=region)
+                yield template, environment, region, config
+
+
+def render(matrix, src='src', dist='dist', fmt='json', log=print):
+    """Render the matrix and return its manifest."""
+    entries = registry.discover(src)
+    unknown = [name for name in matrix['templates'] if name not in entries]
+    if unknown:
+        raise registry.TemplateNotFound('no template named {}'.format(', '.join(unknown)))
+
+    modules = {}
+    manifest = {}
+    extension = template_output.EXTENSIONS[fmt]
+    for name, environment, region, config in variants(matrix):
+        if name not in modules:
+            modules[name] = registry.load_module(entries[name].path)
+        data = registry.build_template(modules[name], config).to_dict()
+        key = '/'.join([name, environment, region or 'default'])
+        manifest[key] = artifacts.store(dist, data)
+
+        target = os.path.join(dist, MATRIX_DIR, environment, region or 'default', name + extension)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'w') as f:
+            f.write(template_output.serialize(data, fmt) + '\n')
+        log('* building {}...'.format(target))
+
+    artifacts.save_manifest(os.path.join(dist, MATRIX_DIR, artifacts.MANIFEST_FILE), manifest)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render environment x region template variants.')
+    parser.add_argument('matrix', help='matrix JSON file')
+    parser.add_argument('--src', default='src', help='directory searched for templates')
+    parser.add_argument('--dist', default='dist', help='directory receiving rendered templates')
+    parser.add_argument('--format', choices=template_output.FORMATS, default='json', help='output format')
+    args = parser.parse_args(argv)
+
+    with open(args.matrix) as f:
+        matrix = json.load(f)
+    render(matrix, args.src, args.dist, args.format)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,447 @@
+"""
+Serialization, size budgets and nested-stack splitting for rendered templates.
+
+Everything here works on the dictionary returned by Template.to_dict(), so the
+same helpers apply to a freshly built template and to the pieces it is split
+into.
+"""
+
+import collections
+import copy
+import json
+import re
+
+FORMATS = ('json', 'minified', 'yaml')
+EXTENSIONS = {'json': '.json', 'minified': '.json', 'yaml': '.yaml'}
+
+# CloudFormation quotas, in bytes and resources per template
+LIMITS = {
+    'inline': 51200,
+    's3': 1024 * 1024,
+}
+MAX_RESOURCES = 500
+MAX_PARAMETERS = 200
+MAX_OUTPUTS = 200
+
+# Parameter of the parent stack holding the S3 location of the nested templates
+NESTED_URL_PARAMETER = 'NestedTemplateUrl'
+
+SUB_VARIABLE = re.compile(r'\$\{([^!}][^}]*)\}')
+
+
+# region Serialization
+def canonical(data):
+    """
+    Serialize a template dictionary canonically: sorted keys, no insignificant
+    whitespace and ASCII only, so equal templates always give equal bytes.
+    """
+    return json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=True)
+
+
+def serialize(data, fmt='json'):
+    """Serialize a template dictionary in one of FORMATS."""
+    if fmt == 'json':
+        # Template.to_json() with indent=4, its default indent changed between troposphere versions
+        return json.dumps(data, indent=4, sort_keys=True, separators=(',', ': '))
+    if fmt == 'minified':
+        return canonical(data)
+    if fmt == 'yaml':
+        import cfn_flip
+        return cfn_flip.dump_yaml(data)
+    raise ValueError('unknown format {!r}, expected one of {}'.format(fmt, ', '.join(FORMATS)))
+
+
+def size(data, fmt='json'):
+    return len(serialize(data, fmt).encode())
+
+
+def size_report(data, fmt='json', largest=5):
+    """
+    Return (label, bytes) pairs for every top-level section of the template
+    followed by its largest resources.
+    """
+    report = [('total', size(data, fmt))]
+    for section in sorted(data):
+        report.append((section, size({section: data[section]}, fmt)))
+    resources = data.get('Resources', {})
+    sizes = sorted(((size({k: v}, fmt), k) for k, v in resources.items()), reverse=True)
+    for nbytes, name in sizes[:largest]:
+        report.append(('Resources.' + name, nbytes))
+    return report
+
+
+def format_report(report):
+    width = max(len(label) for label, _ in report)
+    return '\n'.join('{:<{w}}  {:>10}'.format(label, nbytes, w=width) for label, nbytes in report)
+# endregion
+
+
+# region References
+def references(value):
+    """
+    Return the (name, attribute) pairs referenced by a template fragment.
+
+    Ref yields (name, None), Fn::GetAtt and ${name.attr} in Fn::Sub yield
+    (name, attr). Pseudo parameters are left out.
+    """
+    found = set()
+    _collect(value, found)
+    return {(name, attr) for name, attr in found if not name.startswith('AWS::')}
+
+
+def _collect(value, found):
+    if isinstance(value, dict):
+        if len(value) == 1:
+            key, arg = next(iter(value.items()))
+            if key == 'Ref' and isinstance(arg, str):
+                found.add((arg, None))
+                return
+            if key == 'Fn::GetAtt':
+                name, attr = arg if isinstance(arg, list) else arg.split('.', 1)
+                found.add((name, attr))
+                return
+            if key == 'Fn::Sub':
+                text, variables = (arg, {}) if isinstance(arg, str) else arg
+                for match in SUB_VARIABLE.findall(text):
+                    if match not in variables:
+                        name, _, attr = match.partition('.')
+                        found.add((name, attr or None))
+                _collect(variables, found)
+                return
+        for item in value.values():
+            _collect(item, found)
+    elif isinstance(value, list):
+        for item in value:
+            _collect(item, found)
+
+
+def rewrite(value, replace):
+    """
+    Return a copy of value with every reference passed through replace.
+
+    replace(name, attr) returns None to keep the reference, or the intrinsic
+    (a dictionary) that should take its place.
+    """
+    if isinstance(value, dict):
+        if len(value) == 1:
+            key, arg = next(iter(value.items()))
+            if key == 'Ref' and isinstance(arg, str):
+                return replace(arg, None) or value
+            if key == 'Fn::GetAtt':
+                name, attr = arg if isinstance(arg, list) else arg.split('.', 1)
+                return replace(name, attr) or value
+            if key == 'Fn::Sub':
+                return {'Fn::Sub': _rewrite_sub(arg, replace)}
+        return {k: rewrite(v, replace) for k, v in value.items()}
+    if isinstance(value, list):
+        return [rewrite(item, replace) for item in value]
+    return value
+
+
+def _rewrite_sub(arg, replace):
+    text, variables = (arg, {}) if isinstance(arg, str) else arg
+    extra = {}
+
+    def substitute(match):
+        if match.group(1) in variables:
+            return match.group(0)
+        name, _, attr = match.group(1).partition('.')
+        new = replace(name, attr or None)
+        if new is None:
+            return match.group(0)
+        # Inline the replacement as an extra Fn::Sub variable
+        key = 'Nested{}'.format(re.sub(r'[^A-Za-z0-9]', '', match.group(1)))
+        extra[key] = new
+        return '${' + key + '}'
+
+    text = SUB_VARIABLE.sub(substitute, text)
+    variables = rewrite(dict(variables), replace)
+    variables.update(extra)
+    return [text, variables] if variables else text
+# endregion
+
+
+# region Splitting
+def explode_security_groups(data, budget, fmt='json'):
+    """
+    Move inline rules of oversized security groups into standalone resources.
+
+    Inline ingress rules all move. One inline egress rule is kept so the group
+    still replaces the default allow-all egress rule, exactly as before.
+    """
+    resources = data['Resources']
+    for name in list(resources):
+        resource = resources[name]
+        if resource.get('Type') != 'AWS::EC2::SecurityGroup':
+            continue
+        if size({name: resource}, fmt) <= budget:
+            continue
+        properties = resource.setdefault('Properties', {})
+        group_id = {'Fn::GetAtt': [name, 'GroupId']}
+        ingress = properties.pop('SecurityGroupIngress', [])
+        for index, rule in enumerate(ingress, 1):
+            rule = dict(rule, GroupId=group_id)
+            resources['{}Ingress{}'.format(name, index)] = dict(
+                _resource_attributes(resource), Type='AWS::EC2::SecurityGroupIngress', Properties=rule)
+        egress = properties.get('SecurityGroupEgress', [])
+        if len(egress) > 1:
+            properties['SecurityGroupEgress'] = egress[:1]
+            for index, rule in enumerate(egress[1:], 2):
+                rule = dict(rule, GroupId=group_id)
+                resources['{}Egress{}'.format(name, index)] = dict(
+                    _resource_attributes(resource), Type='AWS::EC2::SecurityGroupEgress', Properties=rule)
+    return data
+
+
+def _resource_attributes(resource):
+    """Attributes a rule carved out of resource must share with it."""
+    return {k: v for k, v in resource.items() if k == 'Condition'}
+
+
+def _dependencies(name, resource, resource_names):
+    deps = {ref for ref, _ in references(resource) if ref in resource_names and ref != name}
+    depends_on = resource.get('DependsOn', [])
+    deps.update([depends_on] if isinstance(depends_on, str) else depends_on)
+    return deps
+
+
+def _topological(resources):
+    """Order resources so every resource comes after the ones it references."""
+    names = set(resources)
+    deps = {name: _dependencies(name, res, names) for name, res in resources.items()}
+    ordered, done = [], set()
+    pending = list(resources)
+    while pending:
+        remaining = []
+        for name in pending:
+            if deps[name] <= done:
+                ordered.append(name)
+                done.add(name)
+            else:
+                remaining.append(name)
+        if len(remaining) == len(pending):
+            raise ValueError('circular dependency between resources: {}'.format(', '.join(remaining)))
+        pending = remaining
+    return ordered, deps
+
+
+def _chunks(resources, ordered, budget, fmt):
+    chunks, current, current_size = [], [], 0
+    for name in ordered:
+        nbytes = size({name: resources[name]}, fmt)
+        if nbytes > budget:
+            raise ValueError('resource {} alone is {} bytes, over the {} bytes budget'.format(name, nbytes, budget))
+        if current and (current_size + nbytes > budget or len(current) >= MAX_RESOURCES):
+            chunks.append(current)
+            current, current_size = [], 0
+        current.append(name)
+        current_size += nbytes
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _output_name(name, attr):
+    return name + re.sub(r'[^A-Za-z0-9]', '', attr or '')
+
+
+def _required_conditions(value, conditions):
+    """Conditions used by value, including the ones they use in turn."""
+    found, pending = set(), [value]
+    while pending:
+        item = pending.pop()
+        if isinstance(item, dict):
+            for key, arg in item.items():
+                name = None
+                if key == 'Condition' and isinstance(arg, str):
+                    name = arg
+                elif key == 'Fn::If' and isinstance(arg, list):
+                    name = arg[0]
+                if name in conditions and name not in found:
+                    found.add(name)
+                    pending.append(conditions[name])
+                pending.append(arg)
+        elif isinstance(item, list):
+            pending.extend(item)
+    return found
+
+
+def _is_list(parameter):
+    """Whether a parameter holds a list, which nested stacks only take as a comma separated string."""
+    return parameter.get('Type') == 'CommaDelimitedList' or 'List<' in parameter.get('Type', '')
+
+
+def _export_condition(name, attr, resource, used, conditions):
+    """
+    Condition an export of resource needs: its own, or the one under which
+    all of its consumers exist, an Fn::Or of theirs when they differ. None
+    when some consumer is unconditional.
+    """
+    if 'Condition' in resource:
+        return resource['Condition']
+    if None in used:
+        return None
+    if len(used) == 1:
+        return next(iter(used))
+    if len(used) > 10:  # Fn::Or takes at most 10 conditions
+        return None
+    condition = '{}Used'.format(_output_name(name, attr))
+    conditions[condition] = {'Fn::Or': [{'Condition': c} for c in sorted(used)]}
+    return condition
+
+
+def split(data, limit, fmt='json', name='nested'):
+    """
+    Partition the resources of data into nested stacks that fit within limit.
+
+    Returns (parent, children) where children is a list of template
+    dictionaries. The parent gets a NestedTemplateUrl parameter, child N is
+    expected at ${NestedTemplateUrl}/<name>-N<extension>. Parameters the
+    children need are passed through, cross-stack references are wired through
+    stack outputs and the parent outputs are rewritten to read from them.
+    """
+    stem = name  # the loops below rebind name to logical IDs
+
+    data = copy.deepcopy(data)
+    parameters = data.get('Parameters', {})
+    conditions = data.setdefault('Conditions', {})
+    mappings = data.get('Mappings', {})
+
+    # Leave room for the parameters and outputs wiring the stacks together
+    budget = limit * 9 // 10
+    for _ in range(8):
+        explode_security_groups(data, budget, fmt)
+        resources = data['Resources']
+        ordered, deps = _topological(resources)
+        chunks = _chunks(resources, ordered, budget, fmt)
+        stack_of = {name: index for index, chunk in enumerate(chunks) for name in chunk}
+        stack_names = ['NestedStack{}'.format(i + 1) for i in range(len(chunks))]
+
+        # Which (name, attr) of each stack is consumed elsewhere, and under which conditions
+        exported = [set() for _ in chunks]
+        consumers = collections.defaultdict(set)
+        for name, resource in resources.items():
+            for ref, attr in references(resource):
+                if ref in stack_of and stack_of[ref] != stack_of[name]:
+                    exported[stack_of[ref]].add((ref, attr))
+                    consumers[(ref, attr)].add(resource.get('Condition'))
+        for output in data.get('Outputs', {}).values():
+            for ref, attr in references(output):
+                if ref in stack_of:
+                    exported[stack_of[ref]].add((ref, attr))
+                    consumers[(ref, attr)].add(output.get('Condition'))
+        export_conditions = {}
+        for (ref, attr), used in consumers.items():
+            condition = _export_condition(ref, attr, resources[ref], used, conditions)
+            if condition is not None:
+                export_conditions[(ref, attr)] = condition
+
+        children = []
+        for index, chunk in enumerate(chunks):
+            child_resources = {}
+            imported = set()
+
+            def local(name, attr, index=index):
+                if name in stack_of and stack_of[name] != index:
+                    imported.add((name, attr))
+                    return {'Ref': _output_name(name, attr)}
+                return None
+
+            for name in chunk:
+                resource = rewrite(resources[name], local)
+                depends_on = resource.get('DependsOn')
+                if depends_on:
+                    depends_on = [depends_on] if isinstance(depends_on, str) else depends_on
+                    depends_on = [d for d in depends_on if stack_of.get(d) == index]
+                    if depends_on:
+                        resource['DependsOn'] = depends_on
+                    else:
+                        del resource['DependsOn']
+                child_resources[name] = resource
+
+            child_outputs = {}
+            for name, attr in sorted(exported[index], key=str):
+                output = {'Value': {'Fn::GetAtt': [name, attr]} if attr else {'Ref': name}}
+                if (name, attr) in export_conditions:
+                    output['Condition'] = export_conditions[(name, attr)]
+                child_outputs[_output_name(name, attr)] = output
+
+            used_conditions = _required_conditions([child_resources, child_outputs], conditions)
+            used_parameters = {
+                ref for ref, _ in references([child_resources] + [conditions[c] for c in used_conditions])
+                if ref in parameters
+            }
+            child = {'AWSTemplateFormatVersion': '2010-09-09', 'Resources': child_resources}
+            if 'Description' in data:
+                child['Description'] = '{} ({} of {})'.format(data['Description'].strip(), index + 1, len(chunks))
+            child_parameters = {p: parameters[p] for p in sorted(used_parameters)}
+            for name, attr in sorted(imported, key=str):
+                child_parameters[_output_name(name, attr)] = {'Type': 'String'}
+            if child_parameters:
+                child['Parameters'] = child_parameters
+            if used_conditions:
+                child['Conditions'] = {c: conditions[c] for c in sorted(used_conditions)}
+            if mappings:
+                child['Mappings'] = mappings
+            if child_outputs:
+                child['Outputs'] = child_outputs
+            if len(child_parameters) > MAX_PARAMETERS or len(child.get('Outputs', {})) > MAX_OUTPUTS:
+                raise ValueError('nested stack {} needs more than {} parameters or outputs'.format(
+                    index + 1, MAX_PARAMETERS))
+            children.append((child, imported))
+
+        if all(size(child, fmt) <= limit for child, _ in children):
+            break
+        budget = budget * 3 // 4
+    else:
+        raise ValueError('could not split the template into stacks of at most {} bytes'.format(limit))
+
+    def from_stack(name, attr):
+        if name in stack_of:
+            return {'Fn::GetAtt': [stack_names[stack_of[name]], 'Outputs.' + _output_name(name, attr)]}
+        return None
+
+    def passed(name):
+        # Stack parameters are strings, lists go as comma separated values and the child keeps their type
+        if _is_list(parameters[name]):
+            return {'Fn::Join': [',', {'Ref': name}]}
+        return {'Ref': name}
+
+    extension = EXTENSIONS[fmt]
+    stacks = {}
+    for index, (child, imported) in enumerate(children):
+        stack_parameters = {p: passed(p) for p in child.get('Parameters', {}) if p in parameters}
+        for name, attr in imported:
+            value = from_stack(name, attr)
+            if (name, attr) in export_conditions:
+                # Only its consumers, conditional too, read it when the output exists
+                value = {'Fn::If': [export_conditions[(name, attr)], value, '']}
+            stack_parameters[_output_name(name, attr)] = value
+        depends_on = sorted({
+            stack_names[stack_of[dep]]
+            for name in chunks[index] for dep in deps[name]
+            if stack_of[dep] != index
+        })
+        stack = {
+            'Type': 'AWS::CloudFormation::Stack',
+            'Properties': {
+                'TemplateURL': {'Fn::Sub': '${{{}}}/{}-{}{}'.format(
+                    NESTED_URL_PARAMETER, stem, index + 1, extension)},
+            },
+        }
+        if stack_parameters:
+            stack['Properties']['Parameters'] = stack_parameters
+        if depends_on:
+            stack['DependsOn'] = depends_on
+        stacks[stack_names[index]] = stack
+
+    parent = {k: v for k, v in data.items() if k not in ('Resources', 'Outputs') and (k != 'Conditions' or v)}
+    parent['Parameters'] = dict(parameters, **{NESTED_URL_PARAMETER: {
+        'Type': 'String',
+        'Description': 'S3 URL of the folder holding the nested templates, without a trailing /',
+    }})
+    parent['Resources'] = stacks
+    if 'Outputs' in data:
+        parent['Outputs'] = rewrite(data['Outputs'], from_stack)
+    return parent, [child for child, _ in children]
+# endregion
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Templates and scripts import their siblings as top-level modules
+sys.path[:0] = [os.path.join(ROOT, 'src', 'misc'), os.path.join(ROOT, 'src', 'scripts')]
+
+import registry  # noqa: E402
+
+
+@pytest.fixture
+def render():
+    """Return a function building a template by name with a config, as a dictionary."""
+    def render(name, config=None):
+        return registry.load_template(registry.find(name, os.path.join(ROOT, 'src')).path, config).to_dict()
+    return render
@@ -0,0 +1,89 @@
+import json
+import os
+
+import pytest
+
+import artifacts
+import build_templates
+
+TEMPLATE = '''
+from troposphere import Template, Output
+
+
+def build(config=None):
+    template = Template("""
+Template: {name}
+""")
+    template.add_output(Output('Value', Value='{value}'))
+    return template
+'''
+
+
+def write_template(src, name, value='one'):
+    path = src / 'misc' / (name + '.py')
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(TEMPLATE.format(name=name, value=value))
+    return path
+
+
+def build(src, dist):
+    return build_templates.build(str(src), str(dist), jobs=1, log=lambda message: None)
+
+
+def test_store_is_content_addressed(tmp_path):
+    sha = artifacts.store(str(tmp_path), {'b': 1, 'a': [1, 2]})
+    assert sha == artifacts.store(str(tmp_path), {'a': [1, 2], 'b': 1})
+    assert sha != artifacts.store(str(tmp_path), {'a': [2, 1], 'b': 1})
+    with open(artifacts.object_path(str(tmp_path), sha)) as f:
+        assert json.load(f) == {'a': [1, 2], 'b': 1}
+
+
+def test_manifest_round_trip(tmp_path):
+    path = str(tmp_path / 'manifest.json')
+    assert artifacts.load_manifest(path) == {}
+    artifacts.save_manifest(path, {'b': '2', 'a': '1'})
+    assert artifacts.load_manifest(path) == {'a': '1', 'b': '2'}
+
+
+def test_changed_and_removed():
+    manifest = {'app': 'a2', 'db': 'd1', 'new': 'n1'}
+    deployed = {'app': 'a1', 'db': 'd1', 'gone': 'g1'}
+    assert artifacts.changed(manifest, deployed) == ['app', 'new']
+    assert artifacts.removed(manifest, deployed) == ['gone']
+    assert artifacts.changed(manifest, manifest) == []
+
+
+def test_mark_deployed():
+    manifest = {'app': 'a2', 'db': 'd2'}
+    deployed = {'app': 'a1', 'db': 'd1', 'gone': 'g1'}
+    assert artifacts.mark_deployed(manifest, deployed, ['app']) == {'app': 'a2', 'db': 'd1', 'gone': 'g1'}
+    assert artifacts.mark_deployed(manifest, deployed) == {'app': 'a2', 'db': 'd2', 'gone': 'g1'}
+    assert deployed == {'app': 'a1', 'db': 'd1', 'gone': 'g1'}
+    with pytest.raises(KeyError, match='not in the manifest: other'):
+        artifacts.mark_deployed(manifest, deployed, ['other'])
+
+
+def test_failed_build_keeps_the_last_good_hash(tmp_path):
+    src, dist = tmp_path / 'src', tmp_path / 'dist'
+    write_template(src, 'artifacts-good')
+    broken = write_template(src, 'artifacts-broken')
+    assert build(src, dist) == 0
+    manifest_path = str(dist / artifacts.MANIFEST_FILE)
+    before = artifacts.load_manifest(manifest_path)
+    assert sorted(before) == ['artifacts-broken', 'artifacts-good']
+
+    broken.write_text(broken.read_text() + '\nraise RuntimeError("broken")\n')
+    assert build(src, dist) == 1
+    after = artifacts.load_manifest(manifest_path)
+    assert after == before
+    assert artifacts.removed(after, before) == []
+    assert os.path.isfile(artifacts.object_path(str(dist), after['artifacts-broken']))
+
+
+def test_failed_first_build_is_left_out(tmp_path):
+    src, dist = tmp_path / 'src', tmp_path / 'dist'
+    write_template(src, 'artifacts-fine')
+    broken = write_template(src, 'artifacts-never-built')
+    broken.write_text(broken.read_text() + '\nraise RuntimeError("broken")\n')
+    assert build(src, dist) == 1
+    assert list(artifacts.load_manifest(str(dist / artifacts.MANIFEST_FILE))) == ['artifacts-fine']
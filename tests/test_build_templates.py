@@ -0,0 +1,114 @@
+import os
+
+import pytest
+
+import artifacts
+import build_templates
+import registry
+
+TEMPLATE = '''
+from troposphere import Template, Output
+{imports}
+
+def build(config=None):
+    template = Template("""
+Template: {name}
+""")
+    template.add_output(Output('Value', Value='{value}'))
+    return template
+'''
+
+
+def write(path, source):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(source)
+    return str(path)
+
+
+def write_template(src, name, value='one', imports=''):
+    return write(src / 'misc' / (name + '.py'), TEMPLATE.format(name=name, value=value, imports=imports))
+
+
+def build(src, dist, **kwargs):
+    messages = []
+    failures = build_templates.build(str(src), str(dist), jobs=1, log=messages.append, **kwargs)
+    return failures, [message for message in messages if message.startswith('* building')]
+
+
+def test_local_imports_follows_sibling_modules_only(tmp_path):
+    write(tmp_path / 'helpers.py', 'import shared\nimport json\n')
+    write(tmp_path / 'shared.py', 'from troposphere import Ref\n')
+    write(tmp_path / 'unused.py', '')
+    write(tmp_path / 'package' / 'nested.py', '')
+    path = write(tmp_path / 'template.py', 'import os\nfrom helpers import x\nfrom . import unused\nimport package\n')
+    assert build_templates.local_imports(path) == [str(tmp_path / 'helpers.py'), str(tmp_path / 'shared.py')]
+
+
+def test_local_imports_of_an_import_cycle(tmp_path):
+    write(tmp_path / 'a.py', 'import b\n')
+    write(tmp_path / 'b.py', 'import a\n')
+    assert str(tmp_path / 'b.py') in build_templates.local_imports(str(tmp_path / 'a.py'))
+
+
+def test_is_fresh(tmp_path):
+    helper = write(tmp_path / 'helper.py', 'VALUE = 1\n')
+    path = write(tmp_path / 'template.py', 'import helper\n')
+    target = write(tmp_path / 'template.json', '{}')
+    options = {'format': 'json'}
+    entry = {'deps': [helper], 'hash': build_templates.digest(path, [helper], options)}
+    assert build_templates.is_fresh(path, target, entry, options)
+
+    assert not build_templates.is_fresh(path, target, None, options)
+    assert not build_templates.is_fresh(path, target, entry, {'format': 'yaml'})
+    write(tmp_path / 'helper.py', 'VALUE = 2\n')
+    assert not build_templates.is_fresh(path, target, entry, options)
+    write(tmp_path / 'helper.py', 'VALUE = 1\n')
+    os.remove(target)
+    assert not build_templates.is_fresh(path, target, entry, options)
+    write(tmp_path / 'template.json', '{}')
+    os.remove(helper)
+    assert not build_templates.is_fresh(path, target, entry, options)
+
+
+def test_build_skips_unchanged_templates(tmp_path):
+    src, dist = tmp_path / 'src', tmp_path / 'dist'
+    write(src / 'misc' / 'helper.py', 'VALUE = 1\n')
+    write_template(src, 'build-a', imports='import helper\n')
+    write_template(src, 'build-b')
+    assert build(src, dist) == (0, ['* building {}...'.format(dist / 'misc' / name) for name in
+                                    ('build-a.json', 'build-b.json')])
+    manifest = artifacts.load_manifest(str(dist / artifacts.MANIFEST_FILE))
+
+    assert build(src, dist) == (0, [])
+    assert artifacts.load_manifest(str(dist / artifacts.MANIFEST_FILE)) == manifest
+
+    # A local import invalidates its importers only
+    write(src / 'misc' / 'helper.py', 'VALUE = 2\n')
+    assert build(src, dist) == (0, ['* building {}...'.format(dist / 'misc' / 'build-a.json')])
+    assert build(src, dist, force=True)[1] == ['* building {}...'.format(dist / 'misc' / name) for name in
+                                              ('build-a.json', 'build-b.json')]
+    assert build(src, dist, fmt='minified')[1] == ['* building {}...'.format(dist / 'misc' / name) for name in
+                                                   ('build-a.json', 'build-b.json')]
+
+
+def test_build_of_selected_templates_keeps_the_others(tmp_path):
+    src, dist = tmp_path / 'src', tmp_path / 'dist'
+    write_template(src, 'build-a')
+    path = write_template(src, 'build-b')
+    build(src, dist)
+    manifest = artifacts.load_manifest(str(dist / artifacts.MANIFEST_FILE))
+    cache = build_templates.load_cache(str(dist))
+
+    write_template(src, 'build-a', value='two')
+    write_template(src, 'build-b', value='two')
+    assert build(src, dist, templates=[path])[1] == ['* building {}...'.format(dist / 'misc' / 'build-b.json')]
+    after = artifacts.load_manifest(str(dist / artifacts.MANIFEST_FILE))
+    assert after['build-a'] == manifest['build-a']
+    assert after['build-b'] != manifest['build-b']
+    assert build_templates.load_cache(str(dist))[str(dist / 'misc' / 'build-a.json')] == \
+        cache[str(dist / 'misc' / 'build-a.json')]
+
+    assert build(src, dist, templates=['build-a'], force=True)[1] == \
+        ['* building {}...'.format(dist / 'misc' / 'build-a.json')]
+    with pytest.raises(registry.TemplateNotFound):
+        build(src, dist, templates=['build-c'])
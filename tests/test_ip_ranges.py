@@ -0,0 +1,95 @@
+import json
+import os
+import subprocess
+import sys
+
+import ip_ranges
+
+SCRIPTS = os.path.dirname(ip_ranges.__file__)
+
+
+def dataset(sync_token, prefixes, ipv6_prefixes=()):
+    return ip_ranges.IpRanges({
+        'syncToken': sync_token,
+        'createDate': '2024-01-01-00-00-00',
+        'prefixes': [
+            {'ip_prefix': cidr, 'region': region, 'service': service, 'network_border_group': region}
+            for cidr, region, service in prefixes
+        ],
+        'ipv6_prefixes': [
+            {'ipv6_prefix': cidr, 'region': region, 'service': service, 'network_border_group': region}
+            for cidr, region, service in ipv6_prefixes
+        ],
+    })
+
+
+def test_aggregate_merges_adjacent_and_overlapping_blocks():
+    cidrs = ['10.0.1.0/24', '10.0.0.0/24', '10.0.0.128/25', '192.168.0.0/24']
+    assert ip_ranges.aggregate(cidrs) == ['10.0.0.0/23', '192.168.0.0/24']
+
+
+def test_aggregate_keeps_address_families_apart():
+    cidrs = ['2600:1f00::/41', '10.0.0.0/24', '2600:1f00:80::/41']
+    assert ip_ranges.aggregate(cidrs) == ['10.0.0.0/24', '2600:1f00::/40']
+
+
+def test_supernets_merges_blocks_sharing_a_supernet():
+    cidrs = ['10.0.0.0/24', '10.0.3.0/24', '172.16.0.0/24']
+    blocks, extra = ip_ranges.supernets(cidrs, 16)
+    assert blocks == ['10.0.0.0/22', '172.16.0.0/24']
+    assert extra == 2 * 256
+
+
+def test_supernets_without_shared_supernet_is_exact():
+    cidrs = ['10.0.0.0/24', '10.1.0.0/24']
+    assert ip_ranges.supernets(cidrs, 16) == (cidrs, 0)
+
+
+def test_owner_index_lookup_most_specific_first():
+    data = dataset('1', [
+        ('3.0.0.0/8', 'us-east-1', 'AMAZON'),
+        ('3.5.0.0/16', 'us-east-1', 'EC2'),
+        ('3.5.1.0/24', 'us-east-1', 'S3'),
+    ], [
+        ('2600:1f00::/24', 'eu-west-1', 'AMAZON'),
+    ])
+    owners = data.owners()
+    assert [owner.prefix for owner in owners.lookup('3.5.1.7')] == ['3.5.1.0/24', '3.5.0.0/16', '3.0.0.0/8']
+    assert [owner.service for owner in owners.lookup('3.5.2.1')] == ['EC2', 'AMAZON']
+    assert owners.lookup('3.255.255.255')[0].prefix == '3.0.0.0/8'
+    assert owners.lookup('4.0.0.0') == []
+    assert owners.lookup('2.255.255.255') == []
+    assert owners.lookup('2600:1f00::1')[0].region == 'eu-west-1'
+
+
+def test_diff_lists_added_and_removed_blocks():
+    old = dataset('1', [
+        ('10.0.0.0/24', 'us-east-1', 'EC2'),
+        ('10.0.1.0/24', 'us-east-1', 'EC2'),
+        ('10.1.0.0/24', 'eu-west-1', 'EC2'),
+    ])
+    new = dataset('2', [
+        ('10.0.1.0/24', 'us-east-1', 'EC2'),
+        ('10.0.2.0/24', 'us-east-1', 'EC2'),
+        ('10.1.0.0/24', 'eu-west-1', 'EC2'),
+    ], [
+        ('2600:1f00::/40', 'us-east-1', 'EC2'),
+    ])
+    assert ip_ranges.diff(old, new) == {
+        'us-east-1': {'EC2': {'added': ['10.0.2.0/24', '2600:1f00::/40'], 'removed': ['10.0.0.0/24']}},
+    }
+    assert ip_ranges.diff(old, new, regions=['eu-west-1']) == {}
+    assert ip_ranges.diff(new, new) == {}
+
+
+def test_lookup_file_prints_owners(tmp_path):
+    data = dataset('1', [('3.5.0.0/16', 'us-east-1', 'EC2')])
+    ranges = tmp_path / 'ip-ranges.json'
+    ranges.write_text(json.dumps(data.data))
+    addresses = tmp_path / 'addresses.txt'
+    addresses.write_text('3.5.0.1\n\n4.0.0.1\n')
+    result = subprocess.run(
+        [sys.executable, os.path.join(SCRIPTS, 'get_region_cidr_blocks.py'),
+         '--file', str(ranges), '--lookup-file', str(addresses)],
+        capture_output=True, text=True, check=True)
+    assert result.stdout.splitlines() == ['3.5.0.1\t3.5.0.0/16\tus-east-1\tEC2', '4.0.0.1\t-\t-\t-']
@@ -0,0 +1,186 @@
+NAME = 'lambda-django-distribution'
+
+
+def distribution_config(data):
+    return data['Resources']['Distribution']['Properties']['DistributionConfig']
+
+
+def test_app_origin_only_caches_pages_marked_cacheable(render):
+    data = render(NAME, {'app_origin': True})
+    assert data['Parameters']['AppTTL']['Default'] == 0
+    assert 'sessionid' in data['Parameters']['AppCookies']['Default'].split(',')
+
+    policy = data['Resources']['AppCachePolicy']['Properties']['CachePolicyConfig']
+    assert policy['MinTTL'] == 0
+    assert policy['DefaultTTL'] == {'Ref': 'AppTTL'}
+    assert policy['ParametersInCacheKeyAndForwardedToOrigin']['CookiesConfig']['Cookies'] == \
+        {'Fn::If': ['AppCookiesWhitelisted', {'Ref': 'AppCookies'}, {'Ref': 'AWS::NoValue'}]}
+
+    config = distribution_config(data)
+    default = config['DefaultCacheBehavior']
+    assert default['CachePolicyId'] == {'Ref': 'AppCachePolicy'}
+    assert default['OriginRequestPolicyId'] == {'Ref': 'AppOriginRequestPolicy'}
+    assert default['TargetOriginId'] in [origin['Id'] for origin in config['Origins']]
+    assert [behavior['PathPattern'] for behavior in config['CacheBehaviors']][0] == {'Ref': 'StaticPattern'}
+
+
+def behaviors(data):
+    """Return the cache behaviors of the distribution by path pattern, the default one under None."""
+    config = distribution_config(data)
+    found = {None: config['DefaultCacheBehavior']}
+    for behavior in config['CacheBehaviors']:
+        found[behavior['PathPattern']['Ref']] = behavior
+    return found
+
+
+def test_cache_policies_and_ttls(render):
+    data = render(NAME)
+    resources = data['Resources']
+    assert data['Parameters']['StaticTTL']['Default'] == 365 * 24 * 60 * 60
+    assert [data['Parameters'][ttl]['Default'] for ttl in ('MinTTL', 'DefaultTTL', 'MaxTTL')] == \
+        [0, 24 * 60 * 60, 365 * 24 * 60 * 60]
+
+    static = resources['StaticCachePolicy']['Properties']['CachePolicyConfig']
+    assert [static[ttl] for ttl in ('MinTTL', 'DefaultTTL', 'MaxTTL')] == [{'Ref': 'StaticTTL'}] * 3
+    assets = resources['AssetsCachePolicy']['Properties']['CachePolicyConfig']
+    assert [assets[ttl] for ttl in ('MinTTL', 'DefaultTTL', 'MaxTTL')] == \
+        [{'Ref': 'MinTTL'}, {'Ref': 'DefaultTTL'}, {'Ref': 'MaxTTL'}]
+    for policy in (static, assets):
+        key = policy['ParametersInCacheKeyAndForwardedToOrigin']
+        assert key['EnableAcceptEncodingBrotli'] is True and key['EnableAcceptEncodingGzip'] is True
+        assert key['CookiesConfig'] == {'CookieBehavior': 'none'}
+        assert key['QueryStringsConfig'] == {'QueryStringBehavior': 'none'}
+    origin_request = resources['AssetsOriginRequestPolicy']['Properties']['OriginRequestPolicyConfig']
+    assert origin_request['HeadersConfig'] == {'HeaderBehavior': 'whitelist', 'Headers': [
+        'Origin', 'Access-Control-Request-Headers', 'Access-Control-Request-Method']}
+
+    found = behaviors(data)
+    assert set(found) == {'MediaPattern', 'StaticPattern', None}
+    assert found['StaticPattern']['CachePolicyId'] == {'Ref': 'StaticCachePolicy'}
+    assert found['MediaPattern']['CachePolicyId'] == found[None]['CachePolicyId'] == {'Ref': 'AssetsCachePolicy'}
+    for behavior in found.values():
+        assert 'ForwardedValues' not in behavior
+        assert behavior['OriginRequestPolicyId'] == {'Ref': 'AssetsOriginRequestPolicy'}
+        assert behavior['Compress'] is True
+
+
+def test_s3_origins_with_origin_access_control(render):
+    data = render(NAME, {'s3_origins': True})
+    resources = data['Resources']
+    access_control = resources['AssetsOriginAccessControl']['Properties']['OriginAccessControlConfig']
+    assert access_control['OriginAccessControlOriginType'] == 's3'
+    assert access_control['SigningBehavior'] == 'always'
+    assert access_control['SigningProtocol'] == 'sigv4'
+
+    origins = distribution_config(data)['Origins']
+    assert len(origins) == 2
+    for origin in origins:
+        assert origin['OriginAccessControlId'] == {'Fn::GetAtt': ['AssetsOriginAccessControl', 'Id']}
+        assert origin['S3OriginConfig'] == {'OriginAccessIdentity': ''}
+        assert 'CustomOriginConfig' not in origin
+
+    distribution_arn = {'Fn::Sub': ['arn:${AWS::Partition}:cloudfront::${AWS::AccountId}:distribution/${distribution}',
+                                    {'distribution': {'Ref': 'Distribution'}}]}
+    for bucket in ('Static', 'Media'):
+        policy = resources['{}BucketPolicy'.format(bucket)]['Properties']
+        name = {'Fn::Select': [0, {'Fn::Split': ['.s3.', {'Ref': '{}Domain'.format(bucket)}]}]}
+        assert policy['Bucket'] == name
+        statement, = policy['PolicyDocument']['Statement']
+        assert statement['Principal'] == {'Service': 'cloudfront.amazonaws.com'}
+        assert statement['Action'] == ['s3:GetObject']
+        assert statement['Resource'] == [{'Fn::Sub': ['arn:${AWS::Partition}:s3:::${bucket}/*', {'bucket': name}]}]
+        assert statement['Condition'] == {'StringEquals': {'AWS:SourceArn': distribution_arn}}
+
+
+def test_custom_origins_and_origin_shield(render):
+    data = render(NAME)
+    assert not [title for title in data['Resources'] if 'OriginAccessControl' in title or 'BucketPolicy' in title]
+    for origin, bucket in zip(distribution_config(data)['Origins'], ('Static', 'Media')):
+        assert origin['CustomOriginConfig'] == {'OriginProtocolPolicy': 'https-only'}
+        assert 'S3OriginConfig' not in origin
+        shield = '{}OriginShield'.format(bucket)
+        assert origin['OriginShield'] == {'Fn::If': [
+            shield + 'Enabled', {'Enabled': True, 'OriginShieldRegion': {'Ref': shield}}, {'Ref': 'AWS::NoValue'}]}
+        assert data['Conditions'][shield + 'Enabled'] == {'Fn::Not': [{'Fn::Equals': [{'Ref': shield}, '']}]}
+        assert data['Parameters'][shield]['Default'] == ''
+        assert 'us-east-1' in data['Parameters'][shield]['AllowedValues']
+
+
+def test_ipv6_http_version_and_price_class(render):
+    data = render(NAME)
+    parameters = data['Parameters']
+    assert parameters['HttpVersion']['Default'] == 'http2and3'
+    assert parameters['PriceClass']['AllowedValues'] == ['PriceClass_100', 'PriceClass_200', 'PriceClass_All']
+    assert parameters['IPv6']['Default'] == 'true'
+
+    config = distribution_config(data)
+    assert config['HttpVersion'] == {'Ref': 'HttpVersion'}
+    assert config['PriceClass'] == {'Ref': 'PriceClass'}
+    assert config['IPV6Enabled'] == {'Fn::If': ['IPv6Enabled', True, False]}
+    assert data['Conditions']['IPv6Enabled'] == {'Fn::Equals': [{'Ref': 'IPv6'}, 'true']}
+
+    alias = {'HostedZoneId': 'Z2FDTNDATAQYW2', 'DNSName': {'Fn::GetAtt': ['Distribution', 'DomainName']}}
+    a, aaaa = data['Resources']['RecordSetGroup']['Properties']['RecordSets']
+    assert a == {'Name': {'Ref': 'Domain'}, 'Type': 'A', 'AliasTarget': alias}
+    assert aaaa == {'Fn::If': ['IPv6Enabled', {'Name': {'Ref': 'Domain'}, 'Type': 'AAAA', 'AliasTarget': alias},
+                               {'Ref': 'AWS::NoValue'}]}
+
+
+def test_observability(render):
+    data = render(NAME, {'access_logs': True, 'realtime_logs': True, 'additional_metrics': True, 'alarms': True})
+    resources = data['Resources']
+    config = distribution_config(data)
+
+    assert config['Logging'] == {'Bucket': {'Fn::GetAtt': ['AccessLogBucket', 'DomainName']}, 'IncludeCookies': False,
+                                 'Prefix': {'Ref': 'AccessLogPrefix'}}
+    bucket = resources['AccessLogBucket']
+    assert bucket['DeletionPolicy'] == 'Retain'
+    # CloudFront writes standard logs through ACLs
+    assert bucket['Properties']['OwnershipControls'] == {'Rules': [{'ObjectOwnership': 'BucketOwnerPreferred'}]}
+    assert bucket['Properties']['LifecycleConfiguration']['Rules'][0]['ExpirationInDays'] == \
+        {'Ref': 'AccessLogRetention'}
+
+    log_config = resources['RealtimeLogConfig']['Properties']
+    assert log_config['SamplingRate'] == {'Ref': 'RealtimeLogSamplingRate'}
+    assert log_config['EndPoints'] == [{'StreamType': 'Kinesis', 'KinesisStreamConfig': {
+        'RoleArn': {'Fn::GetAtt': ['RealtimeLogRole', 'Arn']},
+        'StreamArn': {'Fn::GetAtt': ['RealtimeLogStream', 'Arn']}}}]
+    assert 'time-to-first-byte' in log_config['Fields']
+    statement, = resources['RealtimeLogRole']['Properties']['Policies'][0]['PolicyDocument']['Statement']
+    assert statement['Resource'] == [{'Fn::GetAtt': ['RealtimeLogStream', 'Arn']}]
+    for behavior in behaviors(data).values():
+        assert behavior['RealtimeLogConfigArn'] == {'Ref': 'RealtimeLogConfig'}
+
+    subscription = resources['MonitoringSubscription']['Properties']
+    assert subscription['DistributionId'] == {'Ref': 'Distribution'}
+    assert subscription['MonitoringSubscription'] == \
+        {'RealtimeMetricsSubscriptionConfig': {'RealtimeMetricsSubscriptionStatus': 'Enabled'}}
+
+    assert resources['DistributionNotifications']['Properties']['Subscription'] == \
+        [{'Endpoint': {'Ref': 'Email'}, 'Protocol': 'email'}]
+    for metric in ('CacheHitRate', 'OriginLatency', '5xxErrorRate'):
+        alarm = resources['Distribution{}Alarm'.format(metric)]['Properties']
+        assert alarm['MetricName'] == metric
+        assert alarm['Namespace'] == 'AWS/CloudFront'
+        assert alarm['Dimensions'] == [{'Name': 'DistributionId', 'Value': {'Ref': 'Distribution'}},
+                                       {'Name': 'Region', 'Value': 'Global'}]
+        assert alarm['Threshold'] == {'Ref': 'Distribution{}Threshold'.format(metric)}
+        assert alarm['AlarmActions'] == alarm['OKActions'] == [{'Ref': 'DistributionNotifications'}]
+    assert resources['DistributionCacheHitRateAlarm']['Properties']['ComparisonOperator'] == 'LessThanThreshold'
+
+    assertion, = data['Rules']['DistributionMonitoringRegion']['Assertions']
+    assert assertion['Assert'] == {'Fn::Equals': [{'Ref': 'AWS::Region'}, 'us-east-1']}
+
+
+def test_monitoring_region_rule_only_with_metrics_or_alarms(render):
+    assert 'Rules' not in render(NAME, {'access_logs': True, 'realtime_logs': True})
+    assert 'DistributionMonitoringRegion' in render(NAME, {'additional_metrics': True})['Rules']
+    assert 'DistributionMonitoringRegion' in render(NAME, {'alarms': True})['Rules']
+
+
+def test_no_observability_by_default(render):
+    data = render(NAME)
+    assert 'Logging' not in distribution_config(data)
+    assert not [title for title in data['Resources']
+                if title.startswith(('AccessLog', 'RealtimeLog', 'MonitoringSubscription', 'DistributionNotif'))]
+    assert all('RealtimeLogConfigArn' not in behavior for behavior in behaviors(data).values())
@@ -0,0 +1,48 @@
+import pytest
+
+import rds_catalog
+
+
+@pytest.mark.parametrize('family, expected', [
+    ('postgres16', ('postgres', '16')),
+    ('mysql8.0', ('mysql', '8.0')),
+    ('mariadb10.11', ('mariadb', '10.11')),
+])
+def test_parse_family(family, expected):
+    assert rds_catalog.parse_family(family) == expected
+
+
+@pytest.mark.parametrize('family', ['postgres', 'oracle-ee19', 'aurora-postgresql16', '16'])
+def test_parse_family_without_preset(family):
+    with pytest.raises(ValueError, match='no tuning preset'):
+        rds_catalog.parse_family(family)
+
+
+def test_tuning_table_covers_every_instance_class():
+    for engine in rds_catalog.TUNING_PRESETS:
+        table = rds_catalog.tuning_table(engine)
+        assert list(table) == rds_catalog.INSTANCE_CLASSES
+        assert len({tuple(settings) for settings in table.values()}) == 1
+
+
+def test_tuning_table_postgres_sizes_memory_in_pages_and_kb():
+    settings = rds_catalog.tuning_table('postgres', ['db.r6g.large'])['db.r6g.large']
+    memory = 16 * rds_catalog.GIB
+    assert settings['shared_buffers'] == memory // 4 // 8192
+    assert settings['effective_cache_size'] == memory * 3 // 4 // 8192
+    assert settings['maintenance_work_mem'] == memory // 16 // 1024
+    assert settings['max_connections'] == memory // 9531392
+
+
+def test_tuning_table_grows_with_the_instance_class():
+    classes = ['db.t3.micro', 'db.r6g.large', 'db.r6g.16xlarge']
+    for engine, parameter in (('postgres', 'shared_buffers'), ('mysql', 'innodb_buffer_pool_size')):
+        values = [settings[parameter] for settings in rds_catalog.tuning_table(engine, classes).values()]
+        assert values == sorted(values) and len(set(values)) == len(values)
+
+
+def test_tuning_table_mysql_small_classes():
+    settings = rds_catalog.tuning_table('mysql', ['db.t3.micro'])['db.t3.micro']
+    assert settings['innodb_buffer_pool_size'] == rds_catalog.GIB // 2
+    assert settings['innodb_buffer_pool_instances'] == 1
+    assert settings['max_connections'] >= 20
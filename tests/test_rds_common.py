@@ -0,0 +1,62 @@
+import pytest
+from troposphere import Template
+
+import rds_common
+
+IPV4 = ['10.{}.{}.0/24'.format(i // 256, i % 256) for i in range(150)]
+IPV6 = ['2600:1f00:{:x}::/48'.format(i) for i in range(70)]
+
+
+def test_rule_digest_is_stable():
+    assert rds_common.rule_digest('10.0.0.0/24') == rds_common.rule_digest('10.0.0.0/24')
+    assert rds_common.rule_digest('10.0.0.0/24') != rds_common.rule_digest('10.0.1.0/24')
+    assert len(rds_common.rule_digest('2600:1f00::/40')) == 12
+    assert set(rds_common.rule_digest('10.0.0.0/24')) <= set('0123456789abcdef')
+
+
+def test_shard_cidrs_counts_each_family_against_its_quota():
+    shards = rds_common.shard_cidrs(IPV4 + IPV6, rules_per_group=60)
+    assert len(shards) == 3
+    assert [cidr for shard in shards for cidr in shard if not rds_common.is_ipv6(cidr)] == IPV4
+    assert [cidr for shard in shards for cidr in shard if rds_common.is_ipv6(cidr)] == IPV6
+    for shard in shards:
+        assert sum(not rds_common.is_ipv6(c) for c in shard) <= 60
+        assert sum(rds_common.is_ipv6(c) for c in shard) <= 60
+
+
+def test_shard_cidrs_without_cidrs():
+    assert rds_common.shard_cidrs([]) == [[]]
+
+
+def test_bucket_cidrs_places_blocks_by_digest():
+    buckets = rds_common.bucket_cidrs(IPV4 + IPV6, rules_per_group=60)
+    assert sorted(c for bucket in buckets for c in bucket) == sorted(IPV4 + IPV6)
+    for index, bucket in enumerate(buckets):
+        for cidr in bucket:
+            assert int(rds_common.rule_digest(cidr), 16) % len(buckets) == index
+        assert sum(not rds_common.is_ipv6(c) for c in bucket) <= 60
+        assert sum(rds_common.is_ipv6(c) for c in bucket) <= 60
+
+
+def test_bucket_cidrs_keeps_blocks_in_place_when_others_change():
+    before = rds_common.bucket_cidrs(IPV4, count=4)
+    after = rds_common.bucket_cidrs(IPV4[10:] + ['192.168.0.0/24'], count=4)
+    for old, new in zip(before, after):
+        assert set(old) - set(IPV4[:10]) <= set(new)
+
+
+def test_bucket_cidrs_over_the_quota_of_count_groups():
+    with pytest.raises(ValueError, match='do not fit in 2 security groups'):
+        rds_common.bucket_cidrs(IPV4, rules_per_group=60, count=2)
+
+
+def test_database_parameters_pin_the_tuning_engine():
+    template = Template()
+    database = rds_common.add_database_parameters(template, tuning='mysql8.0')
+    assert database.engine.properties['Default'] == 'mysql'
+    assert database.engine.properties['AllowedValues'] == ['mysql']
+
+
+def test_database_parameters_reject_aurora_with_tuning():
+    with pytest.raises(ValueError, match='do not apply to Aurora'):
+        rds_common.add_database_parameters(Template(), aurora=True, tuning='postgres16')
@@ -0,0 +1,177 @@
+import pytest
+from troposphere import Template
+
+import rds_common
+
+NAME = 'rds-template'
+
+SECRET_PASSWORD = {'Fn::Sub': '{{resolve:secretsmanager:${DatabaseSecret}:SecretString:password}}'}
+
+
+def parameter_group_titles(data):
+    groups = data['Metadata']['AWS::CloudFormation::Interface']['ParameterGroups']
+    return [title for group in groups for title in group['Parameters']]
+
+
+def test_master_password_parameter_without_proxy(render):
+    data = render(NAME)
+    assert data['Parameters']['DatabaseMasterPassword']['NoEcho'] is True
+    assert data['Resources']['Database']['Properties']['MasterUserPassword'] == {'Ref': 'DatabaseMasterPassword'}
+    assert 'DatabaseSecret' not in data['Resources']
+    assert 'DatabaseMasterPassword' in parameter_group_titles(data)
+
+
+def test_proxy_generates_the_master_password_into_the_secret(render):
+    data = render(NAME, {'proxy': True})
+    resources = data['Resources']
+    assert 'DatabaseMasterPassword' not in data['Parameters']
+    assert 'DatabaseMasterPassword' not in parameter_group_titles(data)
+    assert set(parameter_group_titles(data)) == set(data['Parameters'])
+
+    generate = resources['DatabaseSecret']['Properties']['GenerateSecretString']
+    assert 'SecretString' not in resources['DatabaseSecret']['Properties']
+    assert generate['GenerateStringKey'] == 'password'
+    assert generate['SecretStringTemplate'] == {'Fn::Sub': '{"username": "${DatabaseMasterUsername}"}'}
+    assert set('"\\') <= set(generate['ExcludeCharacters'])
+    assert resources['Database']['Properties']['MasterUserPassword'] == SECRET_PASSWORD
+
+    proxy = resources['DatabaseProxy']['Properties']
+    assert proxy['Auth'] == [{'AuthScheme': 'SECRETS', 'IAMAuth': 'DISABLED', 'SecretArn': {'Ref': 'DatabaseSecret'}}]
+    assert proxy['EngineFamily'] == {'Fn::FindInMap': ['DatabaseEngineFamily', {'Ref': 'DatabaseEngine'}, 'Family']}
+    assert proxy['RequireTLS'] is True
+    policy = resources['DatabaseProxyRole']['Properties']['Policies'][0]['PolicyDocument']['Statement'][0]
+    assert policy['Resource'] == [{'Ref': 'DatabaseSecret'}]
+
+    port = {'Fn::FindInMap': ['DatabaseEngineFamily', {'Ref': 'DatabaseEngine'}, 'Port']}
+    for title in ('DatabaseProxySecurityGroupIngress', 'DatabaseProxySecurityGroupEgress'):
+        assert resources[title]['Properties']['FromPort'] == port
+        assert resources[title]['Properties']['ToPort'] == port
+    assert data['Mappings']['DatabaseEngineFamily']['postgres'] == {'Family': 'POSTGRESQL', 'Port': '5432'}
+    assert data['Mappings']['DatabaseEngineFamily']['sqlserver-ex'] == {'Family': 'SQLSERVER', 'Port': '1433'}
+    engines = data['Rules']['DatabaseProxyEngine']['Assertions'][0]['Assert']['Fn::Contains'][0]
+    assert not [engine for engine in engines if engine.startswith('oracle')]
+
+    targets = resources['DatabaseProxyTargetGroup']['Properties']
+    assert targets['DBInstanceIdentifiers'] == [{'Ref': 'Database'}]
+    assert data['Outputs']['DatabaseProxyEndpoint']['Value'] == {'Fn::GetAtt': ['DatabaseProxy', 'Endpoint']}
+
+
+def test_proxy_in_front_of_an_aurora_cluster(render):
+    data = render(NAME, {'proxy': True, 'aurora': True})
+    resources = data['Resources']
+    assert resources['DatabaseCluster']['Properties']['MasterUserPassword'] == SECRET_PASSWORD
+    assert 'MasterUserPassword' not in resources['Database']['Properties']
+    assert resources['DatabaseProxyTargetGroup']['Properties']['DBClusterIdentifiers'] == \
+        [{'Ref': 'DatabaseCluster'}]
+
+
+def test_proxy_needs_the_database_secret():
+    template = Template()
+    database = rds_common.add_database_parameters(template)
+    with pytest.raises(ValueError, match='database secret'):
+        rds_common.add_database_proxy(template, database, None, None, None)
+
+
+def test_monitoring_resources(render):
+    data = render(NAME, {'performance_insights': True, 'enhanced_monitoring': True, 'alarms': True})
+    resources = data['Resources']
+    database = resources['Database']['Properties']
+    assert database['EnablePerformanceInsights'] is True
+    assert database['PerformanceInsightsRetentionPeriod'] == {'Ref': 'DatabasePerformanceInsightsRetention'}
+    assert database['MonitoringInterval'] == {'Ref': 'DatabaseMonitoringInterval'}
+    assert database['MonitoringRoleArn'] == {'Fn::GetAtt': ['DatabaseMonitoringRole', 'Arn']}
+    role = resources['DatabaseMonitoringRole']['Properties']
+    assert role['AssumeRolePolicyDocument']['Statement'][0]['Principal'] == \
+        {'Service': 'monitoring.rds.amazonaws.com'}
+
+    topic = resources['DatabaseNotifications']['Properties']
+    assert topic['Subscription'] == [{'Endpoint': {'Ref': 'DatabaseAlarmEmail'}, 'Protocol': 'email'}]
+    alarms = {title: resource['Properties'] for title, resource in resources.items()
+              if resource['Type'] == 'AWS::CloudWatch::Alarm'}
+    assert sorted(alarms) == sorted('Database{}Alarm'.format(metric) for metric in rds_common.DATABASE_ALARMS)
+    for metric, (comparison, threshold, _) in rds_common.DATABASE_ALARMS.items():
+        alarm = alarms['Database{}Alarm'.format(metric)]
+        assert alarm['ComparisonOperator'] == comparison
+        assert alarm['Threshold'] == {'Ref': 'Database{}Threshold'.format(metric)}
+        assert data['Parameters']['Database{}Threshold'.format(metric)]['Default'] == threshold
+        assert alarm['Dimensions'] == [{'Name': 'DBInstanceIdentifier', 'Value': {'Ref': 'Database'}}]
+        assert alarm['AlarmActions'] == alarm['OKActions'] == [{'Ref': 'DatabaseNotifications'}]
+
+
+def test_performance_insights_rejects_previous_generation_classes(render):
+    data = render(NAME, {'performance_insights': True})
+    assertion = data['Rules']['DatabasePerformanceInsightsInstanceType']['Assertions'][0]['Assert']
+    classes, instance_class = assertion['Fn::Not'][0]['Fn::Contains']
+    assert instance_class == {'Ref': 'DatabaseInstanceType'}
+    assert data['Parameters']['DatabaseInstanceType']['Default'] in classes
+    assert {'db.t1.micro', 'db.t2.micro', 'db.m1.small', 'db.m2.xlarge', 'db.m3.medium'} <= set(classes)
+    assert not {'db.t3.micro', 'db.m4.large', 'db.r3.large', 'db.m5.large'} & set(classes)
+
+    assert 'DatabasePerformanceInsightsInstanceType' not in render(NAME, {'enhanced_monitoring': True}).get('Rules', {})
+    # None of the Aurora classes lacks Performance Insights
+    assert 'Rules' not in render(NAME, {'performance_insights': True, 'aurora': True})
+
+
+def evaluate(expression, values):
+    """Evaluate a rule condition or assertion for parameter values, given as strings."""
+    if not isinstance(expression, dict):
+        return expression
+    (function, arguments), = expression.items()
+    if function == 'Ref':
+        return values[arguments]
+    arguments = [evaluate(argument, values) for argument in arguments]
+    if function == 'Fn::Equals':
+        return str(arguments[0]) == str(arguments[1])
+    if function == 'Fn::Not':
+        return not arguments[0]
+    if function == 'Fn::Or':
+        return any(arguments)
+    if function == 'Fn::And':
+        return all(arguments)
+    if function == 'Fn::Contains':
+        return arguments[1] in arguments[0]
+    raise ValueError('cannot evaluate {}'.format(function))
+
+
+def failed_rules(data, **values):
+    """Return the rules failing when the parameters take values, the defaults otherwise."""
+    values = {**{title: str(parameter.get('Default', '')) for title, parameter in data['Parameters'].items()},
+              **{'Database' + name: str(value) for name, value in values.items()}}
+    return sorted(title for title, rule in data['Rules'].items()
+                  if evaluate(rule.get('RuleCondition', True), values) and
+                  not all(evaluate(assertion['Assert'], values) for assertion in rule['Assertions']))
+
+
+@pytest.mark.parametrize('values, failed', [
+    ({}, []),
+    ({'StorageType': 'gp3', 'Iops': 3000, 'StorageThroughput': 500}, []),
+    ({'StorageType': 'io1'}, ['DatabaseProvisionedIops']),
+    ({'StorageType': 'io2', 'Iops': 1000}, []),
+    ({'StorageType': 'gp2'}, []),
+    ({'StorageType': 'gp2', 'Iops': 1000}, ['DatabaseGp2Storage']),
+    ({'StorageType': 'io1', 'Iops': 1000, 'StorageThroughput': 500}, ['DatabaseStorageThroughput']),
+    ({'StorageType': 'gp2', 'Iops': 1000, 'StorageThroughput': 500}, ['DatabaseGp2Storage',
+                                                                      'DatabaseStorageThroughput']),
+])
+def test_storage_rules(render, values, failed):
+    assert failed_rules(render(NAME), **values) == failed
+
+
+def test_storage_properties(render):
+    data = render(NAME)
+    database = data['Resources']['Database']['Properties']
+    assert database['StorageType'] == {'Ref': 'DatabaseStorageType'}
+    assert database['AllocatedStorage'] == {'Ref': 'DatabaseAllocatedStorage'}
+    assert database['Iops'] == {'Fn::If': ['DatabaseHasIops', {'Ref': 'DatabaseIops'}, {'Ref': 'AWS::NoValue'}]}
+    assert database['StorageThroughput'] == \
+        {'Fn::If': ['DatabaseHasStorageThroughput', {'Ref': 'DatabaseStorageThroughput'}, {'Ref': 'AWS::NoValue'}]}
+    assert database['MaxAllocatedStorage'] == \
+        {'Fn::If': ['DatabaseHasStorageAutoscaling', {'Ref': 'DatabaseMaxAllocatedStorage'}, {'Ref': 'AWS::NoValue'}]}
+    assert data['Parameters']['DatabaseStorageType']['Default'] == 'gp3'
+    assert data['Parameters']['DatabaseAllocatedStorage']['Default'] == 20
+
+    # Aurora clusters manage their own storage
+    aurora = render(NAME, {'aurora': True})
+    assert 'DatabaseStorageType' not in aurora['Parameters']
+    assert 'StorageType' not in aurora['Resources']['DatabaseCluster']['Properties']
+
@@ -0,0 +1,63 @@
+import pytest
+
+
+def resources_of_type(data, kind):
+    return {name: resource for name, resource in data['Resources'].items() if resource['Type'] == kind}
+
+
+def test_subnets_endpoints_and_private_database(render):
+    data = render('rds-vpc-template', {
+        'availability_zones': 3,
+        'private_subnets': True,
+        'vpc_endpoints': ['s3', 'secretsmanager'],
+    })
+    resources = data['Resources']
+
+    subnets = resources_of_type(data, 'AWS::EC2::Subnet')
+    assert sorted(subnets) == ['PrivateSubnet1', 'PrivateSubnet2', 'PrivateSubnet3', 'Subnet1', 'Subnet2', 'Subnet3']
+    blocks = [subnet['Properties']['CidrBlock']['Fn::Select'] for subnet in subnets.values()]
+    assert sorted(index for index, _ in blocks) == list(range(6))
+    assert all(cidr['Fn::Cidr'][1] == 6 for _, cidr in blocks)
+    for index in range(3):
+        zone = {'Fn::Select': [index, {'Fn::GetAZs': ''}]}
+        assert resources['Subnet{}'.format(index + 1)]['Properties']['AvailabilityZone'] == zone
+        assert resources['PrivateSubnet{}'.format(index + 1)]['Properties']['AvailabilityZone'] == zone
+        assert resources['PrivateSubnet{}'.format(index + 1)]['Properties']['MapPublicIpOnLaunch'] is False
+
+    # The private route table has no route to the internet gateway
+    routes = resources_of_type(data, 'AWS::EC2::Route')
+    assert [route['Properties']['RouteTableId'] for route in routes.values()] == [{'Ref': 'RouteTable'}]
+    for index in range(1, 4):
+        association = resources['PrivateSubnet{}RouteTableAssociation'.format(index)]['Properties']
+        assert association['RouteTableId'] == {'Ref': 'PrivateRouteTable'}
+
+    gateway = resources['S3Endpoint']['Properties']
+    assert gateway['VpcEndpointType'] == 'Gateway'
+    assert gateway['RouteTableIds'] == [{'Ref': 'RouteTable'}, {'Ref': 'PrivateRouteTable'}]
+    interface = resources['SecretsmanagerEndpoint']['Properties']
+    assert interface['VpcEndpointType'] == 'Interface'
+    assert interface['PrivateDnsEnabled'] is True
+    assert interface['SubnetIds'] == [{'Ref': 'PrivateSubnet{}'.format(index)} for index in range(1, 4)]
+    assert interface['ServiceName'] == {'Fn::Sub': 'com.amazonaws.${AWS::Region}.secretsmanager'}
+
+    subnet_group = resources['DatabaseSubnetGroup']['Properties']
+    assert subnet_group['SubnetIds'] == [{'Ref': 'PrivateSubnet{}'.format(index)} for index in range(1, 4)]
+    assert resources['Database']['Properties']['PubliclyAccessible'] is False
+
+
+def test_public_subnets_by_default(render):
+    data = render('rds-vpc-template')
+    assert sorted(resources_of_type(data, 'AWS::EC2::Subnet')) == ['Subnet1', 'Subnet2']
+    assert not resources_of_type(data, 'AWS::EC2::VPCEndpoint')
+    assert data['Resources']['Database']['Properties']['PubliclyAccessible'] is True
+
+
+def test_endpoints_without_private_subnets_use_the_public_ones(render):
+    data = render('rds-vpc-template', {'vpc_endpoints': ['dynamodb', 'logs']})
+    assert data['Resources']['DynamodbEndpoint']['Properties']['RouteTableIds'] == [{'Ref': 'RouteTable'}]
+    assert data['Resources']['LogsEndpoint']['Properties']['SubnetIds'] == [{'Ref': 'Subnet1'}, {'Ref': 'Subnet2'}]
+
+
+def test_availability_zones_below_two(render):
+    with pytest.raises(ValueError, match='at least 2'):
+        render('rds-vpc-template', {'availability_zones': 1})
@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+import registry
+
+FACTORY = '''
+from troposphere import Template, Output
+
+
+def build(config=None):
+    config = config or {}
+    template = Template("""
+Describe the template.
+
+Template: %s
+""")
+    template.add_output(Output('Environment', Value=config.get('environment', 'default')))
+    return template
+'''
+
+MODULE_TEMPLATE = '''
+from troposphere import Template
+
+template = Template("Template: %s")
+'''
+
+
+def write(directory, filename, source):
+    path = directory / filename
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(source)
+    return str(path)
+
+
+def test_discover_reads_the_template_line(tmp_path):
+    write(tmp_path / 'misc', 'b.py', FACTORY % 'registry-b.')
+    write(tmp_path / 'misc', 'a.py', MODULE_TEMPLATE % 'registry-a')
+    write(tmp_path / 'misc', 'helpers.py', 'Template = None\n')
+    write(tmp_path / 'misc' / '__pycache__', 'c.py', FACTORY % 'registry-c')
+    write(tmp_path / 'misc', 'notes.txt', FACTORY % 'registry-d')
+
+    entries = registry.discover(str(tmp_path))
+    assert list(entries) == ['registry-a', 'registry-b']
+    assert entries['registry-b'].path.endswith('b.py')
+    assert 'Describe the template.' in entries['registry-b'].description
+
+
+def test_discover_rejects_duplicate_names(tmp_path):
+    write(tmp_path, 'one.py', FACTORY % 'registry-same')
+    write(tmp_path, 'two.py', FACTORY % 'registry-same')
+    with pytest.raises(ValueError, match='declared by both'):
+        registry.discover(str(tmp_path))
+
+
+def test_find_unknown_template(tmp_path):
+    write(tmp_path, 'one.py', FACTORY % 'registry-one')
+    assert registry.find('registry-one', str(tmp_path)).name == 'registry-one'
+    with pytest.raises(registry.TemplateNotFound):
+        registry.find('registry-two', str(tmp_path))
+
+
+def test_load_template_passes_the_config(tmp_path):
+    path = write(tmp_path, 'factory.py', FACTORY % 'registry-factory')
+    assert registry.load_template(path).to_dict()['Outputs']['Environment']['Value'] == 'default'
+    data = registry.load_template(path, {'environment': 'production'}).to_dict()
+    assert data['Outputs']['Environment']['Value'] == 'production'
+
+
+def test_load_template_of_a_module_level_template(tmp_path):
+    path = write(tmp_path, 'module.py', MODULE_TEMPLATE % 'registry-module')
+    assert registry.load_template(path, {'ignored': True}).to_dict()['Description'] == 'Template: registry-module'
+
+
+def test_every_template_under_src_is_registered():
+    src = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+    names = list(registry.discover(src))
+    assert {'rds-template', 'rds-cidrs-template', 'rds-vpc-template', 'lambda-django-distribution'} <= set(names)
@@ -0,0 +1,129 @@
+import pytest
+
+import registry
+import render_matrix
+import template_output
+
+MATRIX = {
+    'templates': ['rds-template', 'rds-cidrs-template', 'rds-vpc-template'],
+    'environments': {
+        'proxy': {'proxy': True, 'read_replicas': 2},
+        'cache': {'cache': True, 'private_subnets': True, 'proxy': True},
+    },
+}
+
+PADDING = 'x' * 400
+
+
+def conditions_used(value):
+    """Names of the conditions value refers to through Condition and Fn::If."""
+    found = set()
+    if isinstance(value, dict):
+        for key, arg in value.items():
+            if key == 'Condition' and isinstance(arg, str):
+                found.add(arg)
+            elif key == 'Fn::If':
+                found.add(arg[0])
+            found |= conditions_used(arg)
+    elif isinstance(value, list):
+        for item in value:
+            found |= conditions_used(item)
+    return found
+
+
+def split_variant(name, config):
+    data = registry.load_template(registry.find(name).path, config).to_dict()
+    parent, children = template_output.split(data, template_output.size(data) // 2, name=name)
+    return data, parent, children
+
+
+@pytest.fixture(params=list(render_matrix.variants(MATRIX)), ids=lambda variant: '-'.join(variant[:2]))
+def variant(request):
+    name, _, _, config = request.param
+    return (name,) + split_variant(name, config)
+
+
+def test_split_variant_nests_every_resource(variant):
+    _, data, parent, children = variant
+    assert len(children) > 1
+    assert sorted(r for child in children for r in child['Resources']) == sorted(data['Resources'])
+    assert set(parent['Outputs']) == set(data['Outputs'])
+
+
+def test_split_variant_stacks_point_at_their_files(variant):
+    name, data, parent, children = variant
+    urls = [stack['Properties']['TemplateURL']['Fn::Sub'] for stack in parent['Resources'].values()]
+    assert urls == ['${{NestedTemplateUrl}}/{}-{}.json'.format(name, index)
+                    for index in range(1, len(children) + 1)]
+
+
+def test_split_variant_passes_lists_joined(variant):
+    _, data, parent, children = variant
+    for stack, child in zip(parent['Resources'].values(), children):
+        for name, value in stack['Properties'].get('Parameters', {}).items():
+            if name not in data['Parameters']:
+                continue
+            assert child['Parameters'][name] == data['Parameters'][name]
+            if template_output._is_list(data['Parameters'][name]):
+                assert value == {'Fn::Join': [',', {'Ref': name}]}
+            else:
+                assert value == {'Ref': name}
+
+
+def test_split_variant_defines_the_conditions_it_uses(variant):
+    _, data, parent, children = variant
+    for child in children:
+        defined = child.get('Conditions', {})
+        used = conditions_used([child['Resources'], child.get('Outputs', {})] + list(defined.values()))
+        assert used <= set(defined)
+        for name, condition in defined.items():
+            assert condition == data['Conditions'].get(name, condition)
+
+
+def test_split_keeps_the_list_type_of_proxy_subnets():
+    data, parent, children = split_variant('rds-template', {'proxy': True})
+    child = next(child for child in children if 'DatabaseProxySubnets' in child.get('Parameters', {}))
+    assert child['Parameters']['DatabaseProxySubnets']['Type'] == 'List<AWS::EC2::Subnet::Id>'
+
+
+def test_split_keeps_the_condition_of_cache_outputs():
+    data, parent, children = split_variant('rds-vpc-template', {'cache': True})
+    outputs = {name: output for child in children for name, output in child.get('Outputs', {}).items()}
+    assert outputs['CacheConfigurationEndPointAddress']['Condition'] == 'CacheClusterMode'
+    assert outputs['CachePrimaryEndPointAddress']['Condition'] == 'CacheSingleShard'
+    assert outputs['CacheReaderEndPointAddress']['Condition'] == 'CacheSingleShard'
+    assert parent['Outputs']['CacheConfigurationEndpoint']['Condition'] == 'CacheClusterMode'
+
+
+def test_split_exports_under_the_conditions_of_its_consumers():
+    queue = {
+        'Type': 'AWS::SQS::Queue',
+        'Properties': {
+            'QueueName': {'Fn::GetAtt': ['Topic', 'TopicName']},
+            'Tags': [{'Key': 'Padding', 'Value': PADDING}],
+        },
+    }
+    data = {
+        'Parameters': {'Queue': {'Type': 'String'}},
+        'Conditions': {
+            'QueueA': {'Fn::Equals': [{'Ref': 'Queue'}, 'a']},
+            'QueueB': {'Fn::Equals': [{'Ref': 'Queue'}, 'b']},
+        },
+        'Resources': {
+            'Topic': {'Type': 'AWS::SNS::Topic', 'Properties': {'TopicName': PADDING}},
+            'QueueA': dict(queue, Condition='QueueA'),
+            'QueueB': dict(queue, Condition='QueueB'),
+        },
+    }
+    parent, children = template_output.split(data, 1700)
+    assert [sorted(child['Resources']) for child in children] == [['Topic'], ['QueueA'], ['QueueB']]
+
+    output = children[0]['Outputs']['TopicTopicName']
+    assert output['Condition'] == 'TopicTopicNameUsed'
+    assert children[0]['Conditions']['TopicTopicNameUsed'] == {
+        'Fn::Or': [{'Condition': 'QueueA'}, {'Condition': 'QueueB'}]
+    }
+    for stack in ('NestedStack2', 'NestedStack3'):
+        assert parent['Resources'][stack]['Properties']['Parameters']['TopicTopicName'] == {'Fn::If': [
+            'TopicTopicNameUsed', {'Fn::GetAtt': ['NestedStack1', 'Outputs.TopicTopicName']}, '',
+        ]}